@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Classscheduler.settings')
+# Route the calendar views to their async versions, see Planmate.async_views
+os.environ.setdefault('PLANMATE_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -41,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack
+    'Planmate.profiling.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,15 +56,23 @@ ROOT_URLCONF = 'Classscheduler.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # The Django backend, timing renders for the request profiling middleware
+        'BACKEND': 'Planmate.profiling.ProfilingDjangoTemplates',
         'DIRS': ['templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Templates are compiled once per process instead of on every render.
+            # The development server's autoreloader clears them when a template changes.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -76,14 +86,55 @@ WSGI_APPLICATION = 'Classscheduler.wsgi.application'
 DATABASES = {
         'default': {
         'ENGINE':   'django.db.backends.postgresql',
-        'NAME':     'postgres',
-        'USER':     'postgres.jcycobkzohrufmonwtko',
-        'PASSWORD': '0954852404',
-        'HOST':     'aws-1-ap-southeast-1.pooler.supabase.com',
-        'PORT':     '5432',
+        'NAME':     os.environ.get('DB_NAME', 'postgres'),
+        'USER':     os.environ.get('DB_USER', 'postgres.jcycobkzohrufmonwtko'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', '0954852404'),
+        'HOST':     os.environ.get('DB_HOST', 'aws-1-ap-southeast-1.pooler.supabase.com'),
+        'PORT':     os.environ.get('DB_PORT', '5432'),
+        # Keep connections open between requests instead of a new TLS handshake per request
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        # Check a kept connection still works before a request uses it
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+}
+
+# The pooler's transaction mode (Supabase port 6543) may run each transaction
+# on a different server connection, so a named cursor cannot outlive the
+# transaction that declared it. .iterator() then fetches rows client side.
+DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = os.environ.get(
+    'DB_POOL_MODE', 'transaction' if DATABASES['default']['PORT'] == '6543' else 'session',
+) == 'transaction'
+
+# A psycopg 3 connection pool in each worker process. Django hands pooled
+# connections out per request, so it replaces CONN_MAX_AGE.
+if int(os.environ.get('DB_POOL_MAX_SIZE', '0')):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '1')),
+        'max_size': int(os.environ['DB_POOL_MAX_SIZE']),
+        # Seconds a request waits for a free connection before failing
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'planmate',
     }
 }
 
+# Share the cache between worker processes when Redis is available
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -135,4 +186,61 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Login/Logout URLs
 LOGIN_REDIRECT_URL = '/dashboard/'
-LOGOUT_REDIRECT_URL = '/login/'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/login/'
+
+# Weekly events without a "repeat until" date repeat for one semester
+PLANMATE_SEMESTER_WEEKS = 18
+
+# Seconds a cached calendar feed fragment is kept
+PLANMATE_FEED_CACHE_TIMEOUT = 3600
+
+# Seconds a cached template fragment (subject lists, event tables) is kept.
+# Their keys carry the subjects' events_version, so edits never show stale HTML.
+PLANMATE_FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('PLANMATE_FRAGMENT_CACHE_TIMEOUT', '3600'))
+
+# Serve the calendar, dashboard and events API with the async views.
+# Classscheduler/asgi.py turns this on, so it only needs setting by hand
+# when another entry point runs under an ASGI server.
+PLANMATE_ASYNC_VIEWS = os.environ.get('PLANMATE_ASYNC_VIEWS', '') == '1'
+
+# Requests slower than this or running at least this many queries are
+# logged with their slowest queries and counted in /metrics
+PLANMATE_SLOW_REQUEST_SECONDS = float(os.environ.get('PLANMATE_SLOW_REQUEST_SECONDS', '0.5'))
+PLANMATE_SLOW_REQUEST_QUERIES = int(os.environ.get('PLANMATE_SLOW_REQUEST_QUERIES', '50'))
+
+# Seconds the timetable generator searches before returning the best found so far
+PLANMATE_SOLVER_TIME_BUDGET = float(os.environ.get('PLANMATE_SOLVER_TIME_BUDGET', '0.5'))
+
+# Locations of events that are not a room, so they never clash with each
+# other. Compared case-insensitively, and blank locations never clash.
+PLANMATE_SHARED_LOCATIONS = ['TBA', 'TBD', 'Online']
+
+# "manage.py send_reminders" reminds students of events starting within
+# this many minutes, by email and, when a URL is set, a JSON webhook
+PLANMATE_REMINDER_LEAD_MINUTES = int(os.environ.get('PLANMATE_REMINDER_LEAD_MINUTES', '60'))
+# Claimed reminders still unsent after this many minutes, e.g. of a crashed
+# tick, are sent by a later tick
+PLANMATE_REMINDER_CLAIM_TIMEOUT_MINUTES = int(os.environ.get('PLANMATE_REMINDER_CLAIM_TIMEOUT_MINUTES', '10'))
+PLANMATE_REMINDER_BACKENDS = ['Planmate.reminders.EmailBackend']
+PLANMATE_REMINDER_WEBHOOK_URL = os.environ.get('PLANMATE_REMINDER_WEBHOOK_URL', '')
+if PLANMATE_REMINDER_WEBHOOK_URL:
+    PLANMATE_REMINDER_BACKENDS.append('Planmate.reminders.WebhookBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'Planmate <noreply@localhost>')
+
+# Open calendars are told about changes over /api/events/stream/ (ASGI only).
+# Messages stay in the process unless Redis carries them between workers.
+PLANMATE_REALTIME_BROKER = 'Planmate.realtime.InMemoryBroker'
+PLANMATE_REALTIME_REDIS_URL = os.environ.get('REDIS_URL', '')
+if PLANMATE_REALTIME_REDIS_URL:
+    PLANMATE_REALTIME_BROKER = 'Planmate.realtime.RedisBroker'
+
+# /api/events/changes/ holds back changes younger than this many seconds, in
+# case a transaction that took an earlier change id has yet to commit. Keep it
+# above the longest request or import that writes changes.
+# "manage.py prune_changes" drops changes older than PLANMATE_CHANGELOG_DAYS.
+PLANMATE_SYNC_SETTLE_SECONDS = float(os.environ.get('PLANMATE_SYNC_SETTLE_SECONDS', '5'))
+PLANMATE_CHANGELOG_DAYS = int(os.environ.get('PLANMATE_CHANGELOG_DAYS', '90'))
+
+# Prometheus scrapes /metrics with "Authorization: Bearer <token>". Staff
+# users can open it in the browser without the token.
+PLANMATE_METRICS_TOKEN = os.environ.get('PLANMATE_METRICS_TOKEN', '')
@@ -1,9 +1,9 @@
 from django.contrib import admin
-from .models import Subject, Event, Student, Teacher
+from .models import Subject, Event, Reminder, Student, Teacher, WaitlistEntry
 
 @admin.register(Subject)
 class SubjectAdmin(admin.ModelAdmin):
-    list_display = ('code', 'name', 'credits', 'semester')
+    list_display = ('code', 'name', 'credits', 'semester', 'enrolled_count', 'capacity')
     list_filter = ('semester',)
     search_fields = ('code', 'name')
 
@@ -21,4 +21,16 @@ class StudentAdmin(admin.ModelAdmin):
 @admin.register(Teacher)
 class TeacherAdmin(admin.ModelAdmin):
     list_display = ('user', 'teacher_id')
-    search_fields = ('user__username', 'user__first_name', 'user__last_name', 'teacher_id')
\ No newline at end of file
+    search_fields = ('user__username', 'user__first_name', 'user__last_name', 'teacher_id')
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'student', 'created_at')
+    list_filter = ('subject',)
+    search_fields = ('subject__code', 'student__student_id', 'student__user__username')
+
+@admin.register(Reminder)
+class ReminderAdmin(admin.ModelAdmin):
+    list_display = ('event', 'start_time', 'user', 'backend', 'sent_at')
+    list_filter = ('backend',)
+    search_fields = ('user__username', 'event__subject__code')
+    raw_id_fields = ('user', 'event')
@@ -0,0 +1,189 @@
+"""JSON create, update and delete of subjects and events, one at a time or in batches.
+
+Data is validated by ``SubjectForm`` and ``EventForm``, with the same rules,
+messages and event conflict checks as the HTML pages. An update only needs
+the fields that change: the others are taken from the stored object before
+the form validates the whole of it.
+
+Only the user who created a subject may change it or its events. A batch is
+a list of operations such as
+
+    {"op": "create", "type": "event", "data": {"subject": "$0", ...}}
+
+applied in order in one transaction, so it either succeeds as a whole or
+changes nothing. ``"$<index>"`` as the subject of an event refers to the
+subject created by an earlier operation of the same batch.
+"""
+from django.db import transaction
+from django.forms.models import model_to_dict
+
+from .changelog import event_record
+from .forms import EventForm, SubjectForm
+from .models import Event, Subject
+from .timetable import get_calendar_subjects
+
+CREATE, UPDATE, DELETE = 'create', 'update', 'delete'
+SUBJECT, EVENT = 'subject', 'event'
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.errors = errors
+        # Position of the failing operation in a batch
+        self.index = None
+
+    def as_json(self):
+        data = {'error': self.message}
+        if self.index is not None:
+            data['index'] = self.index
+        if self.errors:
+            data['errors'] = self.errors
+        return data
+
+
+def subject_record(subject):
+    return {
+        'id': subject.pk,
+        'code': subject.code,
+        'name': subject.name,
+        'description': subject.description,
+        'credits': subject.credits,
+        'semester': subject.semester,
+        'capacity': subject.capacity,
+        'enrolled_count': subject.enrolled_count,
+    }
+
+
+def form_errors(form):
+    return {field: [error['message'] for error in errors] for field, errors in form.errors.get_json_data().items()}
+
+
+def form_data(form_class, data, instance=None):
+    """Return the data for a form, completed from the stored fields of ``instance``"""
+    if not isinstance(data, dict):
+        raise ApiError(400, 'Expected a JSON object of fields.')
+    unknown = sorted(set(data).difference(form_class._meta.fields))
+    if unknown:
+        raise ApiError(400, f'Unknown fields: {", ".join(unknown)}.')
+    if instance is None:
+        return data
+    return {**model_to_dict(instance, fields=form_class._meta.fields), **data}
+
+
+def validate(form):
+    if not form.is_valid():
+        raise ApiError(400, 'Invalid data.', form_errors(form))
+    return form
+
+
+def get_subject(subject_id, user, editing=True):
+    """Return the subject, which the user must own to edit or have on the calendar to read"""
+    subject = Subject.objects.filter(pk=subject_id).first()
+    if subject is None:
+        raise ApiError(404, f'Subject {subject_id} not found.')
+    if subject.created_by_id != user.pk and (
+        editing or not get_calendar_subjects(user).filter(pk=subject.pk).exists()
+    ):
+        raise ApiError(403, f'You do not have permission to {"edit" if editing else "view"} this subject.')
+    return subject
+
+
+def get_event(event_id, user, editing=True):
+    event = Event.objects.select_related('subject').filter(pk=event_id).first()
+    if event is None:
+        raise ApiError(404, f'Event {event_id} not found.')
+    get_subject(event.subject_id, user, editing)
+    return event
+
+
+def create_subject(user, data):
+    subject = validate(SubjectForm(form_data(SubjectForm, data))).save(commit=False)
+    subject.created_by = user
+    subject.save()
+    return subject_record(subject)
+
+
+def update_subject(user, subject_id, data):
+    subject = get_subject(subject_id, user)
+    validate(SubjectForm(form_data(SubjectForm, data, subject), instance=subject)).save()
+    return subject_record(subject)
+
+
+def delete_subject(user, subject_id):
+    get_subject(subject_id, user).delete()
+
+
+def save_event(user, form):
+    validate(form)
+    # The form accepts any subject, but events may only go to the user's own
+    subject = form.cleaned_data['subject']
+    if subject.created_by_id != user.pk:
+        raise ApiError(403, 'You do not have permission to edit this subject.')
+    return event_record(form.save())
+
+
+def create_event(user, data):
+    return save_event(user, EventForm(form_data(EventForm, data)))
+
+
+def update_event(user, event_id, data):
+    event = get_event(event_id, user)
+    return save_event(user, EventForm(form_data(EventForm, data, event), instance=event))
+
+
+def delete_event(user, event_id):
+    get_event(event_id, user).delete()
+
+
+def resolve_reference(value, created_subjects):
+    """Return the id of the subject created by the batch operation ``value`` refers to"""
+    if not (isinstance(value, str) and value.startswith('$')):
+        return value
+    try:
+        return created_subjects[int(value[1:])]
+    except (ValueError, KeyError):
+        raise ApiError(400, f'"{value}" does not refer to a subject created earlier in the batch.')
+
+
+def apply_operation(user, operation, created_subjects):
+    if not isinstance(operation, dict):
+        raise ApiError(400, 'An operation must be a JSON object.')
+    op, kind = operation.get('op'), operation.get('type')
+    if op not in (CREATE, UPDATE, DELETE) or kind not in (SUBJECT, EVENT):
+        raise ApiError(400, 'An operation needs "op" (create, update or delete) and "type" (subject or event).')
+    data = operation.get('data', {})
+    if kind == EVENT and isinstance(data, dict) and 'subject' in data:
+        data = {**data, 'subject': resolve_reference(data['subject'], created_subjects)}
+    if op == CREATE:
+        return (create_subject if kind == SUBJECT else create_event)(user, data)
+
+    object_id = operation.get('id')
+    if type(object_id) is not int:
+        raise ApiError(400, f'"{op}" needs the "id" of the {kind}.')
+    if op == UPDATE:
+        return (update_subject if kind == SUBJECT else update_event)(user, object_id, data)
+    (delete_subject if kind == SUBJECT else delete_event)(user, object_id)
+    return None
+
+
+def apply_batch(user, operations):
+    """Apply the operations in one transaction and return the record of each, None for deletions.
+
+    The first failing operation rolls back the whole batch and raises
+    ``ApiError`` with its ``index``.
+    """
+    results, created_subjects = [], {}
+    with transaction.atomic():
+        for index, operation in enumerate(operations):
+            try:
+                result = apply_operation(user, operation, created_subjects)
+            except ApiError as error:
+                error.index = index
+                raise
+            if operation['op'] == CREATE and operation['type'] == SUBJECT:
+                created_subjects[index] = result['id']
+            results.append(result)
+    return results
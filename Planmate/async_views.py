@@ -0,0 +1,226 @@
+"""Async versions of the calendar views, used when served over ASGI.
+
+They return the same responses as their counterparts in ``views``, but wait
+on the database with the async ORM instead of holding a worker thread, so one
+ASGI worker can serve many calendar fetches while queries are in flight.
+Template rendering, sessions and messages are synchronous in Django and run
+through ``sync_to_async``.
+
+``Planmate.urls`` routes to these views when ``PLANMATE_ASYNC_VIEWS`` is on,
+which ``Classscheduler.asgi`` does by default.
+"""
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import render
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+
+from . import feed_cache, ical, realtime, timetable
+from .models import Event, Student, Subject
+from .recurrence import Occurrence, upcoming, window_filter
+from .streaming import StreamingJsonResponse
+from .views import (
+    FEED_SUBJECT_BATCH, UPCOMING_LIMIT, calendar_etag, calendar_last_modified, event_fragment_rows, event_json,
+    event_stream_url, fragment_timeout, get_calendar_subjects, parse_event_window, parse_subject_filter,
+    serialize_event_fragments, set_calendar_validators, subject_versions, timetable_versions,
+)
+
+atimetable_for = sync_to_async(timetable.timetable_for)
+
+arender = sync_to_async(render)
+
+
+async def get_user(request):
+    user = await request.auser()
+    # Templates and messages read request.user, which would load the user again
+    request.user = user
+    return user
+
+
+@login_required
+async def dashboard(request):
+    user = await get_user(request)
+    subjects = Subject.objects.filter(created_by=user)
+
+    # Get upcoming events of the user's calendar, from the timetable when it reaches that far
+    now = timezone.now()
+    user_timetable = await atimetable_for(user, now, now, now=now)
+    events = []
+    if user_timetable is not None:
+        events = [
+            Occurrence(entry.event, entry.start_time, entry.end_time)
+            async for entry in timetable.entries(user_timetable, now, user_timetable.window_end)
+            .select_related('event__subject')[:UPCOMING_LIMIT]
+        ]
+    if len(events) < UPCOMING_LIMIT:
+        # The next events may lie beyond the timetable, expand the weekly series instead
+        candidates = (
+            Event.objects.filter(subject__in=get_calendar_subjects(user))
+            .filter(window_filter(now)).select_related('subject')
+        )
+        single_events = [
+            event async for event in
+            candidates.filter(repeat_weekly=False).order_by('start_time')[:UPCOMING_LIMIT]
+        ]
+        recurring_events = [event async for event in candidates.filter(repeat_weekly=True)]
+        events = upcoming([*single_events, *recurring_events], now, limit=UPCOMING_LIMIT)
+
+    # Get scheduled subjects for students
+    scheduled_subjects = []
+    student = await Student.objects.filter(user=user).afirst()
+    if student is not None:
+        scheduled_subjects = [
+            subject async for subject in student.scheduled_subjects.select_related('created_by')
+        ]
+
+    subjects = [subject async for subject in subjects]
+    # The subject lists are only rendered when their cached fragments are out of date
+    context = {
+        'upcoming_events': events,
+        'subjects': subjects,
+        'scheduled_subjects': scheduled_subjects,
+        'subject_versions': subject_versions(subjects),
+        'scheduled_versions': subject_versions(scheduled_subjects),
+        'fragment_timeout': fragment_timeout(),
+    }
+    return await arender(request, 'dashboard.html', context)
+
+
+@login_required
+async def calendar_view(request):
+    user = await get_user(request)
+    # Show only events for subjects created by this user or scheduled by this student
+    all_subjects = [
+        subject async for subject in get_calendar_subjects(user)
+        .only('id', 'code', 'name', 'created_by', 'events_version', 'events_changed_at')
+        .order_by('code')
+    ]
+    token = ical.feed_token(user)
+    feed_url = request.build_absolute_uri(reverse('calendar_feed', kwargs={'user_id': user.id, 'token': token}))
+
+    async def build_response():
+        return await arender(request, 'calendar/calendar.html', {
+            'subjects': all_subjects, 'feed_url': feed_url, 'event_stream_url': event_stream_url(),
+            # Events can only be added to the user's own subjects
+            'own_subjects': [subject for subject in all_subjects if subject.created_by_id == user.id],
+        })
+
+    # Pending messages are only shown on a fresh render
+    if await sync_to_async(lambda: len(messages.get_messages(request)))():
+        return await build_response()
+    subjects = [(subject.id, subject.events_version, subject.events_changed_at) for subject in all_subjects]
+    return await aconditional_calendar_response(
+        request, user, subjects, build_response, 'calendar', user.username, token,
+    )
+
+
+@login_required
+async def get_events(request):
+    """API endpoint to get events for calendar"""
+    try:
+        window_start, window_end = parse_event_window(request)
+        subject_id = parse_subject_filter(request)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    user = await get_user(request)
+    calendar_subjects = get_calendar_subjects(user)
+    if subject_id is not None:
+        calendar_subjects = calendar_subjects.filter(pk=subject_id)
+    else:
+        # Windows near the present are read from the user's materialized timetable
+        user_timetable = await atimetable_for(user, window_start, window_end)
+        if user_timetable is not None:
+            async def build_timetable_response():
+                return StreamingJsonResponse(astream_timetable_events(user_timetable, window_start, window_end))
+
+            return await aconditional_calendar_response(
+                request, user, timetable_versions(user_timetable), build_timetable_response,
+                'events', feed_cache.window_key(window_start, window_end),
+            )
+
+    subjects = sorted([
+        row async for row in calendar_subjects.values_list('id', 'events_version', 'events_changed_at')
+    ])
+
+    async def build_response():
+        return StreamingJsonResponse(astream_events(subjects, window_start, window_end))
+
+    return await aconditional_calendar_response(
+        request, user, subjects, build_response,
+        'events', feed_cache.window_key(window_start, window_end),
+    )
+
+
+@login_required
+async def event_stream(request):
+    """Server-Sent Events of the changes to the user's calendar, see ``Planmate.realtime``"""
+    user = await get_user(request)
+    subject_ids = [subject_id async for subject_id in get_calendar_subjects(user).values_list('id', flat=True)]
+    subscription = await realtime.get_broker().subscribe(
+        [realtime.user_channel(user.pk), *map(realtime.subject_channel, subject_ids)]
+    )
+
+    async def on_calendar(subject_id):
+        return await get_calendar_subjects(user).filter(pk=subject_id).aexists()
+
+    response = StreamingHttpResponse(realtime.stream(subscription, on_calendar), content_type='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def aconditional_calendar_response(request, user, subjects, build_response, *extra):
+    """Async version of ``views.conditional_calendar_response`` taking a coroutine function"""
+    etag = calendar_etag(user, subjects, *extra)
+    timestamp = calendar_last_modified(subjects)
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = await build_response()
+    return set_calendar_validators(response, etag, timestamp)
+
+
+async def astream_timetable_events(user_timetable, window_start, window_end):
+    """Async version of ``views.stream_timetable_events``"""
+    async for row in aiterate_rows(timetable.entry_rows(user_timetable, window_start, window_end)):
+        yield event_json(*row)
+
+
+async def aiterate_rows(rows):
+    """Yield the rows of a values_list() queryset, fetched in chunks of 2000"""
+    # aiterator() runs the query of a plain values_list() in the event loop (only named=True rows are
+    # fetched lazily), so fetch slices of the sync iterator instead, whatever the row type
+    rows = rows.iterator(chunk_size=2000)
+    while chunk := await anext_rows(rows):
+        for row in chunk:
+            yield row
+
+
+@sync_to_async
+def anext_rows(rows):
+    return list(islice(rows, 2000))
+
+
+async def astream_events(subjects, window_start, window_end):
+    """Async version of ``views.stream_events``"""
+    for offset in range(0, len(subjects), FEED_SUBJECT_BATCH):
+        batch = subjects[offset:offset + FEED_SUBJECT_BATCH]
+        fragments = await feed_cache.aget_subject_fragments(
+            {subject_id: version for subject_id, version, _ in batch},
+            window_start, window_end,
+            lambda missing: abuild_event_fragments(missing, window_start, window_end),
+        )
+        for subject_id, _, _ in batch:
+            for event in fragments[subject_id]:
+                yield event
+
+
+async def abuild_event_fragments(subject_ids, window_start, window_end):
+    events = [event async for event in aiterate_rows(event_fragment_rows(subject_ids, window_start, window_end))]
+    return serialize_event_fragments(events, window_start, window_end)
@@ -0,0 +1,195 @@
+"""Change log for incremental sync of events by offline and mobile clients.
+
+Every change to an event, a subject or a calendar's set of subjects appends
+a ``Change``. Deletions append one too and are kept as tombstones, so a client
+that was offline learns what to remove. Changes to a subject or its events
+belong to everyone who has the subject, while subjects added to or removed
+from one calendar belong to that user only.
+
+A client pages through the log with the cursor of its last sync and gets
+the current version of the events that changed, the ids of deleted events and
+the subjects that left its calendar, so sync traffic follows churn and not
+timetable size. Without a cursor, or with one older than the pruned log, it
+first gets every event on its calendar as a snapshot and then continues from
+the log position the snapshot started at.
+
+Changes are written in the transaction of the data they describe, so they
+commit or roll back with it. Ids are handed out before transactions commit,
+so a change may become visible after a change with a higher id. Changes
+younger than ``PLANMATE_SYNC_SETTLE_SECONDS`` are held back for such late
+commits. A transaction that commits later than that after writing a change
+can still land behind a cursor handed out meanwhile, so the setting must
+stay above the longest transaction that writes changes.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from .models import Change, Event
+from .timetable import get_calendar_subjects
+
+
+def settle_time():
+    return timedelta(seconds=getattr(settings, 'PLANMATE_SYNC_SETTLE_SECONDS', 5))
+
+
+def keep_days():
+    return getattr(settings, 'PLANMATE_CHANGELOG_DAYS', 90)
+
+
+def record(kind, subject_ids, event_id=None, user_ids=(None,)):
+    """Append a change per subject and user, ``None`` standing for every user of the subject"""
+    Change.objects.bulk_create([
+        Change(kind=kind, subject_id=subject_id, event_id=event_id, user_id=user_id)
+        for subject_id in subject_ids for user_id in user_ids
+    ])
+
+
+def events_saved(events):
+    Change.objects.bulk_create([
+        Change(kind=Change.EVENT_SAVED, subject_id=event.subject_id, event_id=event.pk) for event in events
+    ])
+
+
+def prune(now=None):
+    """Delete changes older than ``PLANMATE_CHANGELOG_DAYS``, always keeping the newest"""
+    cutoff = (now or timezone.now()) - timedelta(days=keep_days())
+    newest = Change.objects.aggregate(newest=Max('id'))['newest']
+    if newest is None:
+        return 0
+    deleted, _ = Change.objects.filter(created_at__lt=cutoff, id__lt=newest).delete()
+    return deleted
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def parse_cursor(cursor):
+    """Return (snapshot position or None, log position) of a cursor.
+
+    ``"<log>"`` continues the log after that change, and ``"s<log>-<event>"``
+    continues a snapshot after that event.
+    """
+    try:
+        if cursor.startswith('s'):
+            log, event = cursor[1:].split('-')
+            return int(event), int(log)
+        return None, int(cursor)
+    except ValueError:
+        raise InvalidCursor(f'Invalid cursor: {cursor}')
+
+
+def event_record(event):
+    """Return an event as stored, with its weekly series unexpanded"""
+    return {
+        'id': event.pk,
+        'subject': event.subject_id,
+        'code': event.subject.code,
+        'name': event.subject.name,
+        'type': event.event_type,
+        'section': event.section,
+        'start': event.start_time.isoformat(),
+        'end': event.end_time.isoformat(),
+        'location': event.location,
+        'notes': event.notes,
+        'repeat_weekly': event.repeat_weekly,
+        'repeat_until': event.repeat_until.isoformat() if event.repeat_until else None,
+    }
+
+
+def snapshot_start(now):
+    """Return the log position a snapshot taken now continues from"""
+    # Changes that have not settled yet are read from the log after the snapshot
+    unsettled = Change.objects.filter(created_at__gte=now - settle_time()).aggregate(first=Min('id'))['first']
+    if unsettled is not None:
+        return unsettled - 1
+    return Change.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+def snapshot_page(subject_ids, after_event, log, limit):
+    events = list(
+        Event.objects.filter(subject__in=subject_ids, id__gt=after_event)
+        .select_related('subject').order_by('id')[:limit + 1]
+    )
+    return {
+        'reset': after_event == 0,
+        'events': [event_record(event) for event in events[:limit]],
+        'deleted': [],
+        'removed_subjects': [],
+        # Once the snapshot is done the log is read from where it started
+        'cursor': f's{log}-{events[limit - 1].pk}' if len(events) > limit else str(log),
+        'has_more': True,
+    }
+
+
+def log_page(user, subject_ids, since, limit, now):
+    changes = list(
+        Change.objects.filter(Q(user__isnull=True, subject_id__in=subject_ids) | Q(user=user))
+        .filter(id__gt=since).order_by('id')[:limit + 1]
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    # The page ends before the first change that has not settled, as one with a lower id may still commit
+    settled = now - settle_time()
+    for index, change in enumerate(changes):
+        if change.created_at >= settled:
+            changes = changes[:index]
+            has_more = False
+            break
+
+    # Only the last change of each event or subject counts
+    saved, deleted, refreshed, removed = set(), set(), set(), set()
+    for change in changes:
+        if change.kind == Change.EVENT_SAVED:
+            deleted.discard(change.event_id)
+            saved.add(change.event_id)
+        elif change.kind == Change.EVENT_DELETED:
+            saved.discard(change.event_id)
+            deleted.add(change.event_id)
+        elif change.kind == Change.SUBJECT_REMOVED:
+            refreshed.discard(change.subject_id)
+            removed.add(change.subject_id)
+        else:
+            removed.discard(change.subject_id)
+            refreshed.add(change.subject_id)
+    # A dropped subject stays when the user created it, and only current subjects are sent
+    removed.difference_update(subject_ids)
+    refreshed.intersection_update(subject_ids)
+
+    events = {}
+    if saved or refreshed:
+        current = Event.objects.filter(Q(id__in=saved) | Q(subject__in=refreshed), subject__in=subject_ids)
+        events = {event.pk: event for event in current.select_related('subject').order_by('id')}
+    # Saved events that are gone by now were deleted or moved out of the calendar
+    deleted.update(saved.difference(events))
+    return {
+        'reset': False,
+        'events': [event_record(event) for event in events.values()],
+        'deleted': sorted(deleted),
+        'removed_subjects': sorted(removed),
+        'cursor': str(changes[-1].pk if changes else since),
+        'has_more': has_more,
+    }
+
+
+def changes_page(user, cursor=None, limit=500, now=None):
+    """Return the page of changes to the user's calendar after ``cursor``, see the module docstring"""
+    now = now or timezone.now()
+    subject_ids = set(get_calendar_subjects(user).values_list('id', flat=True))
+    if cursor is None:
+        after_event, log = 0, None
+    else:
+        after_event, log = parse_cursor(cursor)
+        if after_event is None:
+            oldest = Change.objects.aggregate(oldest=Min('id'))['oldest']
+            # Changes after the cursor were pruned, so start over from a snapshot
+            if oldest is not None and log < oldest - 1:
+                after_event, log = 0, None
+    if after_event is None:
+        return log_page(user, subject_ids, log, limit, now)
+    if log is None:
+        log = snapshot_start(now)
+    return snapshot_page(subject_ids, after_event, log, limit)
@@ -0,0 +1,248 @@
+"""Detection of overlapping event occurrences.
+
+To list conflicting occurrences, weekly series are expanded with the
+recurrence engine, but only inside the span of the events being checked, and
+the occurrences are then compared with a sweep line over intervals sorted by
+start time. The cost is O(n log n + k) for n occurrences and k conflicts
+instead of a comparison of every pair of events. Yes/no checks against a fixed
+timetable use ``SeriesIndex`` and never expand a series at all.
+"""
+from bisect import bisect_left, bisect_right
+from heapq import heappop, heappush
+from math import ceil, floor
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import Q, Value
+from django.db.models.functions import Trim, Upper
+
+from .models import Event
+from .recurrence import WEEK, Occurrence, expand, series_end, window_filter
+
+
+class Conflict(NamedTuple):
+    occurrence: Occurrence  # The occurrence being checked
+    other: Occurrence  # The existing occurrence it overlaps
+
+    def __str__(self):
+        other = self.other
+        return (
+            f"{other.event.subject.code} {other.event.get_event_type_display()} "
+            f"on {other.start_time:%d %b %Y %H:%M}-{other.end_time:%H:%M}"
+        )
+
+
+def describe(conflicts, limit=3):
+    """Return a short human readable list of the conflicting occurrences"""
+    details = ', '.join(str(conflict) for conflict in conflicts[:limit])
+    if len(conflicts) > limit:
+        details += f' and {len(conflicts) - limit} more'
+    return details
+
+
+def span(events):
+    """Return the (start, end) window covering every occurrence of ``events``"""
+    events = list(events)
+    if not events:
+        return None, None
+    start = min(event.start_time for event in events)
+    end = max(series_end(event) + (event.end_time - event.start_time) for event in events)
+    return start, end
+
+
+def find_conflicts(events, others, window_start=None, window_end=None):
+    """Return every overlap between occurrences of ``events`` and of ``others``.
+
+    An event is never reported as conflicting with itself, so an edited event
+    can be checked against a list that still contains its saved version.
+    """
+    intervals = [
+        (occurrence.start_time, side, index, occurrence)
+        for side, group in enumerate((events, others))
+        for index, occurrence in enumerate(expand(group, window_start, window_end))
+    ]
+    intervals.sort(key=lambda item: item[:3])
+
+    # Occurrences of each side that are still running at the sweep position
+    active = ([], [])
+    conflicts = []
+    for start, side, index, occurrence in intervals:
+        other_side = active[1 - side]
+        while other_side and other_side[0][0] <= start:
+            heappop(other_side)
+        for _, _, running in other_side:
+            if running.event.pk is not None and running.event.pk == occurrence.event.pk:
+                continue
+            if side == 0:
+                conflicts.append(Conflict(occurrence, running))
+            else:
+                conflicts.append(Conflict(running, occurrence))
+        heappush(active[side], (occurrence.end_time, index, occurrence))
+    conflicts.sort(key=lambda conflict: conflict.occurrence.start_time)
+    return conflicts
+
+
+class SeriesIndex:
+    """Weekly series indexed by their position within the week.
+
+    Used to test many candidate events against one fixed timetable, e.g. which
+    subjects of a catalog still fit a student's schedule. Each event is kept as
+    a (first start, duration, number of weeks) series, so a candidate is
+    compared only with the series that overlap its time of the week, and each
+    of those comparisons is exact arithmetic on week numbers instead of an
+    expansion of both series.
+    """
+
+    PERIOD = WEEK.total_seconds()
+
+    def __init__(self, events):
+        entries = sorted(self.series(event) for event in events)
+        self.phases = [entry[0] for entry in entries]
+        self.entries = entries
+        self.longest = max((entry[2] for entry in entries), default=0)
+
+    @classmethod
+    def series(cls, event):
+        """Return (phase, first start, duration, occurrence count) in seconds"""
+        start = event.start_time.timestamp()
+        duration = (event.end_time - event.start_time).total_seconds()
+        count = -(-(series_end(event) - event.start_time) // WEEK)
+        return start % cls.PERIOD, start, duration, count
+
+    def candidates(self, phase, duration):
+        """Yield the indexed series that may overlap this time of the week"""
+        if duration + self.longest >= self.PERIOD:
+            yield from self.entries
+            return
+        low, high = phase - self.longest, phase + duration
+        ranges = [(low, high)]
+        if low < 0:
+            ranges = [(low + self.PERIOD, self.PERIOD), (0, high)]
+        elif high > self.PERIOD:
+            ranges = [(low, self.PERIOD), (0, high - self.PERIOD)]
+        for low, high in ranges:
+            yield from self.entries[bisect_left(self.phases, low):bisect_right(self.phases, high)]
+
+    def overlaps(self, event):
+        phase, start, duration, count = self.series(event)
+        for _, other_start, other_duration, other_count in self.candidates(phase, duration):
+            # Week k of the event overlaps week k + shift of the other series
+            offset = start - other_start
+            lowest = floor((offset - other_duration) / self.PERIOD) + 1
+            highest = ceil((offset + duration) / self.PERIOD) - 1
+            for shift in range(lowest, highest + 1):
+                if max(0, -shift) < min(count, other_count - shift):
+                    return True
+        return False
+
+
+def conflicting_subject_ids(busy_events, candidate_events):
+    """Return the subject ids of ``candidate_events`` that overlap ``busy_events``"""
+    index = SeriesIndex(busy_events)
+    subject_ids = set()
+    for event in candidate_events:
+        if event.subject_id not in subject_ids and index.overlaps(event):
+            subject_ids.add(event.subject_id)
+    return subject_ids
+
+
+def shared_locations():
+    """Locations that are not a room, so events there may take the same time"""
+    return getattr(settings, 'PLANMATE_SHARED_LOCATIONS', ['TBA', 'TBD', 'Online'])
+
+
+def is_room(location):
+    location = location.strip().casefold()
+    return bool(location) and location not in {shared.casefold() for shared in shared_locations()}
+
+
+def event_conflicts(event):
+    """Return the conflicts of a new or edited event with other events that
+    belong to the same subject and section or take place in the same room.
+    """
+    window_start, window_end = span([event])
+    conflicting = Q(subject_id=event.subject_id)
+    if event.section:
+        # Other sections are alternatives to this one, so they may take the same time
+        conflicting &= Q(section='') | Q(section=event.section)
+    if is_room(event.location):
+        # Served by event_location_start_idx
+        conflicting |= Q(location_key=Upper(Value(event.location.strip())))
+    others = (
+        Event.objects.alias(location_key=Upper(Trim('location'))).filter(conflicting)
+        .filter(window_filter(window_start, window_end))
+        .select_related('subject')
+    )
+    if event.pk:
+        others = others.exclude(pk=event.pk)
+    return find_conflicts([event], others, window_start, window_end)
+
+
+def scheduled_events(student, subjects, window_start, window_end):
+    """Return the events of the student's other scheduled subjects within the window"""
+    return (
+        Event.objects.filter(subject__in=student.scheduled_subjects.values('id'))
+        .exclude(subject__in=subjects)
+        .filter(window_filter(window_start, window_end))
+    )
+
+
+def schedule_conflicts(student, subjects):
+    """Return the conflicts between ``subjects`` and the student's scheduled subjects"""
+    candidates = list(Event.objects.filter(subject__in=subjects).select_related('subject'))
+    window_start, window_end = span(candidates)
+    if window_start is None:
+        return []
+    scheduled = scheduled_events(student, subjects, window_start, window_end).select_related('subject')
+    return find_conflicts(candidates, scheduled, window_start, window_end)
+
+
+def overlaps_schedule(student, subjects):
+    """Return whether ``subjects`` overlap the student's scheduled subjects, without listing how"""
+    fields = ('subject_id', 'start_time', 'end_time', 'repeat_weekly', 'repeat_until')
+    candidates = list(Event.objects.filter(subject__in=subjects).only(*fields))
+    window_start, window_end = span(candidates)
+    if window_start is None:
+        return False
+    scheduled = scheduled_events(student, subjects, window_start, window_end).only(*fields)
+    return bool(conflicting_subject_ids(scheduled, candidates))
+
+
+def batch_schedule_conflicts(subject_ids, scheduled_ids):
+    """Return ``{subject_id: conflicts}`` of the subjects that cannot join a schedule.
+
+    ``subject_ids`` are taken in order, each checked against the scheduled
+    subjects and the requested subjects accepted before it, so of two
+    requested subjects that overlap each other the first one is kept.
+    """
+    candidates = list(Event.objects.filter(subject__in=subject_ids).select_related('subject'))
+    window_start, window_end = span(candidates)
+    if window_start is None:
+        return {}
+    scheduled = (
+        Event.objects.filter(subject__in=scheduled_ids)
+        .filter(window_filter(window_start, window_end))
+        .select_related('subject')
+    )
+    blocked = {}
+    for conflict in find_conflicts(candidates, scheduled, window_start, window_end):
+        blocked.setdefault(conflict.occurrence.event.subject_id, []).append(conflict)
+    
+    # Every overlap between two requested subjects is reported from both sides
+    between = {}
+    for conflict in find_conflicts(candidates, candidates, window_start, window_end):
+        if conflict.occurrence.event.subject_id != conflict.other.event.subject_id:
+            between.setdefault(conflict.occurrence.event.subject_id, []).append(conflict)
+    accepted = set()
+    for subject_id in subject_ids:
+        if subject_id in blocked:
+            continue
+        clashes = [
+            conflict for conflict in between.get(subject_id, ())
+            if conflict.other.event.subject_id in accepted
+        ]
+        if clashes:
+            blocked[subject_id] = clashes
+        else:
+            accepted.add(subject_id)
+    return blocked
@@ -0,0 +1,246 @@
+"""Seat-limited enrollment with first come first served waitlists.
+
+A seat is taken with one conditional ``UPDATE`` of ``Subject.enrolled_count``
+that only matches while seats are left, so two students can never take the
+last seat however many requests arrive at once. On PostgreSQL the row lock of
+that update is the only lock taken: enrollments in the same subject queue
+behind each other for the length of one insert, while other subjects are not
+touched. The unique constraint of the schedule table rejects a second seat for
+the same student, rolling the seat back with it.
+
+Drops give their seat back with a decrement of the same locked row, so
+``enrolled_count`` is only ever moved by ``F()`` updates under that lock.
+
+Schedule changes send ``m2m_changed`` as ``add()`` and ``remove()`` would, so
+timetables and caches are refreshed by the usual handlers, and the handler
+fills freed seats from the waitlist. Changes made elsewhere, e.g. in the
+admin, are not counted yet, so for them the handler recounts
+``enrolled_count`` from the schedule rows under the subjects' row locks.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed
+
+from .conflicts import batch_schedule_conflicts, describe, overlaps_schedule
+from .models import Student, Subject, WaitlistEntry
+
+Schedule = Student.scheduled_subjects.through
+
+ENROLLED = 'enrolled'
+WAITLISTED = 'waitlisted'
+ALREADY_ENROLLED = 'already_enrolled'
+ALREADY_WAITLISTED = 'already_waitlisted'
+UNENROLLED = 'unenrolled'
+LEFT_WAITLIST = 'left_waitlist'
+NOT_ENROLLED = 'not_enrolled'
+CONFLICT = 'conflict'
+NOT_FOUND = 'not_found'
+
+
+class SubjectFull(Exception):
+    pass
+
+
+class ScheduleChanged(Exception):
+    """Another request changed the same schedule while a batch was applied"""
+
+
+def claim_seat(subject_id):
+    """Take a seat of the subject, returning False when it is full"""
+    has_seat = Q(capacity__isnull=True) | Q(enrolled_count__lt=F('capacity'))
+    return Subject.objects.filter(has_seat, pk=subject_id).update(enrolled_count=F('enrolled_count') + 1) == 1
+
+
+def lock_subjects(subject_ids):
+    """Lock the subject rows in id order, so that concurrent batches cannot deadlock"""
+    return list(Subject.objects.select_for_update().filter(pk__in=subject_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def release_seats(subject_ids):
+    """Give back one seat of each subject"""
+    Subject.objects.filter(pk__in=lock_subjects(subject_ids)).update(enrolled_count=F('enrolled_count') - 1)
+
+
+def recount(subject_ids):
+    """Set ``enrolled_count`` of the subjects from their schedule rows"""
+    counts = (
+        Schedule.objects.filter(subject_id=OuterRef('pk'))
+        .values('subject_id').annotate(count=Count('*')).values('count')
+    )
+    with transaction.atomic():
+        # The count is read after the lock is granted, so it includes seats claimed meanwhile
+        locked = lock_subjects(subject_ids)
+        Subject.objects.filter(pk__in=locked).update(enrolled_count=Coalesce(Subquery(counts), 0))
+
+
+def schedule_changed(student, action, *subjects):
+    # As Student.scheduled_subjects.add() and remove() send it, with the seats already counted
+    m2m_changed.send(
+        sender=Schedule, instance=student, action=action, reverse=False,
+        model=Subject, pk_set={subject.pk for subject in subjects}, using=student._state.db, counted=True,
+    )
+
+
+def take_seat(student, subject):
+    """Schedule the subject for the student if a seat is left.
+
+    Raises ``SubjectFull`` when it is not, and returns ``ALREADY_ENROLLED``
+    when the student already has it.
+    """
+    try:
+        with transaction.atomic():
+            if not claim_seat(subject.pk):
+                raise SubjectFull
+            Schedule.objects.create(student=student, subject=subject)
+            schedule_changed(student, 'post_add', subject)
+    except IntegrityError:
+        return ALREADY_ENROLLED
+    return ENROLLED
+
+
+def enroll(student, subject):
+    """Schedule the subject, or put the student on its waitlist when it is full"""
+    try:
+        return take_seat(student, subject)
+    except SubjectFull:
+        pass
+    if Schedule.objects.filter(student=student, subject=subject).exists():
+        return ALREADY_ENROLLED
+    _, created = WaitlistEntry.objects.get_or_create(student=student, subject=subject)
+    return WAITLISTED if created else ALREADY_WAITLISTED
+
+
+def unenroll(student, subject):
+    """Drop the subject from the schedule, or else from the waitlist"""
+    with transaction.atomic():
+        removed, _ = Schedule.objects.filter(student=student, subject=subject).delete()
+        if removed:
+            release_seats([subject.pk])
+            # The handler promotes the waitlist
+            schedule_changed(student, 'post_remove', subject)
+            return UNENROLLED
+    removed, _ = WaitlistEntry.objects.filter(student=student, subject=subject).delete()
+    return LEFT_WAITLIST if removed else NOT_ENROLLED
+
+
+def promote_waitlist(subject):
+    """Give free seats to waitlisted students in order, returning the promoted students.
+
+    Students whose schedule now overlaps the subject keep their place.
+    """
+    promoted = []
+    waiting = WaitlistEntry.objects.filter(subject=subject).select_related('student').order_by('created_at', 'id')
+    # Usually only the first entries are needed
+    for entry in waiting.iterator(chunk_size=20):
+        if overlaps_schedule(entry.student, [subject]):
+            continue
+        try:
+            result = take_seat(entry.student, subject)
+        except SubjectFull:
+            break
+        entry.delete()
+        if result == ENROLLED:
+            promoted.append(entry.student)
+    return promoted
+
+
+def waitlist_position(student, subject):
+    """Return the 1-based place of the student on the subject's waitlist, or None"""
+    entry = WaitlistEntry.objects.filter(student=student, subject=subject).first()
+    if entry is None:
+        return None
+    ahead = WaitlistEntry.objects.filter(subject=subject).filter(
+        Q(created_at__lt=entry.created_at) | Q(created_at=entry.created_at, id__lt=entry.id)
+    )
+    return ahead.count() + 1
+
+
+def apply_schedule(student, enroll_ids, unenroll_ids):
+    """Enroll in and drop many subjects in one transaction, returning a result per subject.
+
+    Drops are applied first, so a request can swap subjects. Conflicts and
+    seats of the whole set are checked at once, and the queries do not
+    depend on the number of subjects. Raises ``ScheduleChanged`` when a
+    concurrent request scheduled one of the subjects first.
+    """
+    enroll_ids = list(dict.fromkeys(enroll_ids))
+    unenroll_ids = list(dict.fromkeys(unenroll_ids))
+    if set(enroll_ids) & set(unenroll_ids):
+        raise ValueError('A subject cannot be enrolled and unenrolled at once')
+    subjects = Subject.objects.in_bulk(enroll_ids + unenroll_ids)
+    scheduled = set(Schedule.objects.filter(student=student).values_list('subject_id', flat=True))
+    waiting = set(
+        WaitlistEntry.objects.filter(student=student, subject__in=subjects).values_list('subject_id', flat=True)
+    )
+    results = {}
+    
+    removing = [subjects[pk] for pk in unenroll_ids if pk in scheduled]
+    leaving = [pk for pk in unenroll_ids if pk in subjects and pk not in scheduled and pk in waiting]
+    for pk in unenroll_ids:
+        if pk not in subjects:
+            results[pk] = {'status': NOT_FOUND}
+        elif pk in scheduled:
+            results[pk] = {'status': UNENROLLED}
+        else:
+            results[pk] = {'status': LEFT_WAITLIST if pk in waiting else NOT_ENROLLED}
+    
+    remaining = scheduled.difference(subject.pk for subject in removing)
+    wanted = [pk for pk in enroll_ids if pk in subjects and pk not in remaining]
+    conflicts = batch_schedule_conflicts(wanted, remaining)
+    for pk in enroll_ids:
+        if pk not in subjects:
+            results[pk] = {'status': NOT_FOUND}
+        elif pk in remaining:
+            results[pk] = {'status': ALREADY_ENROLLED}
+        elif pk in conflicts:
+            results[pk] = {'status': CONFLICT, 'detail': f'Overlaps {describe(conflicts[pk])}'}
+    accepted = [pk for pk in wanted if pk not in conflicts]
+    
+    try:
+        with transaction.atomic():
+            if removing:
+                # Only the rows still there give a seat back, a concurrent drop may have taken some
+                dropped = set(
+                    Schedule.objects.select_for_update().filter(student=student, subject__in=removing)
+                    .values_list('subject_id', flat=True)
+                )
+                removing = [subject for subject in removing if subject.pk in dropped]
+            if removing:
+                Schedule.objects.filter(student=student, subject__in=removing).delete()
+                release_seats(dropped)
+                # The handler promotes the waitlists
+                schedule_changed(student, 'post_remove', *removing)
+            if leaving:
+                WaitlistEntry.objects.filter(student=student, subject__in=leaving).delete()
+            if accepted:
+                seated = take_seats(student, [subjects[pk] for pk in accepted], waiting)
+                for pk in accepted:
+                    if pk in seated:
+                        results[pk] = {'status': ENROLLED}
+                    else:
+                        results[pk] = {'status': ALREADY_WAITLISTED if pk in waiting else WAITLISTED}
+    except IntegrityError:
+        raise ScheduleChanged
+    return [{'subject': pk, **results[pk]} for pk in unenroll_ids + enroll_ids]
+
+
+def take_seats(student, subjects, waiting):
+    """Schedule the subjects that have seats left and waitlist the others, returning the scheduled ids"""
+    # Locks only these subjects, in id order so that concurrent batches cannot deadlock
+    locked = Subject.objects.select_for_update().filter(pk__in=[subject.pk for subject in subjects]).order_by('pk')
+    seats = {
+        pk: capacity is None or count < capacity
+        for pk, capacity, count in locked.values_list('pk', 'capacity', 'enrolled_count')
+    }
+    seated = [subject for subject in subjects if seats[subject.pk]]
+    full = [subject for subject in subjects if not seats[subject.pk] and subject.pk not in waiting]
+    if seated:
+        Subject.objects.filter(pk__in=[subject.pk for subject in seated]).update(enrolled_count=F('enrolled_count') + 1)
+        Schedule.objects.bulk_create([Schedule(student=student, subject=subject) for subject in seated])
+        if waiting.intersection(subject.pk for subject in seated):
+            WaitlistEntry.objects.filter(student=student, subject__in=seated).delete()
+        schedule_changed(student, 'post_add', *seated)
+    if full:
+        WaitlistEntry.objects.bulk_create([WaitlistEntry(student=student, subject=subject) for subject in full])
+    return {subject.pk for subject in seated}
@@ -0,0 +1,84 @@
+"""Cache for the calendar events feed.
+
+A user's feed for a window is assembled from per-subject fragments: the
+serialized events of one subject inside one window. Fragments are shared by
+every user who has that subject on their calendar.
+
+Fragment keys include ``Subject.events_version``, which the signal handlers in
+``Planmate.signals`` bump in the same transaction as every change to the
+subject or its events. Stale fragments are therefore never read and simply
+expire, and no explicit invalidation is needed.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+KEY_PREFIX = 'planmate'
+
+
+def get_timeout():
+    return getattr(settings, 'PLANMATE_FEED_CACHE_TIMEOUT', 3600)
+
+
+def window_key(window_start, window_end):
+    bounds = [str(int(bound.timestamp())) if bound else '-' for bound in (window_start, window_end)]
+    return '-'.join(bounds)
+
+
+def fragment_key(subject_id, version, window):
+    return f'{KEY_PREFIX}:events:{subject_id}:{version}:{window}'
+
+
+def fragment_keys(subject_versions, window_start, window_end):
+    window = window_key(window_start, window_end)
+    return {
+        fragment_key(subject_id, version, window): subject_id
+        for subject_id, version in subject_versions.items()
+    }
+
+
+def get_subject_fragments(subject_versions, window_start, window_end, build):
+    """Return ``{subject_id: fragment}`` for the window.
+
+    ``subject_versions`` maps subject ids to their ``events_version``.
+    ``build(missing_ids)`` must return the fragments of the subjects that are
+    not cached yet as a dict; they are stored before being returned.
+    """
+    keys = fragment_keys(subject_versions, window_start, window_end)
+    found = cache.get_many(keys)
+    fragments, missing = split_found(subject_versions, keys, found)
+    if missing:
+        with metrics.feed_rebuild_seconds.time():
+            built = build(missing)
+        built = {subject_id: built.get(subject_id, []) for subject_id in missing}
+        cache.set_many(new_entries(keys, built), get_timeout())
+        fragments.update(built)
+    return fragments
+
+
+async def aget_subject_fragments(subject_versions, window_start, window_end, build):
+    """Async version of ``get_subject_fragments`` where ``build`` is a coroutine function"""
+    keys = fragment_keys(subject_versions, window_start, window_end)
+    found = await cache.aget_many(keys)
+    fragments, missing = split_found(subject_versions, keys, found)
+    if missing:
+        with metrics.feed_rebuild_seconds.time():
+            built = await build(missing)
+        built = {subject_id: built.get(subject_id, []) for subject_id in missing}
+        await cache.aset_many(new_entries(keys, built), get_timeout())
+        fragments.update(built)
+    return fragments
+
+
+def split_found(subject_versions, keys, found):
+    """Return the cached fragments and the ids of the subjects to rebuild, counting both"""
+    fragments = {keys[key]: fragment for key, fragment in found.items()}
+    missing = [subject_id for subject_id in subject_versions if subject_id not in fragments]
+    metrics.feed_cache_hits.inc(len(fragments))
+    metrics.feed_cache_misses.inc(len(missing))
+    return fragments, missing
+
+
+def new_entries(keys, built):
+    return {key: built[subject_id] for key, subject_id in keys.items() if subject_id in built}
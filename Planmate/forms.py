@@ -1,30 +1,77 @@
 from django import forms
-from .models import Subject, Event
+from .models import Subject, Event, normalize_code
+from .conflicts import describe, event_conflicts
 
 class SubjectForm(forms.ModelForm):
     class Meta:
         model = Subject
-        fields = ['code', 'name', 'description', 'credits', 'semester']
+        fields = ['code', 'name', 'description', 'credits', 'semester', 'capacity']
         widgets = {
             'description': forms.Textarea(attrs={'rows': 4}),
         }
+    
+    def clean_code(self):
+        # Before the unique check, so codes differing only in case are caught
+        return normalize_code(self.cleaned_data['code'])
+
+def check_event_times(start_time, end_time, repeat_until):
+    """Raise ValidationError unless the times describe a valid event or series"""
+    if start_time and end_time and start_time >= end_time:
+        raise forms.ValidationError("End time must be after start time.")
+
+    if start_time and repeat_until and repeat_until < start_time.date():
+        raise forms.ValidationError("Repeat until must not be before the start date.")
 
 class EventForm(forms.ModelForm):
     class Meta:
         model = Event
-        fields = ['subject', 'event_type', 'start_time', 'end_time', 'location', 'notes', 'repeat_weekly']
+        fields = ['subject', 'event_type', 'section', 'start_time', 'end_time', 'location', 'notes', 'repeat_weekly', 'repeat_until']
         widgets = {
             'start_time': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
             'end_time': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
+            'repeat_until': forms.DateInput(attrs={'type': 'date'}),
             'notes': forms.Textarea(attrs={'rows': 3}),
         }
 
+    def __init__(self, *args, check_conflicts=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.check_conflicts = check_conflicts
+
     def clean(self):
         cleaned_data = super().clean()
-        start_time = cleaned_data.get('start_time')
-        end_time = cleaned_data.get('end_time')
+        check_event_times(
+            cleaned_data.get('start_time'), cleaned_data.get('end_time'), cleaned_data.get('repeat_until')
+        )
+
+        if self.check_conflicts and not self.errors:
+            self.check_schedule_conflicts(cleaned_data)
+
+        return cleaned_data
+
+    def check_schedule_conflicts(self, cleaned_data):
+        """Reject events overlapping another event of the subject or in the same location"""
+        fields = {name: cleaned_data.get(name) for name in self._meta.fields if name in cleaned_data}
+        if 'subject' not in fields:
+            fields['subject_id'] = self.instance.subject_id
+        event = Event(pk=self.instance.pk, **fields)
+        conflicts = event_conflicts(event)
+        if conflicts:
+            raise forms.ValidationError(f"This event overlaps {describe(conflicts)}.")
+
+class EventImportForm(EventForm):
+    """Event columns of a timetable import row, whose subject is given by its code"""
+    class Meta(EventForm.Meta):
+        fields = [name for name in EventForm.Meta.fields if name != 'subject']
+
+class TimetableImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV, JSON array or JSON Lines (.jsonl) file')
 
-        if start_time and end_time and start_time >= end_time:
-            raise forms.ValidationError("End time must be after start time.")
+    def clean_file(self):
+        from .importer import detect_format
 
-        return cleaned_data
\ No newline at end of file
+        upload = self.cleaned_data['file']
+        try:
+            detect_format(upload.name)
+        except ValueError as error:
+            raise forms.ValidationError(str(error))
+        return upload
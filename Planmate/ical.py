@@ -0,0 +1,108 @@
+"""iCalendar (RFC 5545) export of a user's timetable.
+
+Weekly series are written once with an RRULE instead of as expanded copies,
+and the calendar is produced as a stream of small chunks so the whole file is
+never held in memory.
+"""
+from datetime import timezone as dt_timezone
+
+from django.contrib.auth.models import User
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .recurrence import WEEK, series_end
+
+PRODID = '-//Planmate//Timetable//TH'
+TOKEN_SALT = 'Planmate.ical.feed_token'
+UTC_FORMAT = '%Y%m%dT%H%M%SZ'
+
+
+def feed_token(user):
+    """Return the secret token of the user's calendar subscription URL.
+
+    Changing the password invalidates the token, like a password reset link.
+    """
+    return salted_hmac(TOKEN_SALT, f'{user.pk}{user.password}', algorithm='sha256').hexdigest()[:32]
+
+
+def feed_user(user_id, token):
+    """Return the active user a subscription token belongs to, or None"""
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    if user is None or not constant_time_compare(token, feed_token(user)):
+        return None
+    return user
+
+
+def escape_text(value):
+    return (
+        value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n')
+    )
+
+
+def fold(line):
+    """Fold a content line into CRLF-terminated lines of at most 75 octets"""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    start, limit = 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Never split a multi-byte UTF-8 character
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode())
+        start, limit = end, 74  # Continuation lines start with a space
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def utc(value):
+    return value.astimezone(dt_timezone.utc).strftime(UTC_FORMAT)
+
+
+def event_component(event, domain):
+    """Return the VEVENT of one event as text"""
+    subject = event.subject
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:event-{event.pk}@{domain}',
+        # Stable across requests so an unchanged calendar is byte-identical
+        f'DTSTAMP:{utc(subject.events_changed_at)}',
+        f'DTSTART:{utc(event.start_time)}',
+        f'DTEND:{utc(event.end_time)}',
+        f'SUMMARY:{escape_text(f"{subject.code} - {event.get_event_type_display()}")}',
+        f'CATEGORIES:{escape_text(event.get_event_type_display())}',
+    ]
+    if event.repeat_weekly:
+        # The same number of occurrences as the recurrence engine produces
+        count = max(1, -(-(series_end(event) - event.start_time) // WEEK))
+        lines.append(f'RRULE:FREQ=WEEKLY;COUNT={count}')
+    if event.location:
+        lines.append(f'LOCATION:{escape_text(event.location)}')
+    description = subject.name + (f'\n{event.notes}' if event.notes else '')
+    lines.append(f'DESCRIPTION:{escape_text(description)}')
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def calendar_stream(events, name, domain, chunk_size=16 * 1024):
+    """Yield a VCALENDAR containing ``events`` in chunks of about ``chunk_size`` characters"""
+    chunk = [''.join(fold(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_text(name)}',
+    ))]
+    size = len(chunk[0])
+    for event in events:
+        component = event_component(event, domain)
+        chunk.append(component)
+        size += len(component)
+        # Fewer, larger writes than one per event
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    chunk.append(fold('END:VCALENDAR'))
+    yield ''.join(chunk)
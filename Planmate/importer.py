@@ -0,0 +1,236 @@
+"""Bulk import of subjects and events from CSV or JSON files.
+
+Each row describes one event together with the subject it belongs to:
+
+    code, name, description, credits, semester,
+    event_type, start_time, end_time, location, notes, repeat_weekly, repeat_until
+
+Subject columns are only needed the first time a code appears, and a row
+without event columns creates just the subject. Subjects that already exist
+must belong to the importing user.
+
+Rows are read one at a time and validated with the fields and rules of
+``SubjectForm`` and ``EventImportForm``. Events are inserted with
+``bulk_create`` in batches, each in its own transaction, so memory stays flat
+whatever the size of the file. Invalid rows are reported and skipped without
+aborting the import. Imported events are not checked for schedule conflicts.
+"""
+import csv
+import io
+import json
+import os
+import re
+from typing import NamedTuple
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import signals
+from .forms import EventImportForm, SubjectForm, check_event_times
+from .models import Event, Subject, normalize_code
+
+FORMATS = {'.csv': 'csv', '.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+SUBJECT_COLUMNS = ('code', 'name', 'description', 'credits', 'semester')
+EVENT_COLUMNS = ('event_type', 'section', 'start_time', 'end_time', 'location', 'notes', 'repeat_weekly', 'repeat_until')
+CHUNK_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+NOT_OBJECT = 'Not a JSON object.'
+NOT_UTF8 = 'Not valid UTF-8 text, the rest of the file was skipped.'
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f'Unsupported file type "{extension}", use one of {", ".join(FORMATS)}.')
+    return FORMATS[extension]
+
+
+def read_rows(file, file_format):
+    """Yield ``(line, row)`` for every row of a binary file.
+
+    ``row`` is a dict, or the message of why the line could not be read. CSV
+    and JSON Lines files are decoded line by line, so undecodable bytes or
+    malformed CSV or JSON are reported at their line or item. Reading stops
+    there, as the rest of the file cannot be split into rows reliably.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(decode_lines(file))
+        try:
+            for row in reader:
+                yield reader.line_num, row
+        except UnicodeDecodeError:
+            yield reader.line_num + 1, NOT_UTF8
+        except csv.Error as error:
+            yield reader.line_num + 1, f'Malformed CSV ({error}), the rest of the file was skipped.'
+    elif file_format == 'jsonl':
+        line = 0
+        try:
+            for line, content in enumerate(decode_lines(file), 1):
+                if content.strip():
+                    try:
+                        row = json.loads(content)
+                    except ValueError:
+                        row = None
+                    yield line, row if isinstance(row, dict) else NOT_OBJECT
+        except UnicodeDecodeError:
+            yield line + 1, NOT_UTF8
+    else:
+        index = 0
+        try:
+            for index, row in enumerate(iter_json_array(io.TextIOWrapper(file, encoding='utf-8-sig')), 1):
+                yield index, row if isinstance(row, dict) else NOT_OBJECT
+        except UnicodeDecodeError:
+            yield index + 1, NOT_UTF8
+        except ValueError as error:
+            # Truncated or malformed, the rows before it are still imported
+            yield index + 1, f'{str(error).rstrip(".")}, the rest of the file was skipped.'
+
+
+def decode_lines(file):
+    for number, line in enumerate(file):
+        yield line.decode('utf-8-sig' if number == 0 else 'utf-8')
+
+
+def iter_json_array(text):
+    """Yield the items of a top-level JSON array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    buffer = text.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('A JSON file must contain an array of rows.')
+    position = 1
+    finished = False
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            # The next item is incomplete: keep the unread tail and read more
+            if finished:
+                raise ValueError('The JSON file is truncated or malformed.')
+            chunk = text.read(CHUNK_SIZE)
+            finished = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+class RowError(NamedTuple):
+    line: int
+    message: str
+
+    def __str__(self):
+        return f'Line {self.line}: {self.message}'
+
+
+class ImportReport:
+    def __init__(self, max_errors=100):
+        self.rows = 0
+        self.subjects_created = 0
+        self.events_created = 0
+        self.error_count = 0
+        # Only the first errors are kept, so a bad file cannot use unbounded memory
+        self.errors = []
+        self.max_errors = max_errors
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(RowError(line, message))
+
+
+def error_text(error):
+    if hasattr(error, 'error_dict'):
+        return '; '.join(
+            f'{field}: {" ".join(messages)}' for field, messages in error.message_dict.items()
+        )
+    return ' '.join(error.messages)
+
+
+class TimetableImporter:
+    def __init__(self, user, batch_size=2000, max_errors=100):
+        self.user = user
+        self.batch_size = batch_size
+        self.report = ImportReport(max_errors)
+        self.subject_ids = {}
+        self.batch = []
+        # Fields are cleaned with one form's field objects instead of a form per row
+        self.event_fields = EventImportForm(check_conflicts=False).fields
+
+    def run(self, rows):
+        for line, row in rows:
+            self.report.rows += 1
+            if isinstance(row, str):
+                self.report.add_error(line, row)
+                continue
+            try:
+                event = self.build_event(row)
+            except ValidationError as error:
+                self.report.add_error(line, error_text(error))
+                continue
+            if event is not None:
+                self.batch.append(event)
+                if len(self.batch) >= self.batch_size:
+                    self.flush()
+        self.flush()
+        return self.report
+
+    def get_subject_id(self, row):
+        code = normalize_code(str(row.get('code') or ''))
+        if not code:
+            raise ValidationError({'code': ['This field is required.']})
+        if code in self.subject_ids:
+            return self.subject_ids[code]
+
+        existing = Subject.objects.filter(code=code).values_list('id', 'created_by_id').first()
+        if existing:
+            subject_id, owner_id = existing
+            if owner_id != self.user.pk:
+                raise ValidationError(f'Subject {code} belongs to another user.')
+        else:
+            form = SubjectForm({name: row.get(name) for name in SUBJECT_COLUMNS})
+            if not form.is_valid():
+                raise ValidationError(form.errors.as_data())
+            subject = form.save(commit=False)
+            subject.created_by = self.user
+            subject.save()
+            subject_id = subject.pk
+            self.report.subjects_created += 1
+        self.subject_ids[code] = subject_id
+        return subject_id
+
+    def build_event(self, row):
+        """Return an unsaved event for the row, or None for a subject-only row"""
+        subject_id = self.get_subject_id(row)
+        if not any(row.get(name) not in (None, '') for name in EVENT_COLUMNS):
+            return None
+
+        cleaned, errors = {}, {}
+        for name, field in self.event_fields.items():
+            value = row.get(name)
+            try:
+                cleaned[name] = field.clean('' if value is None else value)
+            except ValidationError as error:
+                errors[name] = error.messages
+        if errors:
+            raise ValidationError(errors)
+        check_event_times(cleaned['start_time'], cleaned['end_time'], cleaned['repeat_until'])
+        return Event(subject_id=subject_id, **cleaned)
+
+    def flush(self):
+        if not self.batch:
+            return
+        with transaction.atomic():
+            Event.objects.bulk_create(self.batch)
+            # bulk_create sends no signals
+            signals.events_created(self.batch)
+        self.report.events_created += len(self.batch)
+        self.batch = []
+
+
+def import_timetable(file, user, file_format, batch_size=2000, max_errors=100):
+    """Import a binary CSV or JSON file for ``user`` and return the report"""
+    importer = TimetableImporter(user, batch_size=batch_size, max_errors=max_errors)
+    return importer.run(read_rows(file, file_format))
@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from Planmate.importer import detect_format, import_timetable
+
+
+class Command(BaseCommand):
+    help = 'Import subjects and events from a CSV, JSON or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help='Username that will own the imported subjects')
+        parser.add_argument('--format', choices=['csv', 'json', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--max-errors', type=int, default=100, help='Number of row errors to print')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist.')
+
+        try:
+            file_format = options['format'] or detect_format(options['path'])
+            with open(options['path'], 'rb') as file:
+                report = import_timetable(
+                    file, user, file_format,
+                    batch_size=options['batch_size'], max_errors=options['max_errors'],
+                )
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+
+        for error in report.errors:
+            self.stderr.write(str(error))
+        if report.error_count > len(report.errors):
+            self.stderr.write(f'... and {report.error_count - len(report.errors)} more errors')
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {report.rows} rows: created {report.subjects_created} subjects and '
+            f'{report.events_created} events, skipped {report.error_count} invalid rows'
+        ))
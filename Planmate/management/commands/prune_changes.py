@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Planmate.changelog import keep_days, prune
+
+
+class Command(BaseCommand):
+    help = 'Delete sync change log entries older than PLANMATE_CHANGELOG_DAYS'
+
+    def handle(self, *args, **options):
+        deleted = prune()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} changes older than {keep_days()} days'))
@@ -0,0 +1,125 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from Planmate.models import Event, Student, Subject
+
+
+# Words for subject names, so that search benchmarks see realistic term frequencies
+NAME_LEVELS = ['Introduction to', 'Principles of', 'Advanced', 'Applied', 'Topics in', 'Seminar in']
+NAME_TOPICS = [
+    'Programming', 'Data Structures', 'Algorithms', 'Databases', 'Operating Systems', 'Networks',
+    'Calculus', 'Linear Algebra', 'Statistics', 'Physics', 'Chemistry', 'Biology', 'Economics',
+    'Accounting', 'Marketing', 'Psychology', 'Philosophy', 'Thai Literature', 'English Writing',
+    'Machine Learning', 'Computer Graphics', 'Software Engineering', 'Signal Processing',
+]
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, subjects and events for performance testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--subjects', type=int, default=1000)
+        parser.add_argument('--events', type=int, default=100000)
+        parser.add_argument('--recurring', type=float, default=0.2,
+                            help='Fraction of events that are weekly series')
+        parser.add_argument('--enrollments', type=int, default=5,
+                            help='Subjects scheduled by each student')
+        parser.add_argument('--password', default='benchmark', help='Password of every generated user')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for reproducible data')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--prefix', default='bench', help='Prefix for generated usernames and subject codes')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            # Hashed once, as hashing a password per user would dominate the run
+            password = make_password(options['password'])
+            User.objects.bulk_create(
+                [User(username=f'{prefix}_user{index}', password=password) for index in range(options['users'])],
+                batch_size=batch_size,
+            )
+            # Reload so the primary keys are known on every backend
+            users = list(User.objects.filter(username__startswith=f'{prefix}_user').order_by('id'))
+            Student.objects.bulk_create(
+                [Student(user=user, student_id=f'{prefix}{user.pk}') for user in users],
+                batch_size=batch_size,
+            )
+            subject_ids = self.create_subjects(rng, prefix, users, options['subjects'], batch_size)
+            enrolled = self.create_enrollments(rng, prefix, subject_ids, options['enrollments'], batch_size)
+        self.stdout.write(f'Created {len(users)} users, {len(subject_ids)} subjects and {enrolled} enrollments')
+
+        created = self.create_events(rng, subject_ids, options['events'], options['recurring'], batch_size)
+        self.stdout.write(self.style.SUCCESS(f'Created {created} events'))
+
+    def create_subjects(self, rng, prefix, users, count, batch_size):
+        semesters = ['1/2566', '2/2566', '1/2567', '2/2567', '1/2568']
+        Subject.objects.bulk_create(
+            [
+                Subject(
+                    code=f'{prefix.upper()}{index:06d}',
+                    name=f'{rng.choice(NAME_LEVELS)} {rng.choice(NAME_TOPICS)} {index}',
+                    credits=rng.randint(1, 4),
+                    semester=rng.choice(semesters),
+                    created_by=rng.choice(users),
+                )
+                for index in range(count)
+            ],
+            batch_size=batch_size,
+        )
+        return list(
+            Subject.objects.filter(code__startswith=prefix.upper()).values_list('id', flat=True)
+        )
+
+    def create_enrollments(self, rng, prefix, subject_ids, per_student, batch_size):
+        if not subject_ids or not per_student:
+            return 0
+        Scheduled = Student.scheduled_subjects.through
+        students = Student.objects.filter(user__username__startswith=f'{prefix}_user').values_list('id', flat=True)
+        rows = [
+            Scheduled(student_id=student_id, subject_id=subject_id)
+            for student_id in students
+            for subject_id in rng.sample(subject_ids, min(per_student, len(subject_ids)))
+        ]
+        Scheduled.objects.bulk_create(rows, batch_size=batch_size)
+        return len(rows)
+
+    def create_events(self, rng, subject_ids, count, recurring, batch_size):
+        """Insert events in batches so memory stays flat at millions of rows"""
+        origin = timezone.now() - timedelta(days=3 * 365)
+        event_types = [choice for choice, _ in Event.EVENT_TYPES]
+        created = 0
+        while created < count:
+            size = min(batch_size, count - created)
+            batch = []
+            for _ in range(size):
+                start = origin + timedelta(hours=rng.randrange(6 * 365 * 24))
+                repeat_weekly = rng.random() < recurring
+                # Half of the series end early, the rest run for the default semester
+                repeat_until = None
+                if repeat_weekly and rng.random() < 0.5:
+                    repeat_until = (start + timedelta(weeks=rng.randint(4, 16))).date()
+                batch.append(Event(
+                    subject_id=rng.choice(subject_ids),
+                    event_type=rng.choice(event_types),
+                    start_time=start,
+                    end_time=start + timedelta(hours=rng.randint(1, 3)),
+                    location=f'Room {rng.randint(100, 999)}',
+                    repeat_weekly=repeat_weekly,
+                    repeat_until=repeat_until,
+                ))
+            with transaction.atomic():
+                Event.objects.bulk_create(batch)
+            created += size
+            self.stdout.write(f'  {created}/{count} events', ending='\r')
+        self.stdout.write('')
+        return created
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Planmate.reminders import get_backends, lead_time, run_tick
+
+
+class Command(BaseCommand):
+    help = 'Send reminders of events starting soon to the students who have them in their schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run one tick and exit')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between the starts of two ticks')
+
+    def handle(self, *args, **options):
+        backends = get_backends()
+        self.stdout.write(
+            f'Reminding {lead_time()} ahead through {", ".join(backend.name for backend in backends)}'
+        )
+        while True:
+            started = time.monotonic()
+            report = run_tick(backends=backends)
+            seconds = time.monotonic() - started
+            self.stdout.write(
+                f'{report.occurrences} occurrences: sent {report.sent}, skipped {report.skipped} '
+                f'already sent, {report.failed} failed in {seconds:.1f} s'
+            )
+            if options['once']:
+                return
+            try:
+                time.sleep(max(options['interval'] - seconds, 0))
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,183 @@
+"""In-process counters and timings for Planmate.
+
+Values are kept per worker process and reset on restart. ``render_prometheus``
+exposes every metric defined here in the Prometheus text format.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Every metric in the order it is defined, for render_prometheus
+REGISTRY = []
+
+
+def format_labels(labelnames, labelvalues, **extra):
+    pairs = [*zip(labelnames, labelvalues), *extra.items()]
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    @property
+    def value(self):
+        """The total over all labels"""
+        return sum(self._values.values())
+
+    def get(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def prometheus_lines(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self._values.items()):
+            yield f'{self.name}{format_labels(self.labelnames, labels)} {format_number(value)}'
+
+
+class Timer:
+    """Running count, total and maximum of observed durations in seconds"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.maximum = max(self.maximum, seconds)
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+    def prometheus_lines(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} summary'
+        yield f'{self.name}_count {self.count}'
+        yield f'{self.name}_sum {format_number(self.total)}'
+
+
+class Histogram:
+    """Observations counted in cumulative buckets, per combination of labels"""
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = labelnames
+        # labels -> [count per bucket (the last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+
+    def get(self, labels=()):
+        """Return the ``(count, sum)`` of the observations with these labels"""
+        series = self._series.get(labels)
+        return (sum(series[0]), series[1]) if series else (0, 0)
+
+    def prometheus_lines(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            snapshot = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else format_number(bound)
+                yield f'{self.name}_bucket{format_labels(self.labelnames, labels, le=le)} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labelnames, labels)} {format_number(total)}'
+            yield f'{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}'
+
+
+feed_cache_hits = Counter('planmate_feed_cache_hits_total', 'Subject event fragments served from the cache')
+feed_cache_misses = Counter('planmate_feed_cache_misses_total', 'Subject event fragments rebuilt from the database')
+feed_rebuild_seconds = Timer('planmate_feed_rebuild_seconds', 'Time spent rebuilding missing event fragments')
+
+# Recorded per URL name by Planmate.profiling.RequestProfilingMiddleware
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+request_seconds = Histogram(
+    'planmate_request_duration_seconds', 'Time to produce the whole response', SECONDS_BUCKETS, ('view',),
+)
+request_queries = Histogram(
+    'planmate_request_queries', 'Database queries per request', (0, 1, 2, 5, 10, 20, 50, 100, 200, 500), ('view',),
+)
+request_db_seconds = Histogram(
+    'planmate_request_db_seconds', 'Time spent in database queries per request', SECONDS_BUCKETS, ('view',),
+)
+request_template_seconds = Histogram(
+    'planmate_request_template_seconds', 'Time spent rendering templates per request', SECONDS_BUCKETS, ('view',),
+)
+response_bytes = Histogram(
+    'planmate_response_size_bytes', 'Size of the response body',
+    (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216), ('view',),
+)
+slow_requests = Counter(
+    'planmate_slow_requests_total', 'Requests over the time or query count thresholds', ('view',),
+)
+
+
+def feed_cache_stats():
+    """Return the calendar feed cache metrics as a dict"""
+    hits = feed_cache_hits.value
+    misses = feed_cache_misses.value
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / lookups if lookups else None,
+        'rebuilds': feed_rebuild_seconds.count,
+        'rebuild_seconds_avg': feed_rebuild_seconds.average,
+        'rebuild_seconds_max': feed_rebuild_seconds.maximum,
+    }
+
+
+def render_prometheus():
+    """Return all metrics in the Prometheus text exposition format"""
+    return ''.join(f'{line}\n' for metric in REGISTRY for line in metric.prometheus_lines())
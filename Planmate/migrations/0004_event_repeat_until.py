@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 10:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Planmate', '0003_student_scheduled_subjects_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='repeat_until',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
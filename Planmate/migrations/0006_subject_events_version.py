@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-17 10:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Planmate', '0005_event_subject_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subject',
+            name='events_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='events_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
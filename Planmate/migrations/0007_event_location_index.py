@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 10:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Planmate', '0006_subject_events_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['location', 'start_time'], name='event_location_start_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# The SQLite full-text index is created by Planmate.search.install_search_index
+
+POSTGRESQL_INDEXES = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    # Must match Planmate.search.SEARCH_VECTOR
+    'CREATE INDEX IF NOT EXISTS subject_search_idx ON "Planmate_subject" '
+    "USING GIN (to_tsvector('simple', code || ' ' || name || ' ' || description))",
+    'CREATE INDEX IF NOT EXISTS subject_name_trgm_idx ON "Planmate_subject" USING GIN (name gin_trgm_ops)',
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for statement in POSTGRESQL_INDEXES:
+        schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS subject_search_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS subject_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Planmate', '0008_subject_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-17 11:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_enrollments(apps, schema_editor):
+    Subject = apps.get_model('Planmate', 'Subject')
+    Schedule = apps.get_model('Planmate', 'Student').scheduled_subjects.through
+    counts = (
+        Schedule.objects.filter(subject_id=OuterRef('pk'))
+        .values('subject_id').annotate(count=Count('*')).values('count')
+    )
+    Subject.objects.update(enrolled_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Planmate', '0010_timetable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subject',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='enrolled_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='Planmate.student')),
+                ('subject', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='Planmate.subject')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['subject', 'created_at', 'id'], name='waitlist_subject_order_idx')],
+                'constraints': [models.UniqueConstraint(fields=('student', 'subject'), name='waitlist_student_subject_unique')],
+            },
+        ),
+        migrations.RunPython(count_enrollments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 11:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Planmate', '0011_enrollment_capacity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='section',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Planmate', '0013_reminder'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('event_saved', 'Event saved'), ('event_deleted', 'Event deleted'), ('subject_changed', 'Subject changed'), ('subject_added', 'Subject added to a calendar'), ('subject_removed', 'Subject removed from a calendar')], max_length=20)),
+                ('subject_id', models.BigIntegerField()),
+                ('event_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['subject_id', 'id'], name='change_subject_idx'), models.Index(fields=['user', 'id'], name='change_user_idx'), models.Index(fields=['created_at'], name='change_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+MAX_LENGTH = 20  # Of Subject.code
+
+
+def unique_code(code, codes):
+    """Return ``code``, or when taken the first free ``<code>-2``, ``<code>-3``, ..."""
+    candidate, suffix = code, 1
+    while candidate in codes:
+        suffix += 1
+        candidate = f'{code[:MAX_LENGTH - len(str(suffix)) - 1]}-{suffix}'
+    return candidate
+
+
+def normalize_codes(apps, schema_editor):
+    # Must match Planmate.models.normalize_code
+    Subject = apps.get_model('Planmate', 'Subject')
+    codes = {code for code in Subject.objects.values_list('code', flat=True) if code == code.strip().upper()}
+    # Codes already in upper case keep it, and others clashing with them in another case get a suffix
+    for pk, code in Subject.objects.order_by('pk').values_list('pk', 'code'):
+        if code in codes:
+            continue
+        normalized = unique_code(code.strip().upper(), codes)
+        Subject.objects.filter(pk=pk).update(code=normalized)
+        codes.add(normalized)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Planmate', '0014_change_log'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_codes, migrations.RunPython.noop),
+    ]
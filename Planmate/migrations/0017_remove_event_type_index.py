@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 13:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Planmate', '0016_event_location_case_insensitive_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='event',
+            name='event_type_idx',
+        ),
+    ]
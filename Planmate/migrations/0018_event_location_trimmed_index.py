@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-17 13:45
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Planmate', '0017_remove_event_type_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='event',
+            name='event_location_start_idx',
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(django.db.models.functions.text.Upper(django.db.models.functions.text.Trim('location')), models.F('start_time'), name='event_location_start_idx'),
+        ),
+    ]
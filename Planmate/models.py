@@ -1,5 +1,14 @@
+from datetime import timedelta
+
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Trim, Upper
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+def normalize_code(code):
+    """Return the stored form of a subject code, which code lookups and prefix ranges rely on"""
+    return code.strip().upper()
 
 class Subject(models.Model):
     code = models.CharField(max_length=20, unique=True)
@@ -8,9 +17,43 @@ class Subject(models.Model):
     credits = models.IntegerField()
     semester = models.CharField(max_length=20)  # e.g., "1/2567", "2/2567"
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_subjects', null=True, blank=True)
+    # Bumped whenever the subject or one of its events changes, used for cache keys and ETags
+    events_version = models.PositiveIntegerField(default=0, editable=False)
+    events_changed_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Seats, or None for no limit. Further students join the waitlist.
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+    # Students with the subject in their schedule, kept by Planmate.enrollment
+    enrolled_count = models.PositiveIntegerField(default=0, editable=False)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_by', 'semester'], name='subject_owner_semester_idx'),
+            # Filtered catalog pages are keyset-paginated on code
+            models.Index(fields=['semester', 'code'], name='subject_semester_code_idx'),
+            models.Index(fields=['credits', 'code'], name='subject_credits_code_idx'),
+        ]
+    
+    # Kept with F() updates, so saving a loaded instance must not write back its stale copy
+    COUNTER_FIELDS = ('enrolled_count', 'events_version', 'events_changed_at')
+    
+    def save(self, *args, **kwargs):
+        self.code = normalize_code(self.code)
+        updating = not self._state.adding and not args and not kwargs.get('force_insert')
+        if updating and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.code} - {self.name}"
+    
+    @property
+    def seats_left(self):
+        if self.capacity is None:
+            return None
+        return max(self.capacity - self.enrolled_count, 0)
 
 class Event(models.Model):
     EVENT_TYPES = [
@@ -19,13 +62,27 @@ class Event(models.Model):
         ('lab', 'Lab'),
     ]
     
-    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, db_index=False)  # Covered by event_subject_start_idx
     event_type = models.CharField(max_length=10, choices=EVENT_TYPES)
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
     location = models.CharField(max_length=100)
     notes = models.TextField(blank=True)
     repeat_weekly = models.BooleanField(default=False)
+    repeat_until = models.DateField(null=True, blank=True)  # Last day of a weekly series, e.g. the semester end
+    # Events of one section are an alternative to other sections of the subject. Blank for every section.
+    section = models.CharField(max_length=20, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Calendar window and upcoming events lookups per subject
+            models.Index(fields=['subject', 'start_time'], name='event_subject_start_idx'),
+            models.Index(fields=['subject', 'end_time'], name='event_subject_end_idx'),
+            # Room double-booking checks
+            models.Index(Upper(Trim('location')), F('start_time'), name='event_location_start_idx'),
+            # Reminders look up the one-off events starting soon across all subjects
+            models.Index(fields=['repeat_weekly', 'start_time'], name='event_repeat_start_idx'),
+        ]
     
     def __str__(self):
         return f"{self.subject.code} - {self.get_event_type_display()}"
@@ -39,6 +96,116 @@ class Student(models.Model):
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name}"
 
+class WaitlistEntry(models.Model):
+    """A student waiting for a seat in a full subject, served first come first served"""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='waitlist_entries')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, db_index=False)  # Covered by waitlist_subject_order_idx
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'subject'], name='waitlist_student_subject_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['subject', 'created_at', 'id'], name='waitlist_subject_order_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.student} waiting for {self.subject.code}"
+
+class Timetable(models.Model):
+    """The occurrences of a user's calendar subjects within one window, kept up to date on every change"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='timetable')
+    window_start = models.DateTimeField()
+    window_end = models.DateTimeField()
+    # Longest entry, which bounds how far before a window an overlapping entry can start
+    longest = models.DurationField(default=timedelta)
+    # Bumped on every change of the entries, used for ETags
+    version = models.PositiveIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+    
+    def covers(self, window_start, window_end):
+        return self.window_start <= window_start and window_end <= self.window_end
+    
+    def __str__(self):
+        return f"Timetable of {self.user}"
+
+class TimetableEntry(models.Model):
+    """One occurrence of an event in a user's timetable"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)  # Covered by timetable_user_start_idx
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, db_index=False)  # Covered by timetable_subject_user_idx
+    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            # Calendar windows and upcoming events are one range scan per user
+            models.Index(fields=['user', 'start_time'], name='timetable_user_start_idx'),
+            # Incremental refreshes replace the entries of one subject
+            models.Index(fields=['subject', 'user'], name='timetable_subject_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} - {self.event} at {self.start_time}"
+
+class Reminder(models.Model):
+    """A reminder of one occurrence of an event for one user through one backend, claimed before it is sent"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, db_index=False)  # Covered by reminder_once
+    start_time = models.DateTimeField()  # Of the occurrence
+    backend = models.CharField(max_length=50)
+    # Identifies the batch that claimed the reminder
+    token = models.CharField(max_length=32, db_index=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'start_time', 'user', 'backend'], name='reminder_once'),
+        ]
+        indexes = [
+            # Reminders of past occurrences are purged by start time
+            models.Index(fields=['start_time'], name='reminder_start_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Reminder of {self.event} at {self.start_time} for {self.user}"
+
+class Change(models.Model):
+    """An entry of the change log that clients sync from, its id being their cursor"""
+    EVENT_SAVED = 'event_saved'
+    EVENT_DELETED = 'event_deleted'
+    SUBJECT_CHANGED = 'subject_changed'
+    SUBJECT_ADDED = 'subject_added'
+    SUBJECT_REMOVED = 'subject_removed'
+    KINDS = [
+        (EVENT_SAVED, 'Event saved'),
+        (EVENT_DELETED, 'Event deleted'),
+        (SUBJECT_CHANGED, 'Subject changed'),
+        (SUBJECT_ADDED, 'Subject added to a calendar'),
+        (SUBJECT_REMOVED, 'Subject removed from a calendar'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KINDS)
+    # Plain ids rather than foreign keys, so tombstones outlive what they point to
+    subject_id = models.BigIntegerField()
+    event_id = models.BigIntegerField(null=True, blank=True)
+    # Set when the change is to one user's calendar, else it concerns everyone with the subject
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_index=False)  # Covered by change_user_idx
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['subject_id', 'id'], name='change_subject_idx'),
+            models.Index(fields=['user', 'id'], name='change_user_idx'),
+            # Old entries are pruned by age
+            models.Index(fields=['created_at'], name='change_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk}"
+
 class Teacher(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     teacher_id = models.CharField(max_length=20, unique=True)
@@ -0,0 +1,210 @@
+"""Per-request profiling: query count, database time, template time and size.
+
+``RequestProfilingMiddleware`` records these for every request under the URL
+name of the view, in the histograms of ``Planmate.metrics``, and logs requests
+over the ``PLANMATE_SLOW_REQUEST_SECONDS`` or ``PLANMATE_SLOW_REQUEST_QUERIES``
+thresholds with their slowest queries.
+
+The current request's profile lives in a context variable, so queries run by
+``sync_to_async`` from async views and rows fetched while a streaming response
+is sent are counted too. Recording a query is one context variable lookup and
+two clock reads, cheap enough to leave on in production.
+"""
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+current_profile = ContextVar('planmate_request_profile', default=None)
+
+# Slowest queries kept per request for the slow request log
+SLOW_QUERY_SAMPLES = 3
+SQL_SAMPLE_LENGTH = 500
+
+
+def slow_request_seconds():
+    return getattr(settings, 'PLANMATE_SLOW_REQUEST_SECONDS', 0.5)
+
+
+def slow_request_queries():
+    return getattr(settings, 'PLANMATE_SLOW_REQUEST_QUERIES', 50)
+
+
+class RequestProfile:
+    __slots__ = ('started', 'queries', 'db_seconds', 'template_seconds', 'response_bytes', 'slowest_queries')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.response_bytes = 0
+        # (seconds, sql) of the slowest queries, slowest first
+        self.slowest_queries = []
+
+    def add_query(self, sql, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        samples = self.slowest_queries
+        if len(samples) < SLOW_QUERY_SAMPLES or seconds > samples[-1][0]:
+            samples.append((seconds, sql))
+            samples.sort(key=lambda sample: sample[0], reverse=True)
+            del samples[SLOW_QUERY_SAMPLES:]
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the current request's profile"""
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """``connection_created`` receiver, connected in ``PlanmateConfig.ready``"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ProfiledTemplate:
+    """Wraps a template of the Django backend to time its rendering"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        profile = current_profile.get()
+        if profile is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            profile.template_seconds += time.perf_counter() - started
+
+
+class ProfilingDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for the request profile"""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return ProfiledTemplate(super().get_template(template_name))
+
+
+class RequestProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.process_response(request, response, profile)
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.process_response(request, response, profile)
+
+    def process_response(self, request, response, profile):
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unmatched'
+        if not response.streaming:
+            profile.response_bytes = len(response.content)
+            finish_profile(request, response, profile, view)
+        elif response.is_async:
+            response.streaming_content = profiled_async_stream(
+                response.streaming_content, request, response, profile, view,
+            )
+        else:
+            response.streaming_content = profiled_stream(
+                response.streaming_content, request, response, profile, view,
+            )
+        return response
+
+
+def profiled_stream(content, request, response, profile, view):
+    """Count the chunks of a streaming response, and the queries that produce them"""
+    iterator = iter(content)
+    try:
+        while True:
+            # Set around each step only, as the stream is consumed outside the middleware
+            token = current_profile.set(profile)
+            try:
+                chunk = next(iterator, None)
+            finally:
+                current_profile.reset(token)
+            if chunk is None:
+                break
+            profile.response_bytes += len(chunk)
+            yield chunk
+    finally:
+        finish_profile(request, response, profile, view)
+
+
+async def profiled_async_stream(content, request, response, profile, view):
+    iterator = aiter(content)
+    try:
+        while True:
+            token = current_profile.set(profile)
+            try:
+                chunk = await anext(iterator, None)
+            finally:
+                current_profile.reset(token)
+            if chunk is None:
+                break
+            profile.response_bytes += len(chunk)
+            yield chunk
+    finally:
+        finish_profile(request, response, profile, view)
+
+
+def finish_profile(request, response, profile, view):
+    elapsed = time.perf_counter() - profile.started
+    labels = (view,)
+    metrics.request_seconds.observe(elapsed, labels)
+    metrics.request_queries.observe(profile.queries, labels)
+    metrics.request_db_seconds.observe(profile.db_seconds, labels)
+    metrics.request_template_seconds.observe(profile.template_seconds, labels)
+    metrics.response_bytes.observe(profile.response_bytes, labels)
+
+    if elapsed < slow_request_seconds() and profile.queries < slow_request_queries():
+        return
+    metrics.slow_requests.inc(labels=labels)
+    logger.warning(
+        'Slow request %s %s (%s): %d in %.0f ms, %d queries in %.0f ms, templates %.0f ms, %d bytes',
+        request.method, request.get_full_path(), view, response.status_code, elapsed * 1000,
+        profile.queries, profile.db_seconds * 1000, profile.template_seconds * 1000, profile.response_bytes,
+    )
+    for seconds, sql in profile.slowest_queries:
+        logger.warning('Slow request %s query %.1f ms: %s', view, seconds * 1000, sql[:SQL_SAMPLE_LENGTH])
@@ -0,0 +1,220 @@
+"""Push of calendar changes to open calendars over Server-Sent Events.
+
+Changes are published on two kinds of channel: ``subject:<id>`` for changes
+of a subject or its events, and ``user:<id>`` for subjects added to or removed
+from a user's calendar. The stream of an open calendar subscribes to its
+user's channel and to the channels of the subjects on the calendar, following
+the subjects as they are added and removed. A change is therefore published
+once, however many students have the subject, and reaches only them.
+
+Messages only say what changed, e.g. ``event.changed`` with
+``{"event": 41, "subject": 3}``. The calendar then fetches the events of that
+one subject for the range it shows, which come from the shared fragment cache,
+and replaces them in place instead of reloading the whole calendar.
+
+Messages are published once the transaction commits. ``InMemoryBroker``
+delivers them within the process, which suits a single ASGI worker and the
+tests, while ``RedisBroker`` reaches every worker through Redis pub/sub.
+"""
+import asyncio
+import json
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+EVENT_CHANGED = 'event.changed'
+EVENT_DELETED = 'event.deleted'
+SUBJECT_CHANGED = 'subject.changed'
+SUBJECT_ADDED = 'subject.added'
+SUBJECT_REMOVED = 'subject.removed'
+# Messages were lost, so the calendar must reload everything
+RESET = 'reset'
+
+# Messages waiting for a slow client before its stream is reset
+QUEUE_SIZE = 1000
+# Seconds between comments that keep idle connections open through proxies
+HEARTBEAT_SECONDS = 25
+# Milliseconds browsers wait before reconnecting
+RETRY_MILLISECONDS = 5000
+
+
+def subject_channel(subject_id):
+    return f'subject:{subject_id}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class InMemorySubscription:
+    def __init__(self, broker):
+        self.broker = broker
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.channels = set()
+        self.overflowed = False
+
+    async def add(self, channels):
+        self.broker.attach(self, channels)
+
+    async def remove(self, channels):
+        self.broker.detach(self, channels)
+
+    def deliver(self, message):
+        # Runs in the subscriber's event loop
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """Return the next (kind, data) message, or None after ``timeout`` seconds"""
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return RESET, {}
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except TimeoutError:
+            return None
+
+    async def close(self):
+        self.broker.detach(self, set(self.channels))
+
+
+class InMemoryBroker:
+    """Delivers messages to the subscriptions of this process, from any thread"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def attach(self, subscription, channels):
+        with self.lock:
+            for channel in channels:
+                self.subscriptions.setdefault(channel, set()).add(subscription)
+                subscription.channels.add(channel)
+
+    def detach(self, subscription, channels):
+        with self.lock:
+            for channel in channels:
+                subscribers = self.subscriptions.get(channel, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self.subscriptions.pop(channel, None)
+                subscription.channels.discard(channel)
+
+    def publish(self, channel, kind, data):
+        with self.lock:
+            subscribers = list(self.subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, (kind, data))
+            except RuntimeError:
+                # The loop of a finished stream was closed before it detached
+                pass
+
+    async def subscribe(self, channels):
+        subscription = InMemorySubscription(self)
+        await subscription.add(channels)
+        return subscription
+
+
+class RedisSubscription:
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = prefix
+        self.pubsub = client.pubsub()
+
+    async def add(self, channels):
+        await self.pubsub.subscribe(*[self.prefix + channel for channel in channels])
+
+    async def remove(self, channels):
+        await self.pubsub.unsubscribe(*[self.prefix + channel for channel in channels])
+
+    async def get(self, timeout):
+        message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message is None:
+            return None
+        kind, data = json.loads(message['data'])
+        return kind, data
+
+    async def close(self):
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+class RedisBroker:
+    """Delivers messages to every worker through Redis pub/sub, needs the ``redis`` package"""
+
+    def __init__(self):
+        import redis
+
+        self.url = getattr(settings, 'PLANMATE_REALTIME_REDIS_URL', '')
+        self.prefix = getattr(settings, 'PLANMATE_REALTIME_PREFIX', 'planmate:')
+        self.client = redis.Redis.from_url(self.url)
+
+    def publish(self, channel, kind, data):
+        self.client.publish(self.prefix + channel, json.dumps([kind, data]))
+
+    async def subscribe(self, channels):
+        from redis import asyncio as aioredis
+
+        subscription = RedisSubscription(aioredis.Redis.from_url(self.url), self.prefix)
+        await subscription.add(channels)
+        return subscription
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'PLANMATE_REALTIME_BROKER', 'Planmate.realtime.InMemoryBroker'))()
+
+
+def publish(channels, kind, data):
+    """Publish a message on the channels once the current transaction commits"""
+    channels = list(channels)
+    if not channels:
+        return
+
+    def send():
+        broker = get_broker()
+        for channel in channels:
+            broker.publish(channel, kind, data)
+
+    # A broker that is down must not fail the request, the calendars catch up on reload
+    transaction.on_commit(send, robust=True)
+
+
+def server_sent_event(kind, data):
+    return f'event: {kind}\ndata: {json.dumps(data)}\n\n'
+
+
+async def stream(subscription, on_calendar):
+    """Yield the messages of ``subscription`` as Server-Sent Events, following subjects in and out.
+
+    ``on_calendar(subject_id)`` is awaited when a subject is removed and
+    tells whether it is still on the calendar, e.g. because the user
+    created it.
+    """
+    try:
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        while True:
+            message = await subscription.get(HEARTBEAT_SECONDS)
+            if message is None:
+                yield ': keep-alive\n\n'
+                continue
+            kind, data = message
+            if kind == SUBJECT_ADDED:
+                await subscription.add([subject_channel(data['subject'])])
+            elif kind == SUBJECT_REMOVED:
+                if await on_calendar(data['subject']):
+                    kind = SUBJECT_CHANGED
+                else:
+                    await subscription.remove([subject_channel(data['subject'])])
+            yield server_sent_event(kind, data)
+    finally:
+        await subscription.close()
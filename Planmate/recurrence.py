@@ -0,0 +1,94 @@
+"""Expansion of weekly recurring events into individual occurrences.
+
+Recurring events are stored as a single row. Occurrences are generated lazily
+and only for the requested window, so the cost of a request depends on how
+many occurrences are visible rather than on how long each series runs.
+"""
+from datetime import datetime, time, timedelta
+from heapq import merge
+from itertools import islice
+from operator import attrgetter
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+WEEK = timedelta(weeks=1)
+
+
+class Occurrence(NamedTuple):
+    event: object
+    start_time: datetime
+    end_time: datetime
+
+
+def semester_length():
+    """Default length of a weekly series that has no ``repeat_until`` date"""
+    return getattr(settings, 'PLANMATE_SEMESTER_WEEKS', 18) * WEEK
+
+
+def series_end(event):
+    """Return the moment after which no occurrence of ``event`` may start"""
+    if not event.repeat_weekly:
+        return event.start_time + timedelta(microseconds=1)
+    if event.repeat_until is None:
+        return event.start_time + semester_length()
+    # The series ends at midnight after repeat_until in the project time zone
+    return datetime.combine(
+        event.repeat_until + timedelta(days=1), time.min, tzinfo=timezone.get_default_timezone()
+    )
+
+
+def occurrences(event, window_start=None, window_end=None):
+    """Yield the occurrences of ``event`` overlapping ``[window_start, window_end)``"""
+    duration = event.end_time - event.start_time
+    limit = series_end(event)
+    if window_end is not None:
+        limit = min(limit, window_end)
+
+    # Jump straight to the first occurrence that ends inside the window
+    index = 0
+    if window_start is not None and event.end_time <= window_start:
+        index = (window_start - event.end_time) // WEEK + 1
+        if not event.repeat_weekly:
+            return
+
+    while True:
+        start = event.start_time + index * WEEK
+        if start >= limit:
+            return
+        yield Occurrence(event, start, start + duration)
+        index += 1
+
+
+def expand(events, window_start=None, window_end=None):
+    """Yield the occurrences of every event in ``events`` inside the window"""
+    for event in events:
+        yield from occurrences(event, window_start, window_end)
+
+
+def upcoming(events, now=None, limit=5):
+    """Return the next ``limit`` occurrences across ``events`` ordered by start"""
+    now = now or timezone.now()
+    streams = [occurrences(event, now) for event in events]
+    return list(islice(merge(*streams, key=attrgetter('start_time')), limit))
+
+
+def window_filter(window_start=None, window_end=None):
+    """Return a ``Q`` selecting the events with an occurrence inside the window.
+
+    Series without a ``repeat_until`` date are assumed to last one semester,
+    which keeps the lookup bounded on ``end_time``.
+    """
+    query = Q()
+    if window_end is not None:
+        query &= Q(start_time__lt=window_end)
+    if window_start is not None:
+        query &= (
+            Q(end_time__gt=window_start)
+            | Q(repeat_weekly=True, repeat_until__gte=timezone.localdate(window_start))
+            | Q(repeat_weekly=True, repeat_until__isnull=True,
+                end_time__gt=window_start - semester_length())
+        )
+    return query
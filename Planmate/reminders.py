@@ -0,0 +1,232 @@
+"""Reminders of upcoming events for the students who have them in their schedule.
+
+Every tick of ``manage.py send_reminders`` finds the occurrences starting
+within ``PLANMATE_REMINDER_LEAD_MINUTES``: one-off events with a range scan of
+their start time and weekly series expanded in memory. The students of their
+subjects are then read with one query, streamed in batches of ``BATCH_SIZE``,
+so the number of queries does not grow with the number of students.
+
+Each backend claims a batch before sending it by inserting one ``Reminder``
+row per reminder with a fresh token. The unique constraint turns away rows
+sent or claimed before, so only reminders that come back with the batch's
+token are sent. Reminders are marked sent after delivery. A batch whose
+delivery fails is released and retried on the next tick.
+
+A tick that dies between claim and delivery leaves its rows claimed but
+unsent. Once older than ``PLANMATE_REMINDER_CLAIM_TIMEOUT_MINUTES`` they are
+taken over by a later tick, with an update that only succeeds while they
+still carry the old token, so one tick wins each of them. Delivery is thus at
+least once: a reminder is sent twice only if a tick outlives the timeout
+between claim and marking its batch sent.
+"""
+import json
+import logging
+import urllib.request
+import uuid
+from datetime import timedelta
+from itertools import islice
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Event, Reminder, Student
+from .recurrence import occurrences, window_filter
+
+logger = logging.getLogger(__name__)
+
+Schedule = Student.scheduled_subjects.through
+
+BATCH_SIZE = 1000
+# Reminders of occurrences that started longer ago than this are purged
+KEEP_SENT = timedelta(days=1)
+
+
+def lead_time():
+    return timedelta(minutes=getattr(settings, 'PLANMATE_REMINDER_LEAD_MINUTES', 60))
+
+
+def claim_timeout():
+    return timedelta(minutes=getattr(settings, 'PLANMATE_REMINDER_CLAIM_TIMEOUT_MINUTES', 10))
+
+
+class Due(NamedTuple):
+    """A reminder of one occurrence for one student"""
+    event: object
+    start_time: object
+    end_time: object
+    user_id: int
+    email: str
+    first_name: str
+
+    def key(self):
+        return self.user_id, self.event.id, self.start_time
+
+
+class TickReport(NamedTuple):
+    occurrences: int
+    sent: int
+    skipped: int  # Sent or claimed before
+    failed: int
+
+
+def describe(reminder):
+    event = reminder.event
+    start = timezone.localtime(reminder.start_time)
+    return f'{event.subject.code} {event.get_event_type_display()} at {start:%a %d %b %H:%M}'
+
+
+class EmailBackend:
+    """Send each reminder as an email, a batch over one connection"""
+    name = 'email'
+
+    def wants(self, reminder):
+        return bool(reminder.email)
+
+    def send(self, reminders):
+        messages = []
+        for reminder in reminders:
+            event = reminder.event
+            lines = [
+                f'Hi {reminder.first_name or "there"},',
+                '',
+                f'{event.subject.code} - {event.subject.name} ({event.get_event_type_display()})',
+                f'Starts: {timezone.localtime(reminder.start_time):%A %d %B %Y %H:%M}',
+                f'Ends: {timezone.localtime(reminder.end_time):%H:%M}',
+            ]
+            if event.location:
+                lines.append(f'Location: {event.location}')
+            messages.append(EmailMessage(f'Reminder: {describe(reminder)}', '\n'.join(lines), to=[reminder.email]))
+        get_connection().send_messages(messages)
+
+
+class WebhookBackend:
+    """POST each batch of reminders as JSON to ``PLANMATE_REMINDER_WEBHOOK_URL``"""
+    name = 'webhook'
+
+    def __init__(self):
+        self.url = getattr(settings, 'PLANMATE_REMINDER_WEBHOOK_URL', '')
+        if not self.url:
+            raise ImproperlyConfigured('WebhookBackend needs PLANMATE_REMINDER_WEBHOOK_URL.')
+        self.timeout = getattr(settings, 'PLANMATE_REMINDER_WEBHOOK_TIMEOUT', 10)
+
+    def wants(self, reminder):
+        return True
+
+    def send(self, reminders):
+        payload = {'reminders': [
+            {
+                'user': reminder.user_id,
+                'email': reminder.email,
+                'event': reminder.event.id,
+                'subject': reminder.event.subject.code,
+                'name': reminder.event.subject.name,
+                'type': reminder.event.event_type,
+                'location': reminder.event.location,
+                'start': reminder.start_time.isoformat(),
+                'end': reminder.end_time.isoformat(),
+            }
+            for reminder in reminders
+        ]}
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode(), method='POST',
+            headers={'Content-Type': 'application/json'},
+        )
+        # Raises HTTPError on any status but 2xx
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def get_backends():
+    paths = getattr(settings, 'PLANMATE_REMINDER_BACKENDS', ['Planmate.reminders.EmailBackend'])
+    return [import_string(path)() for path in paths]
+
+
+def due_occurrences(now, until):
+    """Return ``{subject_id: [Occurrence, ...]}`` of the occurrences starting in ``[now, until)``"""
+    window = window_filter(now, until)
+    single = Event.objects.filter(repeat_weekly=False, start_time__gte=now, start_time__lt=until)
+    weekly = Event.objects.filter(window, repeat_weekly=True)
+    due = {}
+    for events in (single, weekly):
+        for event in events.select_related('subject').iterator(chunk_size=2000):
+            for occurrence in occurrences(event, now, until):
+                if occurrence.start_time >= now:
+                    due.setdefault(event.subject_id, []).append(occurrence)
+    return due
+
+
+def due_reminders(due):
+    """Yield a ``Due`` per occurrence and student of its subject, reading the students with one query"""
+    students = (
+        Schedule.objects.filter(subject_id__in=list(due))
+        .order_by('subject_id', 'student_id')
+        .values_list('subject_id', 'student__user_id', 'student__user__email', 'student__user__first_name')
+    )
+    for subject_id, user_id, email, first_name in students.iterator(chunk_size=BATCH_SIZE):
+        for occurrence in due[subject_id]:
+            yield Due(occurrence.event, occurrence.start_time, occurrence.end_time, user_id, email, first_name)
+
+
+def reclaim(wanted, backend, token, now):
+    """Take over the unsent reminders of the batch claimed by a tick that did not finish in time"""
+    keys = {reminder.key() for reminder in wanted}
+    stale = Reminder.objects.filter(
+        backend=backend.name, sent_at__isnull=True, created_at__lt=now - claim_timeout(),
+        event_id__in={reminder.event.id for reminder in wanted},
+        user_id__in={reminder.user_id for reminder in wanted},
+    ).values_list('pk', 'token', 'user_id', 'event_id', 'start_time')
+    for pk, old_token, *key in stale:
+        if tuple(key) in keys:
+            # Fails if another tick took it over first
+            Reminder.objects.filter(pk=pk, token=old_token).update(token=token, created_at=now)
+
+
+def deliver(batch, backend, now):
+    """Claim and send a batch through one backend, returning (sent, skipped, failed)"""
+    wanted = [reminder for reminder in batch if backend.wants(reminder)]
+    if not wanted:
+        return 0, 0, 0
+    token = uuid.uuid4().hex
+    Reminder.objects.bulk_create(
+        [
+            Reminder(
+                user_id=reminder.user_id, event_id=reminder.event.id, start_time=reminder.start_time,
+                backend=backend.name, token=token, created_at=now,
+            )
+            for reminder in wanted
+        ],
+        ignore_conflicts=True,
+    )
+    reclaim(wanted, backend, token, now)
+    claimed = set(Reminder.objects.filter(token=token).values_list('user_id', 'event_id', 'start_time'))
+    mine = [reminder for reminder in wanted if reminder.key() in claimed]
+    if not mine:
+        return 0, len(wanted), 0
+    try:
+        backend.send(mine)
+    except Exception:
+        logger.exception('Reminder backend %s failed to send %d reminders', backend.name, len(mine))
+        # Released, so the next tick tries them again
+        Reminder.objects.filter(token=token).delete()
+        return 0, len(wanted) - len(mine), len(mine)
+    Reminder.objects.filter(token=token).update(sent_at=timezone.now())
+    return len(mine), len(wanted) - len(mine), 0
+
+
+def run_tick(now=None, backends=None):
+    """Send the reminders of every occurrence starting within the lead time"""
+    now = now or timezone.now()
+    backends = get_backends() if backends is None else backends
+    Reminder.objects.filter(start_time__lt=now - KEEP_SENT).delete()
+    due = due_occurrences(now, now + lead_time())
+    totals = [0, 0, 0]
+    reminders = due_reminders(due) if due else iter(())
+    while batch := list(islice(reminders, BATCH_SIZE)):
+        for backend in backends:
+            for index, count in enumerate(deliver(batch, backend, now)):
+                totals[index] += count
+    return TickReport(sum(len(subject_due) for subject_due in due.values()), *totals)
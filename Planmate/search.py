@@ -0,0 +1,186 @@
+"""Ranked full-text and prefix search over the subject catalog.
+
+Subjects whose code starts with the query come first, followed by full-text
+matches on code, name and description ranked by relevance:
+
+* PostgreSQL matches a ``simple`` tsvector with prefix queries and falls back
+  to trigram similarity on the name to tolerate typos. Both are served by the
+  GIN expression indexes created in migration 0009.
+* SQLite uses an FTS5 table kept in sync with the subject table by triggers,
+  see ``install_search_index``.
+* Other backends use unindexed ``icontains`` lookups.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Subject, normalize_code
+
+MAX_RESULTS = 20
+MAX_TERMS = 8
+
+# Must match the expression of subject_search_idx in migration 0009
+SEARCH_VECTOR = "to_tsvector('simple', code || ' ' || name || ' ' || description)"
+
+FTS_TABLE = 'planmate_subject_fts'
+
+# Characters with a meaning in tsquery or FTS5 query syntax
+TERM_SEPARATORS = re.compile(r'''[\s"'`*:()&|!<>\\^+,.;{}\[\]-]+''')
+
+
+def terms(query):
+    """Split a user query into at most ``MAX_TERMS`` plain lowercase terms"""
+    return [term for term in TERM_SEPARATORS.split(query.lower()) if term][:MAX_TERMS]
+
+
+def code_prefix_q(prefix):
+    """Return a ``Q`` matching codes that start with ``prefix``.
+
+    A range instead of LIKE so the unique code index is used on every backend,
+    which relies on codes being stored in upper case, see ``Subject.save``.
+    """
+    prefix = normalize_code(prefix)
+    return Q(code__gte=prefix, code__lt=prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def text_q(query):
+    """Return a filter of the subjects full-text matching ``query``, for use in other querysets.
+
+    Served by the same indexes as ``search_subjects``, without its ranking.
+    """
+    words = terms(query)
+    if not words:
+        return Q(pk__in=[])
+    vendor = connections[Subject.objects.db].vendor
+    if vendor == 'postgresql':
+        return postgresql_condition(words, query)
+    if vendor == 'sqlite':
+        return Q(pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [fts_match(words)]))
+    return icontains_q(words)
+
+
+def search_subjects(query, limit=10):
+    """Return up to ``limit`` subjects matching ``query``, best matches first"""
+    query = query.strip()
+    words = terms(query)
+    if not words:
+        return []
+    limit = max(1, min(limit, MAX_RESULTS))
+
+    results = []
+    if len(words) == 1:
+        results = list(Subject.objects.filter(code_prefix_q(query)).order_by('code')[:limit])
+    found = {subject.pk for subject in results}
+    if len(results) < limit:
+        for subject in text_matches(words, query, limit):
+            if subject.pk not in found:
+                results.append(subject)
+            if len(results) == limit:
+                break
+    return results
+
+
+def text_matches(words, query, limit):
+    vendor = connections[Subject.objects.db].vendor
+    if vendor == 'postgresql':
+        return postgresql_matches(words, query, limit)
+    if vendor == 'sqlite':
+        return sqlite_matches(words, limit)
+    return Subject.objects.filter(icontains_q(words)).order_by('code')[:limit]
+
+
+def icontains_q(words):
+    condition = Q()
+    for word in words:
+        condition &= Q(code__icontains=word) | Q(name__icontains=word) | Q(description__icontains=word)
+    return condition
+
+
+def tsquery(words):
+    return ' & '.join(f"'{word}':*" for word in words)
+
+
+def postgresql_condition(words, query):
+    return RawSQL(
+        f"({SEARCH_VECTOR} @@ to_tsquery('simple', %s) OR name %% %s)",
+        (tsquery(words), query),
+        output_field=BooleanField(),
+    )
+
+
+def postgresql_matches(words, query, limit):
+    return (
+        Subject.objects
+        .annotate(rank=RawSQL(
+            f"ts_rank({SEARCH_VECTOR}, to_tsquery('simple', %s)) + similarity(name, %s)",
+            (tsquery(words), query),
+        ))
+        .filter(postgresql_condition(words, query))
+        .order_by('-rank', 'code')[:limit]
+    )
+
+
+def fts_match(words):
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def sqlite_matches(words, limit):
+    match = fts_match(words)
+    with connections[Subject.objects.db].cursor() as cursor:
+        # Matches in the code weigh more than in the name, then the description
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, 10.0, 5.0, 1.0) LIMIT %s',
+            [match, limit],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    subjects = Subject.objects.in_bulk(ids)
+    return [subjects[pk] for pk in ids if pk in subjects]
+
+
+def sqlite_schema(table):
+    columns = 'code, name, description'
+    new = 'new.id, new.code, new.name, new.description'
+    old = "'delete', old.id, old.code, old.name, old.description"
+    return {
+        'ai': f'AFTER INSERT ON "{table}" BEGIN '
+              f'INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES ({new}); END',
+        'ad': f'AFTER DELETE ON "{table}" BEGIN '
+              f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ({old}); END',
+        # Only searchable columns, so version bumps on every event change do not touch the index
+        'au': f'AFTER UPDATE OF {columns} ON "{table}" BEGIN '
+              f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ({old}); '
+              f'INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES ({new}); END',
+    }
+
+
+def install_search_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Create the SQLite FTS5 table and its triggers if they are missing.
+
+    Connected to ``post_migrate`` rather than done in a migration because
+    SQLite rebuilds a table, dropping its triggers, whenever a migration alters
+    it. The index is rebuilt from the subject table when triggers were missing.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    table = Subject._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            f"code, name, description, content='{table}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [table])
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = {
+            f'{FTS_TABLE}_{suffix}': body
+            for suffix, body in sqlite_schema(table).items()
+            if f'{FTS_TABLE}_{suffix}' not in existing
+        }
+        for name, body in missing.items():
+            cursor.execute(f'CREATE TRIGGER {name} {body}')
+        if missing:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
@@ -0,0 +1,156 @@
+"""Signal handlers that keep derived calendar data in sync with the models"""
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import changelog, enrollment, realtime, timetable
+from .models import Change, Event, Student, Subject
+
+
+def events_created(events):
+    """Called after events are inserted with ``bulk_create``, which sends no signals"""
+    subject_ids = {event.subject_id for event in events}
+    events_changed(subject_ids)
+    timetable.add_events(events)
+    changelog.events_saved(events)
+    for subject_id in subject_ids:
+        realtime.publish([realtime.subject_channel(subject_id)], realtime.SUBJECT_CHANGED, {'subject': subject_id})
+
+
+def events_changed(subject_ids):
+    """Called whenever events of the given subjects are created, edited or deleted"""
+    # The new version invalidates cached fragments and calendar ETags
+    Subject.objects.filter(pk__in=subject_ids).update(
+        events_version=F('events_version') + 1,
+        events_changed_at=timezone.now(),
+    )
+
+
+@receiver(pre_save, sender=Event)
+def remember_previous_subject(sender, instance, **kwargs):
+    # An edit may move the event to another subject, which must be refreshed too
+    instance._previous_subject_id = None
+    if instance.pk:
+        instance._previous_subject_id = (
+            Event.objects.filter(pk=instance.pk).values_list('subject_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Event)
+def event_saved(sender, instance, **kwargs):
+    subject_ids = {instance.subject_id, getattr(instance, '_previous_subject_id', None)}
+    subject_ids.discard(None)
+    events_changed(subject_ids)
+    timetable.refresh_events([instance.pk])
+    previous_subject_id = getattr(instance, '_previous_subject_id', None)
+    if previous_subject_id not in (None, instance.subject_id):
+        # Gone from the old subject, for those who do not have the new one
+        changelog.record(Change.EVENT_DELETED, [previous_subject_id], instance.pk)
+    changelog.record(Change.EVENT_SAVED, [instance.subject_id], instance.pk)
+    realtime.publish(
+        map(realtime.subject_channel, subject_ids), realtime.EVENT_CHANGED,
+        {'event': instance.pk, 'subject': instance.subject_id},
+    )
+
+
+@receiver(post_delete, sender=Event)
+def event_deleted(sender, instance, **kwargs):
+    events_changed([instance.subject_id])
+    # The timetable entries were deleted with the event
+    timetable.touch(timetable.subject_members([instance.subject_id]).get(instance.subject_id, ()))
+    # A tombstone, so that clients syncing later remove it too
+    changelog.record(Change.EVENT_DELETED, [instance.subject_id], instance.pk)
+    realtime.publish(
+        [realtime.subject_channel(instance.subject_id)], realtime.EVENT_DELETED,
+        {'event': instance.pk, 'subject': instance.subject_id},
+    )
+
+
+@receiver(pre_save, sender=Subject)
+def remember_previous_subject_fields(sender, instance, **kwargs):
+    # Only a change of owner moves timetable entries, and of code or name their titles
+    instance._previous_fields = None
+    if instance.pk:
+        instance._previous_fields = (
+            Subject.objects.filter(pk=instance.pk).values_list('created_by_id', 'code', 'name').first()
+        )
+
+
+@receiver(post_save, sender=Subject)
+def subject_saved(sender, instance, created, **kwargs):
+    # Event titles include the subject code and name
+    events_changed([instance.pk])
+    # The instance may be used again, e.g. for fragment cache keys
+    instance.refresh_from_db(fields=['events_version', 'events_changed_at'])
+    if created:
+        # It joins its owner's calendar
+        if instance.created_by_id:
+            changelog.record(Change.SUBJECT_ADDED, [instance.pk], user_ids=[instance.created_by_id])
+            realtime.publish(
+                [realtime.user_channel(instance.created_by_id)], realtime.SUBJECT_ADDED, {'subject': instance.pk},
+            )
+    else:
+        changelog.record(Change.SUBJECT_CHANGED, [instance.pk])
+        realtime.publish([realtime.subject_channel(instance.pk)], realtime.SUBJECT_CHANGED, {'subject': instance.pk})
+        previous = getattr(instance, '_previous_fields', None)
+        if previous is None or previous[0] != instance.created_by_id:
+            timetable.refresh_subjects([instance.pk])
+        elif previous[1:] != (instance.code, instance.name):
+            # Titles are joined when the timetable is read, only its ETag must change
+            timetable.touch(timetable.subject_members([instance.pk]).get(instance.pk, ()))
+        # Or the capacity been raised
+        enrollment.promote_waitlist(instance)
+
+
+@receiver(pre_delete, sender=Subject)
+def subject_deleted(sender, instance, **kwargs):
+    # The entries go with the subject, but the timetables that held them must change version
+    members = timetable.subject_removed(instance.pk)
+    changelog.record(Change.SUBJECT_REMOVED, [instance.pk], user_ids=members)
+    realtime.publish([realtime.subject_channel(instance.pk)], realtime.SUBJECT_REMOVED, {'subject': instance.pk})
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    if created:
+        timetable.create_empty(instance)
+
+
+@receiver(m2m_changed, sender=Student.scheduled_subjects.through)
+def schedule_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Refresh the timetables and seats of subjects that students scheduled or dropped"""
+    if action == 'pre_clear':
+        # The cleared rows are gone by post_clear
+        instance._cleared_ids = set(
+            sender.objects.filter(**{'subject_id' if reverse else 'student_id': instance.pk})
+            .values_list('student_id' if reverse else 'subject_id', flat=True)
+        )
+        return
+    if action == 'post_clear':
+        pk_set = instance._cleared_ids
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if not pk_set:
+        return
+    if reverse:
+        # subject.scheduled_by_students was changed, pk_set holds students
+        subject_ids = [instance.pk]
+        user_ids = set(Student.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
+    else:
+        subject_ids = pk_set
+        user_ids = {instance.user_id}
+    timetable.refresh_subjects(subject_ids, user_ids)
+    changelog.record(
+        Change.SUBJECT_ADDED if action == 'post_add' else Change.SUBJECT_REMOVED, subject_ids, user_ids=user_ids,
+    )
+    kind = realtime.SUBJECT_ADDED if action == 'post_add' else realtime.SUBJECT_REMOVED
+    for subject_id in subject_ids:
+        realtime.publish(map(realtime.user_channel, user_ids), kind, {'subject': subject_id})
+    
+    if not kwargs.get('counted'):
+        enrollment.recount(subject_ids)
+    if action != 'post_add':
+        for subject in Subject.objects.filter(pk__in=subject_ids, waitlistentry__isnull=False).distinct():
+            enrollment.promote_waitlist(subject)
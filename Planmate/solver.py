@@ -0,0 +1,296 @@
+"""Search for conflict-free timetables over the sections of a set of subjects.
+
+Each section is reduced to bitsets of the week in ``SLOT_MINUTES`` slots:
+``weekly`` for its weekly series and ``once`` for the time of the week of its
+one-off events, e.g. exams, which are also kept as dated intervals. Two
+sections fit together when their weekly bits do not meet, the one-off bits of
+neither meet the weekly bits of the other and their dated events do not
+overlap. Every weekly series is treated as running all semester, which may
+refuse series that run in different weeks but never accepts a real clash.
+
+The search backtracks over the subjects, the one with the fewest sections left
+first. After each choice the sections of the remaining subjects that clash with
+it are dropped, and the branch ends as soon as a subject has none left.
+Complete timetables are ranked by days on campus and idle time between classes,
+and the best ``limit`` are kept. A branch is cut once the days it must use,
+counting those every section left of a subject shares, rank it below all of
+them. The search stops at the time budget or when ``cancel`` is set,
+returning the best timetables found so far.
+"""
+import heapq
+import time
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from itertools import count
+from math import ceil
+from typing import NamedTuple
+
+from django.conf import settings
+from django.utils import timezone
+
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+DAY_MASK = (1 << SLOTS_PER_DAY) - 1
+WEEK_MASK = (1 << SLOTS_PER_WEEK) - 1
+# A day on campus ranks like this many minutes of gaps between classes
+DAY_WEIGHT_MINUTES = 60
+# Nodes visited between checks of the clock and the cancel flag
+CHECK_EVERY = 256
+
+
+def time_budget():
+    return getattr(settings, 'PLANMATE_SOLVER_TIME_BUDGET', 0.5)
+
+
+class Constraints(NamedTuple):
+    earliest_start: object = None  # datetime.time
+    latest_end: object = None  # datetime.time
+    free_days: frozenset = frozenset()  # Weekdays, Monday is 0
+    max_gap_minutes: object = None
+
+    def forbidden(self):
+        """Return the bits of the week no weekly class may take"""
+        mask = 0
+        for day in range(7):
+            blocked = 0
+            if day in self.free_days:
+                blocked = DAY_MASK
+            if self.earliest_start is not None:
+                first = (self.earliest_start.hour * 60 + self.earliest_start.minute) // SLOT_MINUTES
+                blocked |= (1 << first) - 1
+            if self.latest_end is not None:
+                last = ceil((self.latest_end.hour * 60 + self.latest_end.minute) / SLOT_MINUTES)
+                blocked |= DAY_MASK >> last << last
+            mask |= blocked << (day * SLOTS_PER_DAY)
+        return mask
+
+
+@dataclass
+class Section:
+    subject_id: int
+    name: str  # Blank when the subject has no sections
+    weekly: int = 0
+    once: int = 0
+    dated: list = field(default_factory=list)
+    # Names of other sections with the same times
+    alternatives: list = field(default_factory=list)
+
+    def add(self, event):
+        bits = slot_bits(event.start_time, event.end_time)
+        if event.repeat_weekly:
+            self.weekly |= bits
+        else:
+            self.once |= bits
+            self.dated.append((event.start_time, event.end_time))
+
+    def clashes(self, weekly, once, dated):
+        if self.weekly & (weekly | once) or self.once & weekly:
+            return True
+        return self.overlaps_dated(dated)
+
+    def overlaps_dated(self, dated):
+        return any(start < other_end and other_start < end for start, end in self.dated for other_start, other_end in dated)
+
+    @cached_property
+    def day_mask(self):
+        """Weekdays with weekly classes as bits, Monday first, once the section is complete"""
+        return day_bits(self.weekly)
+
+    def key(self):
+        return self.weekly, self.once, tuple(sorted(self.dated))
+
+
+class Timetable(NamedTuple):
+    sections: list
+    score: int
+    days: int
+    gap_minutes: int
+
+
+class Result(NamedTuple):
+    timetables: list  # Best first
+    complete: bool  # False when stopped by the time budget or cancel
+    explored: int
+    unsatisfiable: list  # Subjects without a section that meets the constraints
+
+
+class SearchStopped(Exception):
+    pass
+
+
+def slot_bits(start, end):
+    """Return the bits of the week from ``start`` to ``end`` in local time"""
+    start, end = timezone.localtime(start), timezone.localtime(end)
+    offset = start.weekday() * 24 * 60 + start.hour * 60 + start.minute
+    length = (end - start).total_seconds() / 60
+    first = offset // SLOT_MINUTES
+    last = ceil((offset + length) / SLOT_MINUTES)
+    if last - first >= SLOTS_PER_WEEK:
+        return WEEK_MASK
+    bits = ((1 << (last - first)) - 1) << first
+    # Classes running past Sunday midnight continue on Monday
+    return (bits | bits >> SLOTS_PER_WEEK) & WEEK_MASK
+
+
+def build_sections(subject_ids, events):
+    """Return ``{subject_id: [Section, ...]}``, events without a section going to every section"""
+    common = {subject_id: Section(subject_id, '') for subject_id in subject_ids}
+    named = {}
+    for event in events:
+        if event.section:
+            section = named.setdefault((event.subject_id, event.section), Section(event.subject_id, event.section))
+        else:
+            section = common[event.subject_id]
+        section.add(event)
+    sections = {subject_id: [] for subject_id in subject_ids}
+    for (subject_id, _), section in sorted(named.items()):
+        base = common[subject_id]
+        section.weekly |= base.weekly
+        section.once |= base.once
+        section.dated += base.dated
+        sections[subject_id].append(section)
+    for subject_id, options in sections.items():
+        if not options:
+            options.append(common[subject_id])
+    return sections
+
+
+def schedule_section(events):
+    """Return the events of a student's current schedule as one fixed section"""
+    section = Section(None, '')
+    for event in events:
+        section.add(event)
+    return section
+
+
+def day_profile(weekly):
+    """Return (days with classes, total gap minutes, longest gap minutes) of weekly bits"""
+    days = total = longest = 0
+    for day in range(7):
+        bits = weekly >> (day * SLOTS_PER_DAY) & DAY_MASK
+        if not bits:
+            continue
+        days += 1
+        day_total, day_longest = day_gaps(bits)
+        total += day_total
+        longest = max(longest, day_longest)
+    return days, total * SLOT_MINUTES, longest * SLOT_MINUTES
+
+
+@lru_cache(maxsize=4096)
+def day_gaps(bits):
+    """Return (total, longest) free slots between the first and last class of a day"""
+    gaps = [len(gap) for gap in bin(bits)[2:].strip('0').split('1')]
+    return sum(gaps), max(gaps)
+
+
+def day_bits(weekly):
+    return sum(1 << day for day in range(7) if weekly >> (day * SLOTS_PER_DAY) & DAY_MASK)
+
+
+class Search:
+    def __init__(self, sections, fixed, constraints, limit, deadline, cancel):
+        self.sections = sections
+        self.fixed = fixed
+        self.constraints = constraints
+        self.limit = limit
+        self.deadline = deadline
+        self.cancel = cancel
+        # Min-heap on the negated score, so the worst kept timetable is first
+        self.best = []
+        self.order = count()
+        self.nodes = 0
+
+    def run(self):
+        forbidden = self.constraints.forbidden()
+        domains, unsatisfiable = {}, []
+        for subject_id, options in self.sections.items():
+            distinct = {}
+            for section in options:
+                if section.weekly & forbidden or section.clashes(self.fixed.weekly, self.fixed.once, self.fixed.dated):
+                    continue
+                # Sections with the same times lead to the same timetables
+                same = distinct.setdefault(section.key(), section)
+                if same is not section:
+                    same.alternatives.append(section.name)
+            if not distinct:
+                unsatisfiable.append(subject_id)
+            domains[subject_id] = list(distinct.values())
+        if unsatisfiable:
+            return Result([], True, 0, unsatisfiable)
+
+        complete = True
+        try:
+            self.search([], domains, self.fixed.weekly, self.fixed.once, list(self.fixed.dated), self.fixed.day_mask)
+        except SearchStopped:
+            complete = False
+        timetables = sorted((timetable for _, _, timetable in self.best), key=lambda timetable: timetable.score)
+        return Result(timetables, complete, self.nodes, [])
+
+    def search(self, chosen, domains, weekly, once, dated, days):
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0 and (
+            time.monotonic() > self.deadline or (self.cancel is not None and self.cancel.is_set())
+        ):
+            raise SearchStopped
+        if not domains:
+            self.record(chosen, weekly)
+            return
+        if len(self.best) == self.limit:
+            # Days every remaining choice will add, whichever section is taken
+            needed = days
+            for options in domains.values():
+                common = 0x7f
+                for option in options:
+                    common &= option.day_mask
+                needed |= common
+            if needed.bit_count() * DAY_WEIGHT_MINUTES >= -self.best[0][0]:
+                return
+
+        subject_id = min(domains, key=lambda key: len(domains[key]))
+        rest = [(key, options) for key, options in domains.items() if key != subject_id]
+        # Sections adding the fewest days first, so good timetables are found early
+        for section in sorted(domains[subject_id], key=lambda section: (section.day_mask & ~days).bit_count()):
+            # Bits the weekly classes of other sections may not take
+            taken = section.weekly | section.once
+            remaining = {}
+            for key, options in rest:
+                left = [option for option in options if not (option.weekly & taken or option.once & section.weekly)]
+                if section.dated:
+                    left = [option for option in left if not option.overlaps_dated(section.dated)]
+                if not left:
+                    break
+                remaining[key] = left
+            else:
+                chosen.append(section)
+                self.search(
+                    chosen, remaining, weekly | section.weekly, once | section.once,
+                    dated + section.dated if section.dated else dated, days | section.day_mask,
+                )
+                chosen.pop()
+
+    def record(self, chosen, weekly):
+        days, gap_minutes, longest_gap = day_profile(weekly)
+        if self.constraints.max_gap_minutes is not None and longest_gap > self.constraints.max_gap_minutes:
+            return
+        score = days * DAY_WEIGHT_MINUTES + gap_minutes
+        if len(self.best) == self.limit and score >= -self.best[0][0]:
+            return
+        timetable = Timetable(sorted(chosen, key=lambda section: section.subject_id), score, days, gap_minutes)
+        heapq.heappush(self.best, (-score, next(self.order), timetable))
+        if len(self.best) > self.limit:
+            heapq.heappop(self.best)
+
+
+def generate(subject_ids, events, fixed_events=(), constraints=Constraints(), limit=5, budget=None, cancel=None):
+    """Return the ``limit`` best conflict-free choices of one section per subject.
+
+    ``events`` are the events of the subjects, and ``fixed_events`` those of
+    a schedule every timetable must fit around. ``cancel`` may be any object
+    with an ``is_set()`` method, such as a ``threading.Event``.
+    """
+    deadline = time.monotonic() + (time_budget() if budget is None else budget)
+    sections = build_sections(subject_ids, events)
+    search = Search(sections, schedule_section(fixed_events), constraints, limit, deadline, cancel)
+    return search.run()
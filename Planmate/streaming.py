@@ -0,0 +1,57 @@
+"""Streaming HTTP responses for large payloads"""
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+def json_array_chunks(items, encoder=DjangoJSONEncoder, chunk_size=16 * 1024):
+    """Yield ``items`` encoded as a JSON array in chunks of about ``chunk_size`` characters.
+
+    Joined together, the chunks are exactly the body of
+    ``JsonResponse(list(items), safe=False, encoder=encoder)``.
+    """
+    encode = encoder().encode
+    chunk, size = ['['], 1
+    separator = ''
+    for item in items:
+        text = separator + encode(item)
+        separator = ', '
+        chunk.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    chunk.append(']')
+    yield ''.join(chunk)
+
+
+async def ajson_array_chunks(items, encoder=DjangoJSONEncoder, chunk_size=16 * 1024):
+    """Async version of ``json_array_chunks`` for an async iterable of ``items``"""
+    encode = encoder().encode
+    chunk, size = ['['], 1
+    separator = ''
+    async for item in items:
+        text = separator + encode(item)
+        separator = ', '
+        chunk.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    chunk.append(']')
+    yield ''.join(chunk)
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """A JSON array response that is encoded while it is sent.
+
+    ``items`` may be an async iterable, which ASGI servers stream without
+    blocking a thread.
+    """
+
+    def __init__(self, items, encoder=DjangoJSONEncoder, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        if hasattr(items, '__aiter__'):
+            chunks = ajson_array_chunks(items, encoder)
+        else:
+            chunks = json_array_chunks(items, encoder)
+        super().__init__(chunks, **kwargs)
@@ -1,8 +1,51 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.management import call_command
+from django.http import JsonResponse
 from django.urls import reverse
-from .models import Subject, Event, Student, Teacher
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .conflicts import conflicting_subject_ids, event_conflicts, find_conflicts, overlaps_schedule
+from . import async_views, changelog, enrollment, ical, metrics, realtime, reminders, signals, solver, timetable, views
+from .forms import EventForm, SubjectForm
+from .models import Subject, Event, Change, Reminder, Student, Teacher, Timetable, TimetableEntry, WaitlistEntry
+from .recurrence import occurrences
+from .streaming import json_array_chunks
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from unittest import mock
+import asyncio
+import importlib
+import io
+import json
+import os
+import random
+import runpy
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+def read_streaming(response):
+    """Read a streamed body, sync or async, which runs its remaining queries"""
+    if response.is_async:
+        async def collect():
+            return b''.join([part async for part in response.streaming_content])
+        return async_to_sync(collect)()
+    return b''.join(response.streaming_content)
+
+def streamed_json(response):
+    return json.loads(read_streaming(response))
 
 class PlanmateModelsTest(TestCase):
     def setUp(self):
@@ -165,4 +208,2312 @@ class PlanmateViewsTest(TestCase):
         
         # Check that the subject is deleted
         with self.assertRaises(Subject.DoesNotExist):
-            Subject.objects.get(id=self.subject.id)
\ No newline at end of file
+            Subject.objects.get(id=self.subject.id)
+
+class PlanmateEventsApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='student',
+            password='studentpass123'
+        )
+        self.student = Student.objects.create(
+            user=self.user,
+            student_id='ST12345'
+        )
+        self.subject = Subject.objects.create(
+            code='CS101',
+            name='Introduction to Computer Science',
+            credits=3,
+            semester='1/2567',
+            created_by=self.user
+        )
+        
+        # One event per month from January to June
+        self.events = []
+        for month in range(1, 7):
+            start = timezone.make_aware(datetime(2025, month, 10, 9, 0))
+            self.events.append(Event.objects.create(
+                subject=self.subject,
+                event_type='class',
+                start_time=start,
+                end_time=start + timedelta(hours=2),
+                location='Room 101'
+            ))
+        self.client.login(username='student', password='studentpass123')
+
+    def test_events_without_window(self):
+        """Test that all events are returned when no range is given"""
+        response = self.client.get(reverse('get_events'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(streamed_json(response)), 6)
+
+    def test_events_within_window(self):
+        """Test that only events overlapping the range are returned"""
+        response = self.client.get(reverse('get_events'), {
+            'start': '2025-03-01T00:00:00+00:00',
+            'end': '2025-05-01T00:00:00+00:00',
+        })
+        self.assertEqual(response.status_code, 200)
+        ids = [event['id'] for event in streamed_json(response)]
+        self.assertEqual(sorted(ids), [self.events[2].id, self.events[3].id])
+
+    def test_events_overlapping_window_edge(self):
+        """Test that an event crossing the start of the range is included"""
+        response = self.client.get(reverse('get_events'), {
+            'start': '2025-01-10T10:00:00+00:00',
+            'end': '2025-01-11T00:00:00+00:00',
+        })
+        ids = [event['id'] for event in streamed_json(response)]
+        self.assertEqual(ids, [self.events[0].id])
+
+    def test_events_invalid_window(self):
+        """Test that an unparseable range is rejected"""
+        response = self.client.get(reverse('get_events'), {'start': 'not-a-date'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PlanmateRecurrenceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='student',
+            password='studentpass123'
+        )
+        Student.objects.create(user=self.user, student_id='ST12345')
+        self.subject = Subject.objects.create(
+            code='CS101',
+            name='Introduction to Computer Science',
+            credits=3,
+            semester='1/2567',
+            created_by=self.user
+        )
+        
+        # Every Monday 09:00-11:00 from 6 January to 31 March 2025
+        self.start = timezone.make_aware(datetime(2025, 1, 6, 9, 0))
+        self.event = Event.objects.create(
+            subject=self.subject,
+            event_type='class',
+            start_time=self.start,
+            end_time=self.start + timedelta(hours=2),
+            location='Room 101',
+            repeat_weekly=True,
+            repeat_until=datetime(2025, 3, 31).date()
+        )
+
+    def test_occurrences_are_bounded_by_window(self):
+        """Test that only occurrences inside the window are generated"""
+        window_start = timezone.make_aware(datetime(2025, 2, 1))
+        window_end = timezone.make_aware(datetime(2025, 3, 1))
+        starts = [occurrence.start_time for occurrence in occurrences(self.event, window_start, window_end)]
+        self.assertEqual([start.day for start in starts], [3, 10, 17, 24])
+
+    def test_occurrences_are_bounded_by_repeat_until(self):
+        """Test that a series stops after its repeat until date"""
+        starts = [occurrence.start_time for occurrence in occurrences(self.event)]
+        self.assertEqual(len(starts), 13)
+        self.assertEqual(starts[-1], timezone.make_aware(datetime(2025, 3, 31, 9, 0)))
+
+    def test_open_series_lasts_one_semester(self):
+        """Test that a series without an end date repeats for one semester"""
+        self.event.repeat_until = None
+        with self.settings(PLANMATE_SEMESTER_WEEKS=4):
+            self.assertEqual(len(list(occurrences(self.event))), 4)
+
+    def test_single_event_outside_window(self):
+        """Test that a non recurring event is skipped outside the window"""
+        self.event.repeat_weekly = False
+        window_start = timezone.make_aware(datetime(2025, 2, 1))
+        self.assertEqual(list(occurrences(self.event, window_start)), [])
+
+    def test_api_expands_recurring_events(self):
+        """Test that the events API returns every occurrence in the window"""
+        self.client.login(username='student', password='studentpass123')
+        response = self.client.get(reverse('get_events'), {
+            'start': '2025-03-01T00:00:00+00:00',
+            'end': '2025-04-15T00:00:00+00:00',
+        })
+        self.assertEqual(response.status_code, 200)
+        starts = [event['start'] for event in streamed_json(response)]
+        self.assertEqual(starts, [
+            '2025-03-03T09:00:00+00:00',
+            '2025-03-10T09:00:00+00:00',
+            '2025-03-17T09:00:00+00:00',
+            '2025-03-24T09:00:00+00:00',
+            '2025-03-31T09:00:00+00:00',
+        ])
+
+    def test_dashboard_lists_next_occurrences(self):
+        """Test that the dashboard shows upcoming occurrences of a series"""
+        self.client.login(username='student', password='studentpass123')
+        now = timezone.make_aware(datetime(2025, 3, 20))
+        with mock.patch('Planmate.views.timezone.now', return_value=now):
+            response = self.client.get(reverse('dashboard'))
+        upcoming_events = response.context['upcoming_events']
+        self.assertEqual([occurrence.start_time.day for occurrence in upcoming_events], [24, 31])
+
+
+class PlanmateQueryCountTest(TestCase):
+    """Views must run a fixed number of queries however many events exist"""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='ownerpass123')
+        self.user = User.objects.create_user(username='student', password='studentpass123')
+        self.student = Student.objects.create(user=self.user, student_id='ST12345')
+        
+        self.own_subject = Subject.objects.create(
+            code='CS101', name='Introduction to Computer Science',
+            credits=3, semester='1/2567', created_by=self.user
+        )
+        self.scheduled = [
+            Subject.objects.create(
+                code=f'MA10{index}', name=f'Mathematics {index}',
+                credits=3, semester='1/2567', created_by=self.owner
+            )
+            for index in range(3)
+        ]
+        self.student.scheduled_subjects.add(*self.scheduled)
+        self.start = timezone.now() + timedelta(days=1)
+
+    def seed_events(self, count):
+        """Create ``count`` events spread over every subject, a third of them weekly"""
+        subjects = [self.own_subject, *self.scheduled]
+        events = Event.objects.bulk_create([
+            Event(
+                subject=subjects[index % len(subjects)],
+                event_type=('class', 'exam', 'lab')[index % 3],
+                start_time=self.start + timedelta(hours=index),
+                end_time=self.start + timedelta(hours=index + 1),
+                location=f'Room {index}',
+                repeat_weekly=index % 3 == 0,
+            )
+            for index in range(count)
+        ])
+        # As the importer does after a bulk insert
+        signals.events_created(events)
+
+    def assertQueriesConstant(self, url, queries):
+        """Assert that ``url`` runs ``queries`` queries with 30 and with 300 events"""
+        self.client.force_login(self.user)
+        for count in (30, 270):
+            self.seed_events(count)
+            # bulk_create sends no signals, so start from a cold feed cache
+            cache.clear()
+            with self.assertNumQueries(queries):
+                response = self.client.get(url)
+                # Streamed bodies run their queries while being read
+                content = read_streaming(response) if response.streaming else response.content
+            self.assertEqual(response.status_code, 200)
+        return response, content
+
+    def test_get_events_queries(self):
+        """Test that the events API does not query per event"""
+        end = (self.start + timedelta(days=60)).isoformat()
+        _, content = self.assertQueriesConstant(
+            reverse('get_events') + '?' + urlencode({'start': self.start.isoformat(), 'end': end}), 4
+        )
+        self.assertGreaterEqual(len(json.loads(content)), 300)
+
+    def test_dashboard_queries(self):
+        """Test that the dashboard does not query per event or subject"""
+        response, _ = self.assertQueriesConstant(reverse('dashboard'), 7)
+        self.assertEqual(len(response.context['upcoming_events']), 5)
+
+    def test_subject_detail_queries(self):
+        """Test that the subject detail page does not query per event"""
+        response, _ = self.assertQueriesConstant(reverse('subject_detail', args=[self.own_subject.id]), 4)
+        self.assertEqual(len(response.context['events']), 76)
+
+
+class PlanmateIndexTest(TestCase):
+    """The hot event queries must be answered from an index, never a table scan"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='student', password='studentpass123')
+        Student.objects.create(user=self.user, student_id='ST12345')
+        subject = Subject.objects.create(
+            code='CS101', name='Introduction to Computer Science',
+            credits=3, semester='1/2567', created_by=self.user
+        )
+        start = timezone.now()
+        Event.objects.bulk_create([
+            Event(
+                subject=subject, event_type='class', location='Room 101',
+                start_time=start + timedelta(days=index),
+                end_time=start + timedelta(days=index, hours=2),
+            )
+            for index in range(50)
+        ])
+        self.client.force_login(self.user)
+
+    def explain_event_queries(self, url):
+        """Return the query plans of the event queries run by ``url``"""
+        captured = []
+
+        def record(execute, sql, params, many, context):
+            if 'Planmate_event' in sql:
+                captured.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = self.client.get(url)
+            if response.streaming:
+                read_streaming(response)
+        self.assertTrue(captured)
+        
+        plans = []
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Small test tables would otherwise always be scanned sequentially
+                cursor.execute('SET enable_seqscan = off')
+                prefix = 'EXPLAIN '
+            else:
+                prefix = 'EXPLAIN QUERY PLAN '
+            for sql, params in captured:
+                cursor.execute(prefix + sql, params)
+                plans.append(' '.join(str(column) for row in cursor.fetchall() for column in row))
+        return plans
+
+    def assertUsesEventIndex(self, plans):
+        for plan in plans:
+            # Windows near the present are read from the timetable instead
+            self.assertRegex(plan, r'event_subject_(start|end)_idx|timetable_user_start_idx')
+            self.assertNotIn('SCAN Planmate_event', plan)
+            self.assertNotIn('Seq Scan on "Planmate_event"', plan)
+
+    def test_calendar_query_uses_index(self):
+        """Test that the events API window query uses a subject/time index"""
+        now = timezone.now()
+        url = reverse('get_events') + '?' + urlencode({
+            'start': now.isoformat(),
+            'end': (now + timedelta(days=35)).isoformat(),
+        })
+        self.assertUsesEventIndex(self.explain_event_queries(url))
+
+    def test_dashboard_query_uses_index(self):
+        """Test that the upcoming events query uses a subject/time index"""
+        self.assertUsesEventIndex(self.explain_event_queries(reverse('dashboard')))
+
+
+class PlanmateFeedCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='ownerpass123')
+        self.user = User.objects.create_user(username='student', password='studentpass123')
+        self.student = Student.objects.create(user=self.user, student_id='ST12345')
+        self.subject = Subject.objects.create(
+            code='CS101', name='Introduction to Computer Science',
+            credits=3, semester='1/2567', created_by=self.owner
+        )
+        self.student.scheduled_subjects.add(self.subject)
+        self.start = timezone.make_aware(datetime(2025, 3, 10, 9, 0))
+        self.event = Event.objects.create(
+            subject=self.subject, event_type='class', location='Room 101',
+            start_time=self.start, end_time=self.start + timedelta(hours=2)
+        )
+        self.url = reverse('get_events') + '?' + urlencode({
+            'start': '2025-03-01T00:00:00+00:00',
+            'end': '2025-04-01T00:00:00+00:00',
+        })
+        self.client.force_login(self.user)
+
+    def test_repeated_request_is_served_from_cache(self):
+        """Test that a warm feed needs no event queries"""
+        first = streamed_json(self.client.get(self.url))
+        # Session, user and the subject version lookup
+        with self.assertNumQueries(3):
+            second = streamed_json(self.client.get(self.url))
+        self.assertEqual(first, second)
+
+    def test_fragments_are_shared_between_users(self):
+        """Test that another student reuses the subject fragment"""
+        streamed_json(self.client.get(self.url))
+        other = User.objects.create_user(username='other', password='otherpass123')
+        Student.objects.create(user=other, student_id='ST54321').scheduled_subjects.add(self.subject)
+        self.client.force_login(other)
+        # Session, user and the subject version lookup, but no event query
+        with self.assertNumQueries(3):
+            events = streamed_json(self.client.get(self.url))
+        self.assertEqual(len(events), 1)
+
+    def test_event_change_invalidates_feed(self):
+        """Test that saving or deleting an event refreshes the feed"""
+        streamed_json(self.client.get(self.url))
+        self.event.location = 'Room 202'
+        self.event.save()
+        events = streamed_json(self.client.get(self.url))
+        self.assertEqual(events[0]['extendedProps']['location'], 'Room 202')
+        
+        self.event.delete()
+        self.assertEqual(streamed_json(self.client.get(self.url)), [])
+
+    def test_subject_change_invalidates_feed(self):
+        """Test that renaming a subject refreshes the event titles"""
+        streamed_json(self.client.get(self.url))
+        self.subject.code = 'CS102'
+        self.subject.save()
+        events = streamed_json(self.client.get(self.url))
+        self.assertTrue(events[0]['title'].startswith('CS102'))
+
+    def test_enrollment_change_updates_feed(self):
+        """Test that scheduling and unscheduling subjects refreshes the feed"""
+        streamed_json(self.client.get(self.url))
+        self.student.scheduled_subjects.remove(self.subject)
+        self.assertEqual(streamed_json(self.client.get(self.url)), [])
+        
+        # Reverse side of the relation
+        self.subject.scheduled_by_students.add(self.student)
+        self.assertEqual(len(streamed_json(self.client.get(self.url))), 1)
+        self.subject.scheduled_by_students.clear()
+        self.assertEqual(streamed_json(self.client.get(self.url)), [])
+
+    def test_cache_metrics(self):
+        """Test that hit and miss counts are exposed to staff"""
+        streamed_json(self.client.get(self.url))
+        streamed_json(self.client.get(self.url))
+        response = self.client.get(reverse('cache_metrics'))
+        self.assertEqual(response.status_code, 302)  # Staff only
+        
+        self.user.is_staff = True
+        self.user.save()
+        stats = self.client.get(reverse('cache_metrics')).json()
+        self.assertGreaterEqual(stats['hits'], 1)
+        self.assertGreaterEqual(stats['misses'], 1)
+        self.assertIsNotNone(stats['hit_ratio'])
+
+
+class PlanmateConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='student', password='studentpass123')
+        self.student = Student.objects.create(user=self.user, student_id='ST12345')
+        self.subject = Subject.objects.create(
+            code='CS101', name='Introduction to Computer Science',
+            credits=3, semester='1/2567', created_by=self.user
+        )
+        start = timezone.make_aware(datetime(2025, 3, 10, 9, 0))
+        self.event = Event.objects.create(
+            subject=self.subject, event_type='class', location='Room 101',
+            start_time=start, end_time=start + timedelta(hours=2)
+        )
+        self.url = reverse('get_events') + '?' + urlencode({
+            'start': '2025-03-01T00:00:00+00:00',
+            'end': '2025-04-01T00:00:00+00:00',
+        })
+        self.client.force_login(self.user)
+
+    def version(self):
+        return Subject.objects.values_list('events_version', flat=True).get(pk=self.subject.pk)
+
+    def test_saves_of_one_instance_bump_version(self):
+        """Test that every save of a loaded subject gets a new version, whatever the instance holds"""
+        loaded = Subject.objects.get(pk=self.subject.pk)
+        etag = self.client.get(self.url).headers['ETag']
+        versions = [self.version()]
+        # An event change bumps the version behind the loaded instance's back
+        self.event.location = 'Room 102'
+        self.event.save()
+        versions.append(self.version())
+        for name in ('Intro to CS', 'Introduction to CS'):
+            loaded.name = name
+            loaded.save()
+            versions.append(self.version())
+        self.assertEqual(versions, sorted(set(versions)))
+        self.assertEqual(loaded.events_version, versions[-1])
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_events_not_modified(self):
+        """Test that an unchanged feed is answered with 304 from one lookup"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response.headers)
+        etag = response.headers['ETag']
+        
+        # Session, user and the subject version lookup, no event rows
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_etag_depends_on_window(self):
+        """Test that another window does not reuse the ETag"""
+        etag = self.client.get(self.url).headers['ETag']
+        response = self.client.get(reverse('get_events'), {'start': '2025-04-01T00:00:00+00:00'},
+                                   headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_event_change_modifies_etag(self):
+        """Test that editing an event changes the ETag"""
+        etag = self.client.get(self.url).headers['ETag']
+        self.event.location = 'Room 202'
+        self.event.save()
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_enrollment_change_modifies_etag(self):
+        """Test that scheduling another subject changes the ETag"""
+        etag = self.client.get(self.url).headers['ETag']
+        other = Subject.objects.create(code='MA101', name='Calculus', credits=3, semester='1/2567')
+        self.student.scheduled_subjects.add(other)
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_calendar_page_not_modified(self):
+        """Test that the calendar page supports conditional requests"""
+        response = self.client.get(reverse('calendar_view'))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('calendar_view'), headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_calendar_modal_lists_own_subjects(self):
+        """Test that events can only be added to the user's own subjects, through reversed API URLs"""
+        other = Subject.objects.create(code='MA101', name='Calculus', credits=3, semester='1/2567')
+        self.student.scheduled_subjects.add(other)
+        response = self.client.get(reverse('calendar_view'))
+        self.assertEqual([subject.code for subject in response.context['own_subjects']], ['CS101'])
+        self.assertContains(response, f'data-events-url="{reverse("subject_events_api", args=[self.subject.pk])}"')
+        self.assertContains(response, f'data-event-url="{reverse("event_api", args=[0])}"')
+        self.assertNotContains(response, 'MA101 - Calculus')
+
+
+class PlanmateConflictTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='ownerpass123')
+        self.user = User.objects.create_user(username='student', password='studentpass123')
+        self.student = Student.objects.create(user=self.user, student_id='ST12345')
+        self.cs = Subject.objects.create(
+            code='CS101', name='Introduction to Computer Science',
+            credits=3, semester='1/2567', created_by=self.owner
+        )
+        self.ma = Subject.objects.create(
+            code='MA101', name='Calculus', credits=3, semester='1/2567', created_by=self.owner
+        )
+        
+        # CS101 every Monday 09:00-11:00 for ten weeks
+        self.monday = timezone.make_aware(datetime(2025, 1, 6, 9, 0))
+        self.lecture = Event.objects.create(
+            subject=self.cs, event_type='class', location='Room 101',
+            start_time=self.monday, end_time=self.monday + timedelta(hours=2),
+            repeat_weekly=True, repeat_until=(self.monday + timedelta(weeks=9)).date()
+        )
+
+    def event_data(self, subject, start, hours=2, location='Room 202', **extra):
+        return {
+            'subject': subject.id,
+            'event_type': 'exam',
+            'start_time': start.strftime('%Y-%m-%dT%H:%M'),
+            'end_time': (start + timedelta(hours=hours)).strftime('%Y-%m-%dT%H:%M'),
+            'location': location,
+            **extra,
+        }
+
+    def test_find_conflicts_with_recurring_series(self):
+        """Test that a single event overlapping a later week is reported"""
+        start = self.monday + timedelta(weeks=3, hours=1)
+        exam = Event(subject=self.ma, event_type='exam', location='Hall',
+                     start_time=start, end_time=start + timedelta(hours=2))
+        conflicts = find_conflicts([exam], [self.lecture])
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual(conflicts[0].other.start_time, self.monday + timedelta(weeks=3))
+
+    def test_back_to_back_events_do_not_conflict(self):
+        """Test that an event starting when another ends is allowed"""
+        start = self.monday + timedelta(hours=2)
+        lab = Event(subject=self.ma, event_type='lab', location='Lab 1',
+                    start_time=start, end_time=start + timedelta(hours=2), repeat_weekly=True)
+        self.assertEqual(find_conflicts([lab], [self.lecture]), [])
+
+    def test_conflicting_subject_ids(self):
+        """Test filtering a catalog down to subjects that clash with a timetable"""
+        catalog = [
+            Event(subject_id=self.ma.id, start_time=self.monday + timedelta(weeks=5, minutes=30),
+                  end_time=self.monday + timedelta(weeks=5, hours=1)),
+            Event(subject_id=999, start_time=self.monday + timedelta(days=1),
+                  end_time=self.monday + timedelta(days=1, hours=1), repeat_weekly=True),
+        ]
+        self.assertEqual(conflicting_subject_ids([self.lecture], catalog), {self.ma.id})
+
+    def test_overlaps_schedule(self):
+        """Test the yes/no check of subjects against a student's schedule"""
+        self.student.scheduled_subjects.add(self.cs)
+        self.assertFalse(overlaps_schedule(self.student, [self.ma]))
+        
+        start = self.monday + timedelta(weeks=6, hours=1)
+        Event.objects.create(subject=self.ma, event_type='exam', location='Hall',
+                             start_time=start, end_time=start + timedelta(hours=2))
+        self.assertTrue(overlaps_schedule(self.student, [self.ma]))
+        self.assertFalse(overlaps_schedule(self.student, [self.cs]))
+
+    def test_form_rejects_same_location_overlap(self):
+        """Test that a room cannot be double booked"""
+        start = self.monday + timedelta(weeks=2)
+        form = EventForm(self.event_data(self.ma, start, location='Room 101'))
+        self.assertFalse(form.is_valid())
+        self.assertIn('overlaps CS101', str(form.non_field_errors()))
+        
+        form = EventForm(self.event_data(self.ma, start, location='Room 303'))
+        self.assertTrue(form.is_valid())
+
+    def test_room_names_ignore_case_and_placeholders(self):
+        """Test that rooms match whatever their case, while placeholder and blank locations never clash"""
+        start = self.monday + timedelta(weeks=2)
+        form = EventForm(self.event_data(self.ma, start, location=' room 101 '))
+        self.assertFalse(form.is_valid())
+        
+        Event.objects.filter(pk=self.lecture.pk).update(location=' ROOM 101  ')
+        form = EventForm(self.event_data(self.ma, start, location='room 101'))
+        self.assertFalse(form.is_valid())
+        
+        for location in ('Online', 'online', 'TBA'):
+            Event.objects.filter(pk=self.lecture.pk).update(location=location)
+            form = EventForm(self.event_data(self.ma, start, location=location))
+            self.assertTrue(form.is_valid(), location)
+        
+        Event.objects.filter(pk=self.lecture.pk).update(location='')
+        event = Event(subject=self.ma, event_type='lab', location='', start_time=start,
+                      end_time=start + timedelta(hours=2))
+        self.assertEqual(event_conflicts(event), [])
+        with self.settings(PLANMATE_SHARED_LOCATIONS=[]):
+            Event.objects.filter(pk=self.lecture.pk).update(location='Online')
+            form = EventForm(self.event_data(self.ma, start, location='Online'))
+            self.assertFalse(form.is_valid())
+
+    def test_form_rejects_same_subject_overlap(self):
+        """Test that events of one subject cannot overlap"""
+        start = self.monday + timedelta(weeks=4, hours=1)
+        form = EventForm(self.event_data(self.cs, start))
+        self.assertFalse(form.is_valid())
+
+    def test_form_allows_editing_event_in_place(self):
+        """Test that an edited event is not compared with itself"""
+        data = self.event_data(self.cs, self.monday, location='Room 101', repeat_weekly='on')
+        form = EventForm(data, instance=self.lecture)
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_enroll_rejects_conflicting_subject(self):
+        """Test that a student cannot schedule overlapping subjects"""
+        self.student.scheduled_subjects.add(self.cs)
+        start = self.monday + timedelta(weeks=1, hours=1)
+        Event.objects.create(subject=self.ma, event_type='class', location='Room 202',
+                             start_time=start, end_time=start + timedelta(hours=2))
+        self.client.force_login(self.user)
+        
+        response = self.client.get(reverse('enroll_subject', args=[self.ma.id]), follow=True)
+        self.assertIn('overlaps CS101', str(list(response.context['messages'])[0]))
+        self.assertFalse(self.student.scheduled_subjects.filter(id=self.ma.id).exists())
+
+
+class PlanmateSubjectCatalogTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='testpass123')
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        Subject.objects.bulk_create([
+            Subject(code=f'CS{i:03d}', name=f'Computing {i}', credits=1 + i % 3,
+                    semester='1/2567' if i % 2 else '2/2567', created_by=self.owner)
+            for i in range(120)
+        ] + [
+            Subject(code='MA101', name='Calculus', credits=3, semester='1/2567', created_by=self.owner),
+        ])
+        self.client.force_login(self.user)
+
+    def get_catalog(self, **params):
+        response = self.client.get(reverse('subject_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['catalog']
+
+    def test_catalog_is_paginated_by_code(self):
+        """Test that the catalog is served in keyset pages that can be walked both ways"""
+        first = self.get_catalog()
+        self.assertEqual(len(first['subjects']), views.CATALOG_PAGE_SIZE)
+        self.assertEqual(first['subjects'][0].code, 'CS000')
+        self.assertIsNone(first['previous_query'])
+        
+        second = self.get_catalog(after=first['subjects'][-1].code)
+        self.assertEqual(second['subjects'][0].code, 'CS050')
+        self.assertEqual(second['previous_query'], 'before=CS050')
+        
+        back = self.get_catalog(before='CS050')
+        self.assertEqual([s.code for s in back['subjects']], [s.code for s in first['subjects']])
+        self.assertIsNone(back['previous_query'])
+        
+        last = self.get_catalog(after='CS099')
+        self.assertEqual(last['subjects'][-1].code, 'MA101')
+        self.assertIsNone(last['next_query'])
+
+    def test_catalog_filters(self):
+        """Test the code prefix, name, semester and credits filters"""
+        self.assertEqual(len(self.get_catalog(code='cs11')['subjects']), 10)
+        self.assertEqual([s.code for s in self.get_catalog(q='calc')['subjects']], ['MA101'])
+        
+        catalog = self.get_catalog(semester='2/2567', credits='1', code='CS')
+        self.assertTrue(all(s.semester == '2/2567' and s.credits == 1 for s in catalog['subjects']))
+        self.assertEqual(len(catalog['subjects']), 20)
+        
+        catalog = self.get_catalog(code='CS0')
+        self.assertEqual(catalog['next_query'], 'code=CS0&after=CS049')
+
+    def test_catalog_text_filter_uses_search_index(self):
+        """Test that the q filter matches words of the code, name and description like the search"""
+        Subject.objects.create(code='PH101', name='Physics', description='Mechanics and waves', credits=3,
+                               semester='1/2567', created_by=self.owner)
+        self.assertEqual([s.code for s in self.get_catalog(q='mechan')['subjects']], ['PH101'])
+        self.assertEqual([s.code for s in self.get_catalog(q='ma101')['subjects']], ['MA101'])
+        self.assertEqual(self.get_catalog(q='"*')['subjects'], [])
+
+    def test_lowercase_codes_are_stored_in_upper_case(self):
+        """Test that codes entered in any case are found by the code prefix filter"""
+        form = SubjectForm({'code': ' ph101 ', 'name': 'Physics', 'credits': 3, 'semester': '1/2567'})
+        self.assertTrue(form.is_valid())
+        form.instance.created_by = self.owner
+        form.save()
+        Subject.objects.create(code='Ph102', name='Physics II', credits=3, semester='1/2567', created_by=self.owner)
+        self.assertEqual([s.code for s in self.get_catalog(code='ph')['subjects']], ['PH101', 'PH102'])
+        
+        duplicate = SubjectForm({'code': 'Ma101', 'name': 'Calculus', 'credits': 3, 'semester': '1/2567'})
+        self.assertIn('code', duplicate.errors)
+
+    def test_migration_resolves_codes_clashing_in_case(self):
+        """Test that existing codes are upper-cased, with a suffix where that would clash"""
+        from django.apps import apps
+        migration = importlib.import_module('Planmate.migrations.0015_normalize_subject_codes')
+        Subject.objects.filter(code='MA101').update(code='ma101')
+        Subject.objects.filter(code='CS000').update(code='Ma101')
+        Subject.objects.filter(code='CS001').update(code='ph101 ')
+        migration.normalize_codes(apps, None)
+        self.assertEqual(
+            list(Subject.objects.filter(code__in=['MA101', 'MA101-2', 'PH101']).order_by('code').values_list('code', flat=True)),
+            ['MA101', 'MA101-2', 'PH101'],
+        )
+        subject = Subject.objects.get(code='MA101-2')
+        subject.name = 'Renamed'
+        subject.save()
+
+    def test_catalog_excludes_own_subjects(self):
+        """Test that the catalog only lists other users' subjects"""
+        Subject.objects.create(code='AA100', name='Mine', credits=3, semester='1/2567', created_by=self.user)
+        codes = [s.code for s in self.get_catalog(code='AA')['subjects']]
+        self.assertEqual(codes, [])
+
+
+class PlanmateSubjectSearchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='testpass123')
+        Subject.objects.create(code='CS101', name='Introduction to Programming', credits=3,
+                               semester='1/2567', description='Python basics')
+        Subject.objects.create(code='CS201', name='Data Structures', credits=3,
+                               semester='1/2567', description='Lists, trees and programming exercises')
+        Subject.objects.create(code='MA101', name='Calculus', credits=3, semester='1/2567')
+        Subject.objects.create(code='TH101', name='การเขียนโปรแกรมเบื้องต้น', credits=3, semester='1/2567')
+        self.client.force_login(self.user)
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('subject_search'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [result['code'] for result in response.json()['results']]
+
+    def test_code_prefix_matches_come_first(self):
+        """Test that a code prefix lists the matching subjects in code order"""
+        self.assertEqual(self.search('cs'), ['CS101', 'CS201'])
+        self.assertEqual(self.search('CS2'), ['CS201'])
+
+    def test_full_text_ranks_name_above_description(self):
+        """Test that name matches rank above description matches"""
+        self.assertEqual(self.search('progr'), ['CS101', 'CS201'])
+        self.assertEqual(self.search('data struct'), ['CS201'])
+        self.assertEqual(self.search('การเขียน'), ['TH101'])
+
+    def test_index_follows_subject_changes(self):
+        """Test that created, renamed and deleted subjects are searchable immediately"""
+        subject = Subject.objects.get(code='MA101')
+        subject.name = 'Linear Algebra'
+        subject.save()
+        self.assertEqual(self.search('calculus'), [])
+        self.assertEqual(self.search('algebra'), ['MA101'])
+        
+        subject.delete()
+        self.assertEqual(self.search('algebra'), [])
+
+    def test_query_syntax_and_limit(self):
+        """Test that search syntax characters are ignored and results are capped"""
+        self.assertEqual(self.search('"prog*" OR ('), [])
+        self.assertEqual(self.search('  '), [])
+        self.assertEqual(self.search('cs', limit=1), ['CS101'])
+
+
+class PlanmateTimetableImportTest(TestCase):
+    CSV = (
+        'code,name,credits,semester,event_type,start_time,end_time,location,repeat_weekly,repeat_until\n'
+        'CS101,Programming,3,1/2567,class,2025-06-09 09:00,2025-06-09 11:00,Room 101,true,2025-10-10\n'
+        'CS101,,,,lab,2025-06-10 13:00,2025-06-10 16:00,Lab 1,false,\n'
+        'CS101,,,,exam,2025-06-11 13:00,2025-06-11 12:00,Hall,false,\n'
+        'MA101,Calculus,3,1/2567,,,,,,\n'
+        'MA101,,,,quiz,2025-06-12 09:00,2025-06-12 10:00,Room 2,false,\n'
+        ',Nameless,3,1/2567,class,2025-06-12 09:00,2025-06-12 10:00,Room 2,false,\n'
+    )
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='registrar', password='testpass123')
+
+    def run_command(self, content, suffix='.csv', **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, encoding='utf-8') as file:
+            file.write(content)
+            file.flush()
+            stdout, stderr = io.StringIO(), io.StringIO()
+            call_command('import_timetable', file.name, user='registrar', stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_command_imports_rows_and_reports_errors(self):
+        """Test that valid rows are imported and invalid rows are reported without aborting"""
+        stdout, stderr = self.run_command(self.CSV, batch_size=1)
+        self.assertIn('created 2 subjects and 2 events, skipped 3 invalid rows', stdout)
+        self.assertIn('Line 4: End time must be after start time.', stderr)
+        self.assertIn('Line 6: event_type:', stderr)
+        self.assertIn('Line 7: code:', stderr)
+        
+        cs = Subject.objects.get(code='CS101')
+        self.assertEqual(cs.created_by, self.user)
+        self.assertEqual(cs.events_version, 3)
+        lecture = cs.event_set.get(event_type='class')
+        self.assertTrue(lecture.repeat_weekly)
+        self.assertEqual(str(lecture.repeat_until), '2025-10-10')
+        self.assertFalse(Event.objects.filter(subject__code='MA101').exists())
+
+    def test_json_array_and_lines(self):
+        """Test that JSON arrays and JSON Lines files are streamed row by row"""
+        rows = [
+            {'code': 'PH101', 'name': 'Physics', 'credits': 3, 'semester': '1/2567', 'event_type': 'class',
+             'start_time': f'2025-06-{day:02d}T09:00:00+07:00', 'end_time': f'2025-06-{day:02d}T10:00:00+07:00',
+             'location': 'Room 9', 'repeat_weekly': False}
+            for day in range(1, 29)
+        ]
+        with mock.patch('Planmate.importer.CHUNK_SIZE', 100):
+            stdout, _ = self.run_command(json.dumps(rows), suffix='.json')
+        self.assertIn('created 1 subjects and 28 events', stdout)
+        
+        stdout, stderr = self.run_command('\n'.join(json.dumps(row) for row in rows[:2]) + '\n[1]\n', suffix='.jsonl')
+        self.assertIn('created 0 subjects and 2 events', stdout)
+        self.assertIn('Line 3: Not a JSON object.', stderr)
+        
+        Event.objects.all().delete()
+        stdout, stderr = self.run_command(json.dumps(rows[:10])[:-20], suffix='.json')
+        self.assertIn('created 0 subjects and 9 events, skipped 1 invalid rows', stdout)
+        self.assertIn('Line 10: The JSON file is truncated or malformed, the rest of the file was skipped.', stderr)
+
+    def test_unreadable_lines_are_reported(self):
+        """Test that undecodable bytes and malformed CSV are reported at their line, keeping the rows before"""
+        header, lecture, lab = self.CSV.splitlines()[:3]
+        stdout, stderr = self.run_command('\n'.join([header, lecture, lab.replace('Lab 1', 'x' * 200000)]) + '\n')
+        self.assertIn('created 1 subjects and 1 events, skipped 1 invalid rows', stdout)
+        self.assertIn('Line 3: Malformed CSV (field larger than field limit', stderr)
+        
+        self.client.force_login(self.user)
+        content = f'{header}\n{lab}\n'.encode() + b'CS101,,,,lab,\xff\n' + lab.encode()
+        response = self.client.post(reverse('timetable_import'), {'file': SimpleUploadedFile('more.csv', content)})
+        self.assertEqual(response.context['report'].events_created, 1)
+        self.assertContains(response, 'Line 3: Not valid UTF-8 text, the rest of the file was skipped.')
+        
+        content = b'{"code": "CS101"}\n{"code": "\xe0\x80"}\n'
+        response = self.client.post(reverse('timetable_import'), {'file': SimpleUploadedFile('more.jsonl', content)})
+        self.assertEqual([str(error) for error in response.context['report'].errors],
+                         ['Line 2: Not valid UTF-8 text, the rest of the file was skipped.'])
+
+    def test_subjects_of_other_users_are_rejected(self):
+        """Test that an import cannot add events to another user's subject"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        Subject.objects.create(code='CS101', name='Other', credits=3, semester='1/2567', created_by=other)
+        stdout, stderr = self.run_command(self.CSV)
+        self.assertIn('Subject CS101 belongs to another user.', stderr)
+        self.assertFalse(Event.objects.filter(subject__code='CS101').exists())
+
+    def test_upload_view(self):
+        """Test that the upload view imports the file and lists row errors"""
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('timetable.csv', self.CSV.encode())
+        response = self.client.post(reverse('timetable_import'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['report'].events_created, 2)
+        self.assertContains(response, 'Line 4: End time must be after start time.')
+        
+        upload = SimpleUploadedFile('timetable.xlsx', b'code')
+        response = self.client.post(reverse('timetable_import'), {'file': upload})
+        self.assertIsNone(response.context['report'])
+        self.assertTrue(response.context['form'].errors)
+
+
+class PlanmateIcalExportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='student', password='testpass123')
+        self.subject = Subject.objects.create(code='CS101', name='Programming, Basics', credits=3,
+                                              semester='1/2567', created_by=self.user)
+        start = timezone.make_aware(datetime(2025, 6, 9, 9, 0))
+        self.lecture = Event.objects.create(
+            subject=self.subject, event_type='class', location='Room 101',
+            start_time=start, end_time=start + timedelta(hours=2),
+            repeat_weekly=True, repeat_until=start.date() + timedelta(weeks=15),
+        )
+        Event.objects.create(
+            subject=self.subject, event_type='exam', location='Hall; North', notes='ห้ามนำเอกสารเข้าห้องสอบ ' * 5,
+            start_time=start + timedelta(days=2), end_time=start + timedelta(days=2, hours=3),
+        )
+
+    def feed_url(self, user=None):
+        user = user or self.user
+        return reverse('calendar_feed', kwargs={'user_id': user.id, 'token': ical.feed_token(user)})
+
+    def test_export_writes_series_as_rrule(self):
+        """Test that a weekly series is exported once with an RRULE"""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export_ics'))
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = b''.join(response.streaming_content).decode()
+        
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+        self.assertIn('DTSTART:20250609T090000Z\r\n', body)
+        self.assertIn('RRULE:FREQ=WEEKLY;COUNT=16\r\n', body)
+        self.assertIn('LOCATION:Hall\\; North\r\n', body)
+        self.assertIn('DESCRIPTION:Programming\\, Basics\r\n', body)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split('\r\n')))
+        unfolded = body.replace('\r\n ', '')
+        self.assertIn('ห้ามนำเอกสารเข้าห้องสอบ ' * 5, unfolded)
+
+    def test_feed_requires_valid_token(self):
+        """Test that the subscription feed works without a session but needs the token"""
+        response = self.client.get(self.feed_url())
+        self.assertEqual(response.status_code, 200)
+        
+        bad_url = reverse('calendar_feed', kwargs={'user_id': self.user.id, 'token': 'x' * 32})
+        self.assertEqual(self.client.get(bad_url).status_code, 404)
+        
+        old_url = self.feed_url()
+        self.user.set_password('changed-password')
+        self.user.save()
+        self.assertEqual(self.client.get(old_url).status_code, 404)
+
+    def test_feed_answers_not_modified(self):
+        """Test that polling an unchanged feed returns 304 without loading events"""
+        response = self.client.get(self.feed_url())
+        etag = response['ETag']
+        b''.join(response.streaming_content)
+        
+        with self.assertNumQueries(2):
+            response = self.client.get(self.feed_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        self.lecture.location = 'Room 102'
+        self.lecture.save()
+        response = self.client.get(self.feed_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class PlanmateStreamingJsonTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='teacher', password='testpass123')
+        start = timezone.make_aware(datetime(2025, 3, 3, 9, 0))
+        for index in range(5):
+            subject = Subject.objects.create(code=f'CS10{index}', name=f'วิชา "{index}"', credits=3,
+                                             semester='1/2567', created_by=self.user)
+            Event.objects.create(subject=subject, event_type=('class', 'exam', 'lab')[index % 3],
+                                 location=f'Room {index}', notes='a\nb', repeat_weekly=index % 2 == 0,
+                                 start_time=start + timedelta(days=index),
+                                 end_time=start + timedelta(days=index, hours=2))
+        self.client.force_login(self.user)
+
+    def test_chunks_match_json_response(self):
+        """Test that the streamed array is byte-identical to JsonResponse"""
+        items = [{'name': 'ไทย', 'when': timezone.now(), 'n': index, 'nested': [1, None]} for index in range(50)]
+        for chunk_size in (1, 100, 16 * 1024):
+            body = ''.join(json_array_chunks(iter(items), chunk_size=chunk_size)).encode()
+            self.assertEqual(body, JsonResponse(items, safe=False).content)
+        self.assertEqual(''.join(json_array_chunks([])), '[]')
+
+    def test_events_feed_is_byte_compatible(self):
+        """Test that the streamed feed equals the previous JsonResponse body across subject batches"""
+        params = {'start': '2025-03-01T00:00:00+00:00', 'end': '2025-04-01T00:00:00+00:00'}
+        window = (parse_datetime(params['start']), parse_datetime(params['end']))
+        subject_ids = sorted(Subject.objects.values_list('id', flat=True))
+        fragments = views.build_event_fragments(subject_ids, *window)
+        expected = JsonResponse([event for pk in subject_ids for event in fragments.get(pk, [])], safe=False)
+        
+        with mock.patch.object(views, 'FEED_SUBJECT_BATCH', 2):
+            response = self.client.get(reverse('get_events'), params)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(read_streaming(response), expected.content)
+
+
+class PlanmateAsyncViewsTest(TestCase):
+    """The async views must answer exactly like their sync counterparts"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='student', password='studentpass123')
+        self.student = Student.objects.create(user=self.user, student_id='ST12345')
+        owner = User.objects.create_user(username='owner', password='ownerpass123')
+        own = Subject.objects.create(code='CS101', name='Programming', credits=3,
+                                     semester='1/2567', created_by=self.user)
+        scheduled = Subject.objects.create(code='MA101', name='Calculus', credits=3,
+                                           semester='1/2567', created_by=owner)
+        self.student.scheduled_subjects.add(scheduled)
+        start = timezone.now() + timedelta(days=1)
+        for index, subject in enumerate([own, scheduled] * 3):
+            Event.objects.create(subject=subject, event_type='class', location=f'Room {index}',
+                                 start_time=start + timedelta(hours=3 * index),
+                                 end_time=start + timedelta(hours=3 * index + 1), repeat_weekly=index == 0)
+        self.params = {
+            'start': timezone.now().isoformat(),
+            'end': (timezone.now() + timedelta(days=30)).isoformat(),
+        }
+
+    def build_request(self, factory, path, data=None, **headers):
+        request = factory.get(path, data or {}, headers=headers)
+        request.user = self.user
+        
+        async def auser():
+            return self.user
+        request.auser = auser
+        request.session = SessionStore()
+        request._messages = FallbackStorage(request)
+        return request
+
+    async def test_get_events_matches_sync_view(self):
+        """Test that the async events API streams the same body and ETag"""
+        expected = await sync_to_async(views.get_events)(
+            self.build_request(RequestFactory(), '/api/events/', self.params)
+        )
+        expected_body = await sync_to_async(read_streaming)(expected)
+        
+        await cache.aclear()
+        response = await async_views.get_events(
+            self.build_request(AsyncRequestFactory(), '/api/events/', self.params)
+        )
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([part async for part in response.streaming_content]), expected_body)
+        self.assertEqual(response['ETag'], expected['ETag'])
+        self.assertEqual(len(json.loads(expected_body)), 10)
+        
+        response = await async_views.get_events(self.build_request(
+            AsyncRequestFactory(), '/api/events/', self.params, if_none_match=expected['ETag'],
+        ))
+        self.assertEqual(response.status_code, 304)
+
+    async def test_event_fragments_match_sync_builder(self):
+        """Test that the async fragment builder fetches and serializes the same events"""
+        subject_ids = [subject_id async for subject_id in Subject.objects.values_list('id', flat=True)]
+        window_start = timezone.now()
+        window_end = window_start + timedelta(days=30)
+        expected = await sync_to_async(views.build_event_fragments)(subject_ids, window_start, window_end)
+        fragments = await async_views.abuild_event_fragments(subject_ids, window_start, window_end)
+        self.assertEqual(fragments, expected)
+        self.assertEqual(sum(map(len, fragments.values())), 10)
+
+    async def test_dashboard_and_calendar(self):
+        """Test that the async dashboard and calendar render the user's subjects"""
+        response = await async_views.dashboard(self.build_request(AsyncRequestFactory(), '/dashboard/'))
+        self.assertContains(response, 'MA101 - Calculus')
+        self.assertContains(response, 'CS101 - Class')
+        
+        response = await async_views.calendar_view(self.build_request(AsyncRequestFactory(), '/calendar/'))
+        self.assertContains(response, 'CS101 - Programming')
+        etag = response['ETag']
+        response = await async_views.calendar_view(
+            self.build_request(AsyncRequestFactory(), '/calendar/', if_none_match=etag)
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class PlanmateDatabaseSettingsTest(TestCase):
+    """Connection reuse and pooling are configured from the environment"""
+
+    def load_settings(self, **environ):
+        with mock.patch.dict(os.environ, environ, clear=True):
+            return runpy.run_path(os.path.join(settings.BASE_DIR, 'Classscheduler', 'settings.py'))['DATABASES']['default']
+
+    def test_persistent_connections_by_default(self):
+        """Test that connections are kept and health checked without a pool"""
+        database = self.load_settings()
+        self.assertEqual(database['CONN_MAX_AGE'], 60)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertFalse(database['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertNotIn('pool', database['OPTIONS'])
+
+    def test_transaction_pooler_disables_server_side_cursors(self):
+        """Test that the transaction mode port turns off named cursors"""
+        self.assertTrue(self.load_settings(DB_PORT='6543')['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertFalse(self.load_settings(DB_PORT='6543', DB_POOL_MODE='session')['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertTrue(self.load_settings(DB_POOL_MODE='transaction')['DISABLE_SERVER_SIDE_CURSORS'])
+
+    def test_connection_pool(self):
+        """Test that a pool size enables the psycopg pool instead of CONN_MAX_AGE"""
+        database = self.load_settings(DB_POOL_MAX_SIZE='8', DB_POOL_TIMEOUT='2.5')
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertEqual(database['OPTIONS']['pool'], {'min_size': 1, 'max_size': 8, 'timeout': 2.5})
+
+
+class PlanmateRequestProfilingTest(TestCase):
+    """Every request is profiled per URL name and exposed at /metrics"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='student', password='studentpass123')
+        self.subject = Subject.objects.create(code='CS101', name='Programming', credits=3,
+                                              semester='1/2567', created_by=self.user)
+        start = timezone.now() + timedelta(days=1)
+        Event.objects.create(subject=self.subject, event_type='class', location='Room 1',
+                             start_time=start, end_time=start + timedelta(hours=1))
+        self.client.login(username='student', password='studentpass123')
+
+    def test_records_queries_templates_and_size(self):
+        """Test that a rendered page records its queries, template time and size"""
+        count, queries = metrics.request_queries.get(('dashboard',))
+        template_seconds = metrics.request_template_seconds.get(('dashboard',))[1]
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('dashboard'))
+        self.assertEqual(metrics.request_queries.get(('dashboard',)), (count + 1, queries + len(captured)))
+        self.assertGreater(metrics.request_template_seconds.get(('dashboard',))[1], template_seconds)
+        self.assertEqual(metrics.response_bytes.get(('dashboard',))[0], count + 1)
+
+    def test_streaming_response_is_recorded_when_sent(self):
+        """Test that queries and bytes of a streamed body are counted once it is read"""
+        params = {
+            'start': timezone.now().isoformat(),
+            'end': (timezone.now() + timedelta(days=7)).isoformat(),
+        }
+        count, size = metrics.response_bytes.get(('get_events',))
+        response = self.client.get(reverse('get_events'), params)
+        self.assertEqual(metrics.response_bytes.get(('get_events',))[0], count)
+        body = read_streaming(response)
+        self.assertEqual(metrics.response_bytes.get(('get_events',)), (count + 1, size + len(body)))
+
+    def test_slow_requests_are_logged(self):
+        """Test that requests over the query threshold are logged with their slowest queries"""
+        slow = metrics.slow_requests.get(('subject_list',))
+        with self.settings(PLANMATE_SLOW_REQUEST_QUERIES=1):
+            with self.assertLogs('Planmate.profiling', 'WARNING') as logs:
+                self.client.get(reverse('subject_list'))
+        self.assertIn('Slow request GET /subjects/ (subject_list)', logs.output[0])
+        self.assertIn('SELECT', logs.output[1])
+        self.assertEqual(metrics.slow_requests.get(('subject_list',)), slow + 1)
+
+    def test_metrics_endpoint(self):
+        """Test that /metrics serves Prometheus histograms to staff or a bearer token"""
+        self.client.get(reverse('dashboard'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with self.settings(PLANMATE_METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.PROMETHEUS_CONTENT_TYPE)
+        text = response.content.decode()
+        self.assertIn('# TYPE planmate_request_queries histogram', text)
+        self.assertIn('planmate_request_queries_bucket{view="dashboard",le="10"}', text)
+        self.assertIn('planmate_request_duration_seconds_count{view="dashboard"}', text)
+        self.assertIn('planmate_feed_cache_hits_total ', text)
+        
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that the exposition counts observations at or below each bound"""
+        histogram = metrics.Histogram('planmate_test_values', 'Test values', (1, 5), ('view',))
+        metrics.REGISTRY.remove(histogram)
+        for value in (0, 1, 3, 7):
+            histogram.observe(value, ('a"b',))
+        lines = list(histogram.prometheus_lines())
+        self.assertIn('planmate_test_values_bucket{view="a\\"b",le="1"} 2', lines)
+        self.assertIn('planmate_test_values_bucket{view="a\\"b",le="5"} 3', lines)
+        self.assertIn('planmate_test_values_bucket{view="a\\"b",le="+Inf"} 4', lines)
+        self.assertIn('planmate_test_values_sum{view="a\\"b"} 11', lines)
+
+
+class PlanmateSeedBenchmarkTest(TestCase):
+    def seed(self, prefix):
+        call_command('seed_benchmark', users=4, subjects=10, events=200, enrollments=3, recurring=0.5,
+                     prefix=prefix, stdout=io.StringIO())
+
+    def test_seed_generates_reproducible_data(self):
+        """Test that the generator creates students, enrollments and weekly series from a fixed seed"""
+        self.seed('one')
+        self.seed('two')
+        self.assertEqual(Student.objects.count(), 8)
+        self.assertEqual(Student.scheduled_subjects.through.objects.count(), 8 * 3)
+        self.assertTrue(User.objects.get(username='one_user0').check_password('benchmark'))
+        events = Event.objects.filter(subject__code__startswith='ONE')
+        self.assertEqual(events.count(), 200)
+        self.assertTrue(0 < events.filter(repeat_weekly=True).count() < 200)
+        self.assertTrue(events.filter(repeat_until__isnull=False).exists())
+        # The same seed gives the same catalog whatever the prefix
+        self.assertEqual(self.subject_names('ONE'), self.subject_names('TWO'))
+
+    def subject_names(self, prefix):
+        names = Subject.objects.filter(code__startswith=prefix).order_by('code').values_list('name', flat=True)
+        return [name.rsplit(' ', 1)[0] for name in names]
+
+
+class PlanmateTimetableTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='ownerpass123')
+        self.user = User.objects.create_user(username='student', password='studentpass123')
+        self.student = Student.objects.create(user=self.user, student_id='ST12345')
+        self.subject = Subject.objects.create(
+            code='CS101', name='Introduction to Computer Science',
+            credits=3, semester='1/2567', created_by=self.owner
+        )
+        self.other_subject = Subject.objects.create(
+            code='MA101', name='Calculus', credits=3, semester='1/2567', created_by=self.owner
+        )
+        self.student.scheduled_subjects.add(self.subject, self.other_subject)
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        self.weekly = Event.objects.create(
+            subject=self.subject, event_type='class', location='Room 101', repeat_weekly=True,
+            start_time=self.start, end_time=self.start + timedelta(hours=2),
+            repeat_until=(self.start + timedelta(weeks=3)).date(),
+        )
+        self.exam = Event.objects.create(
+            subject=self.other_subject, event_type='exam', location='Hall',
+            start_time=self.start + timedelta(days=2), end_time=self.start + timedelta(days=2, hours=3),
+        )
+        self.params = {
+            'start': (self.start - timedelta(days=1)).isoformat(),
+            'end': (self.start + timedelta(days=35)).isoformat(),
+        }
+        self.client.force_login(self.user)
+
+    def entries(self, user=None):
+        return list(
+            TimetableEntry.objects.filter(user=user or self.user)
+            .order_by('start_time').values_list('event_id', 'start_time')
+        )
+
+    def test_feed_is_read_from_timetable(self):
+        """Test that the events API reads the expanded series from the timetable in one query"""
+        self.assertEqual(len(self.entries()), 5)
+        # Session, user, timetable and its entries
+        with self.assertNumQueries(4):
+            events = streamed_json(self.client.get(reverse('get_events'), self.params))
+        self.assertEqual([event['id'] for event in events], [self.weekly.id, self.exam.id] + [self.weekly.id] * 3)
+        self.assertEqual(events[1]['title'], 'MA101 - Exam')
+        self.assertEqual(events[0]['extendedProps']['subject_id'], self.subject.id)
+
+    def test_event_change_refreshes_only_its_entries(self):
+        """Test that editing or deleting an event rewrites only its entries"""
+        exam_entry = TimetableEntry.objects.get(user=self.user, event=self.exam)
+        self.weekly.repeat_until = (self.start + timedelta(weeks=1)).date()
+        self.weekly.save()
+        self.assertEqual(TimetableEntry.objects.filter(user=self.user, event=self.weekly).count(), 2)
+        self.assertEqual(TimetableEntry.objects.get(user=self.user, event=self.exam).pk, exam_entry.pk)
+        
+        self.exam.delete()
+        self.assertEqual([event_id for event_id, _ in self.entries()], [self.weekly.id] * 2)
+
+    def test_enrollment_and_owner_changes(self):
+        """Test that scheduling, unscheduling and owner changes refresh the affected timetables"""
+        self.student.scheduled_subjects.remove(self.subject)
+        self.assertEqual(self.entries(), [(self.exam.id, self.exam.start_time)])
+        self.subject.scheduled_by_students.add(self.student)
+        self.assertEqual(len(self.entries()), 5)
+        
+        self.assertEqual(len(self.entries(self.owner)), 5)
+        self.other_subject.created_by = self.user
+        self.other_subject.save()
+        self.assertEqual(len(self.entries(self.owner)), 4)
+        self.student.scheduled_subjects.clear()
+        self.assertEqual(self.entries(), [(self.exam.id, self.exam.start_time)])
+
+    def test_subject_edits_keep_entries(self):
+        """Test that subject edits other than its owner leave the entries alone, and renames move the ETag"""
+        entry_ids = set(TimetableEntry.objects.values_list('id', flat=True))
+        first = self.client.get(reverse('get_events'), self.params)
+        read_streaming(first)
+        self.subject.description = 'Programming basics'
+        self.subject.capacity = 40
+        with mock.patch.object(timetable, 'refresh_subjects') as refresh:
+            self.subject.save()
+            refresh.assert_not_called()
+        response = self.client.get(reverse('get_events'), self.params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        
+        self.subject.name = 'Programming'
+        self.subject.save()
+        self.assertEqual(set(TimetableEntry.objects.values_list('id', flat=True)), entry_ids)
+        response = self.client.get(reverse('get_events'), self.params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(streamed_json(response)[0]['title'], 'CS101 - Class')
+
+    def test_changes_move_etag(self):
+        """Test that a change to the timetable gives the feed a new ETag"""
+        first = self.client.get(reverse('get_events'), self.params)
+        read_streaming(first)
+        response = self.client.get(reverse('get_events'), self.params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        
+        self.exam.location = 'Room 202'
+        self.exam.save()
+        response = self.client.get(reverse('get_events'), self.params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(streamed_json(response)[1]['extendedProps']['location'], 'Room 202')
+
+    def test_stale_and_distant_windows(self):
+        """Test that a timetable behind the window is rebuilt and distant windows are not materialized"""
+        Timetable.objects.filter(user=self.user).update(window_end=self.start)
+        TimetableEntry.objects.filter(user=self.user).delete()
+        user_timetable = timetable.timetable_for(self.user, self.start, self.start + timedelta(days=7))
+        self.assertTrue(user_timetable.covers(self.start, self.start + timedelta(days=7)))
+        self.assertEqual(len(self.entries()), 5)
+        
+        distant = self.start - timedelta(days=3 * 365)
+        self.assertIsNone(timetable.timetable_for(self.user, distant, distant + timedelta(days=7)))
+        # Users created without signals get a timetable on first read
+        Timetable.objects.filter(user=self.owner).delete()
+        self.assertEqual(len(streamed_json(self.client.get(reverse('get_events'), self.params))), 5)
+        self.assertIsNotNone(timetable.timetable_for(self.owner, self.start, self.start))
+
+
+class PlanmateEnrollmentTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='ownerpass123')
+        self.subject = Subject.objects.create(
+            code='CS101', name='Introduction to Computer Science',
+            credits=3, semester='1/2567', created_by=self.owner, capacity=2,
+        )
+        self.students = [
+            Student.objects.create(
+                user=User.objects.create_user(username=f'student{index}', password='studentpass123'),
+                student_id=f'ST{index}',
+            )
+            for index in range(4)
+        ]
+
+    def seats(self):
+        self.subject.refresh_from_db()
+        return self.subject.enrolled_count
+
+    def test_full_subject_waitlists_students(self):
+        """Test that students beyond the capacity join the waitlist in order"""
+        results = [enrollment.enroll(student, self.subject) for student in self.students]
+        self.assertEqual(results, [enrollment.ENROLLED] * 2 + [enrollment.WAITLISTED] * 2)
+        self.assertEqual(self.seats(), 2)
+        self.assertEqual(enrollment.enroll(self.students[0], self.subject), enrollment.ALREADY_ENROLLED)
+        self.assertEqual(enrollment.enroll(self.students[3], self.subject), enrollment.ALREADY_WAITLISTED)
+        self.assertEqual(enrollment.waitlist_position(self.students[3], self.subject), 2)
+        self.assertEqual(self.seats(), 2)
+
+    def test_freed_seat_goes_to_waitlist(self):
+        """Test that unenrolling or raising the capacity promotes waitlisted students"""
+        for student in self.students:
+            enrollment.enroll(student, self.subject)
+        self.assertEqual(enrollment.unenroll(self.students[0], self.subject), enrollment.UNENROLLED)
+        self.assertTrue(self.students[2].scheduled_subjects.filter(pk=self.subject.pk).exists())
+        self.assertEqual(enrollment.waitlist_position(self.students[3], self.subject), 1)
+        self.assertEqual(self.seats(), 2)
+        
+        self.subject.capacity = 3
+        self.subject.save()
+        self.assertTrue(self.students[3].scheduled_subjects.filter(pk=self.subject.pk).exists())
+        self.assertFalse(WaitlistEntry.objects.exists())
+        self.assertEqual(self.seats(), 3)
+        self.assertEqual(enrollment.unenroll(self.students[0], self.subject), enrollment.NOT_ENROLLED)
+
+    def test_editing_loaded_subject_keeps_seat_count(self):
+        """Test that saving an instance loaded before enrollments does not write back its seat count"""
+        loaded = Subject.objects.get(pk=self.subject.pk)
+        enrollment.enroll(self.students[0], self.subject)
+        enrollment.enroll(self.students[1], self.subject)
+        form = SubjectForm({'code': 'CS101', 'name': 'Intro to CS', 'credits': 3, 'semester': '1/2567',
+                            'capacity': 2}, instance=loaded)
+        self.assertTrue(form.is_valid())
+        form.save()
+        self.assertEqual(self.seats(), 2)
+        self.assertEqual(self.subject.name, 'Intro to CS')
+        self.assertEqual(enrollment.enroll(self.students[2], self.subject), enrollment.WAITLISTED)
+
+    def test_engine_counts_seats_without_recounting(self):
+        """Test that enrollments and drops move the seat count themselves, and other schedule changes recount it"""
+        with mock.patch.object(enrollment, 'recount', wraps=enrollment.recount) as recount:
+            enrollment.enroll(self.students[0], self.subject)
+            enrollment.enroll(self.students[1], self.subject)
+            enrollment.unenroll(self.students[0], self.subject)
+            enrollment.apply_schedule(self.students[2], [self.subject.pk], [])
+            enrollment.apply_schedule(self.students[1], [], [self.subject.pk])
+            self.assertEqual(self.seats(), 1)
+            recount.assert_not_called()
+            
+            self.students[3].scheduled_subjects.add(self.subject)
+            recount.assert_called_once()
+        self.assertEqual(self.seats(), 2)
+
+    def test_promotion_skips_conflicting_students(self):
+        """Test that a waitlisted student whose schedule now overlaps keeps their place"""
+        start = timezone.now() + timedelta(days=1)
+        Event.objects.create(subject=self.subject, event_type='class', location='Room 1',
+                             start_time=start, end_time=start + timedelta(hours=2))
+        other = Subject.objects.create(code='MA101', name='Calculus', credits=3, semester='1/2567')
+        Event.objects.create(subject=other, event_type='exam', location='Hall',
+                             start_time=start, end_time=start + timedelta(hours=1))
+        for student in self.students[:3]:
+            enrollment.enroll(student, self.subject)
+        enrollment.enroll(self.students[3], self.subject)
+        self.students[2].scheduled_subjects.add(other)
+        
+        enrollment.unenroll(self.students[0], self.subject)
+        self.assertTrue(self.students[3].scheduled_subjects.filter(pk=self.subject.pk).exists())
+        self.assertEqual(enrollment.waitlist_position(self.students[2], self.subject), 1)
+
+    def test_other_schedule_changes_keep_count(self):
+        """Test that changes made without the engine keep enrolled_count right"""
+        self.subject.scheduled_by_students.add(*self.students[:2])
+        self.assertEqual(self.seats(), 2)
+        self.students[0].scheduled_subjects.clear()
+        self.assertEqual(self.seats(), 1)
+
+    def test_enroll_view_messages(self):
+        """Test that the enroll view reports a full subject with the waitlist place"""
+        for student in self.students[:2]:
+            enrollment.enroll(student, self.subject)
+        self.client.force_login(self.students[2].user)
+        response = self.client.get(reverse('enroll_subject', args=[self.subject.id]), follow=True)
+        self.assertContains(response, 'You are number 1 on the waitlist')
+        response = self.client.get(reverse('unenroll_subject', args=[self.subject.id]), follow=True)
+        self.assertContains(response, 'You left the waitlist')
+
+
+class PlanmateEnrollmentStressTest(TransactionTestCase):
+    STUDENTS = 1000
+    SUBJECTS = 4
+    CAPACITY = 100
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Threads sharing an in-memory database fail with "table is locked" instead of waiting
+            self.skipTest('needs a database server or an SQLite file')
+
+    def test_concurrent_enrollments_never_over_enroll(self):
+        """Test that thousands of concurrent enrollments fill each subject exactly once"""
+        subjects = Subject.objects.bulk_create([
+            Subject(code=f'ST{index}', name=f'Stress {index}', credits=3, semester='1/2567', capacity=self.CAPACITY)
+            for index in range(self.SUBJECTS)
+        ])
+        users = User.objects.bulk_create([User(username=f'stress{index}') for index in range(self.STUDENTS)])
+        students = Student.objects.bulk_create([
+            Student(user=user, student_id=f'SS{index}') for index, user in enumerate(users)
+        ])
+        # Every student tries two subjects, and some of them twice
+        attempts = [
+            (student, subjects[(index + offset) % self.SUBJECTS])
+            for index, student in enumerate(students)
+            for offset in ((0, 1, 0) if index % 10 == 0 else (0, 1))
+        ]
+
+        def attempt(student_subject):
+            try:
+                return enrollment.enroll(*student_subject)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            results = list(pool.map(attempt, attempts))
+        
+        self.assertEqual(results.count(enrollment.ENROLLED), self.SUBJECTS * self.CAPACITY)
+        schedule = Student.scheduled_subjects.through.objects
+        for subject in Subject.objects.all():
+            self.assertEqual(subject.enrolled_count, self.CAPACITY)
+            self.assertEqual(schedule.filter(subject=subject).count(), self.CAPACITY)
+        # Nobody holds a seat and a waitlist place for the same subject
+        self.assertFalse(WaitlistEntry.objects.filter(
+            student__scheduled_subjects=F('subject')
+        ).exists())
+        self.assertEqual(
+            WaitlistEntry.objects.count() + schedule.count(),
+            len({(student.pk, subject.pk) for student, subject in attempts}),
+        )
+
+
+    def test_concurrent_enrollments_and_drops_keep_count(self):
+        """Test that drops racing with enrollments leave the seat count equal to the schedule"""
+        subject = Subject.objects.create(code='ST0', name='Stress', credits=3, semester='1/2567', capacity=self.CAPACITY)
+        users = User.objects.bulk_create([User(username=f'stress{index}') for index in range(self.STUDENTS)])
+        students = Student.objects.bulk_create([
+            Student(user=user, student_id=f'SS{index}') for index, user in enumerate(users)
+        ])
+        # The first half starts enrolled and drops again while the second half enrolls
+        for student in students[:self.STUDENTS // 2]:
+            enrollment.enroll(student, subject)
+        attempts = [(enrollment.unenroll, student) for student in students[:self.STUDENTS // 2]]
+        attempts = [
+            attempt for pair in zip(attempts, [(enrollment.enroll, student) for student in students[self.STUDENTS // 2:]])
+            for attempt in pair
+        ]
+
+        def attempt(action_student):
+            action, student = action_student
+            try:
+                return action(student, subject)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            list(pool.map(attempt, attempts))
+        
+        subject.refresh_from_db()
+        seated = Student.scheduled_subjects.through.objects.filter(subject=subject).count()
+        self.assertEqual(subject.enrolled_count, seated)
+        self.assertLessEqual(seated, self.CAPACITY)
+
+
+class PlanmateScheduleApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='ownerpass123')
+        self.user = User.objects.create_user(username='student', password='studentpass123')
+        self.student = Student.objects.create(user=self.user, student_id='ST12345')
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        self.subjects = []
+        for index in range(12):
+            subject = Subject.objects.create(
+                code=f'CS{index:03}', name=f'Subject {index}', credits=3, semester='1/2567', created_by=self.owner,
+            )
+            # Each subject meets weekly in its own hour
+            Event.objects.create(
+                subject=subject, event_type='class', location=f'Room {index}', repeat_weekly=True,
+                start_time=self.start + timedelta(hours=index), end_time=self.start + timedelta(hours=index, minutes=50),
+            )
+            self.subjects.append(subject)
+        self.client.force_login(self.user)
+
+    def post(self, enroll=(), unenroll=()):
+        return self.client.post(
+            reverse('schedule_api'), json.dumps({'enroll': list(enroll), 'unenroll': list(unenroll)}),
+            content_type='application/json',
+        )
+
+    def statuses(self, response):
+        self.assertEqual(response.status_code, 200)
+        return {result['subject']: result['status'] for result in response.json()['results']}
+
+    def scheduled_ids(self):
+        return set(self.student.scheduled_subjects.values_list('id', flat=True))
+
+    def test_queries_do_not_grow_with_subjects(self):
+        """Test that scheduling eight subjects runs as many queries as scheduling two"""
+        self.student.scheduled_subjects.add(*self.subjects[:2])
+        counts = []
+        for subjects in (self.subjects[2:4], self.subjects[4:12]):
+            with CaptureQueriesContext(connection) as captured:
+                statuses = self.statuses(self.post(enroll=[subject.id for subject in subjects]))
+            counts.append(len(captured))
+            self.assertEqual(set(statuses.values()), {enrollment.ENROLLED})
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(self.scheduled_ids(), {subject.id for subject in self.subjects})
+        self.assertEqual(len(TimetableEntry.objects.filter(user=self.user, start_time__lt=self.start + timedelta(days=1))), 12)
+
+    def test_conflicts_are_checked_over_the_whole_set(self):
+        """Test that subjects overlapping the schedule or an earlier requested subject are refused"""
+        self.student.scheduled_subjects.add(self.subjects[0])
+        clash = Subject.objects.create(code='MA101', name='Calculus', credits=3, semester='1/2567')
+        Event.objects.create(subject=clash, event_type='exam', location='Hall',
+                             start_time=self.start + timedelta(hours=1), end_time=self.start + timedelta(hours=2))
+        also_first = Subject.objects.create(code='PH101', name='Physics', credits=3, semester='1/2567')
+        Event.objects.create(subject=also_first, event_type='class', location='Lab',
+                             start_time=self.start + timedelta(minutes=10), end_time=self.start + timedelta(minutes=40))
+        
+        response = self.post(enroll=[self.subjects[0].id, self.subjects[1].id, clash.id, also_first.id, 999999])
+        self.assertEqual(self.statuses(response), {
+            self.subjects[0].id: enrollment.ALREADY_ENROLLED,
+            self.subjects[1].id: enrollment.ENROLLED,
+            clash.id: enrollment.CONFLICT,
+            also_first.id: enrollment.CONFLICT,
+            999999: enrollment.NOT_FOUND,
+        })
+        self.assertIn('CS001', response.json()['results'][2]['detail'])
+        
+        # Dropping the clashing subject in the same request makes room
+        statuses = self.statuses(self.post(enroll=[clash.id], unenroll=[self.subjects[1].id]))
+        self.assertEqual(statuses, {self.subjects[1].id: enrollment.UNENROLLED, clash.id: enrollment.ENROLLED})
+        self.assertEqual(self.scheduled_ids(), {self.subjects[0].id, clash.id})
+
+    def test_full_subjects_are_waitlisted(self):
+        """Test that the batch respects capacities and keeps enrolled_count right"""
+        full, open_subject = self.subjects[0], self.subjects[1]
+        Subject.objects.filter(pk=full.pk).update(capacity=0)
+        Subject.objects.filter(pk=open_subject.pk).update(capacity=1)
+        statuses = self.statuses(self.post(enroll=[full.id, open_subject.id]))
+        self.assertEqual(statuses, {full.id: enrollment.WAITLISTED, open_subject.id: enrollment.ENROLLED})
+        open_subject.refresh_from_db()
+        self.assertEqual(open_subject.enrolled_count, 1)
+        
+        statuses = self.statuses(self.post(enroll=[full.id], unenroll=[open_subject.id]))
+        self.assertEqual(statuses, {open_subject.id: enrollment.UNENROLLED, full.id: enrollment.ALREADY_WAITLISTED})
+        self.assertEqual(self.statuses(self.post(unenroll=[full.id])), {full.id: enrollment.LEFT_WAITLIST})
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+    def test_invalid_requests(self):
+        """Test that malformed bodies and other methods are refused"""
+        self.assertEqual(self.client.get(reverse('schedule_api')).status_code, 405)
+        for body in ('not json', '[1, 2]', '{"enroll": "1"}', '{"enroll": [true]}'):
+            response = self.client.post(reverse('schedule_api'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post(enroll=[1], unenroll=[1]).status_code, 400)
+        self.assertEqual(self.post(enroll=range(1, 52)).status_code, 400)
+        self.assertEqual(self.scheduled_ids(), set())
+
+
+class PlanmateTimetableGeneratorTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='studentpass123')
+        self.student = Student.objects.create(user=self.user, student_id='ST12345')
+        # A Monday morning in the local timezone
+        self.monday = timezone.make_aware(datetime(2026, 1, 5, 0, 0))
+        self.client.force_login(self.user)
+
+    def subject(self, code, *sections):
+        """Create a subject with weekly classes given as (section, weekday, hour, hours)"""
+        subject = Subject.objects.create(code=code, name=code, credits=3, semester='1/2569')
+        for section, weekday, hour, hours in sections:
+            start = self.monday + timedelta(days=weekday, hours=hour)
+            Event.objects.create(subject=subject, event_type='class', section=section, location=f'{code}-{section}',
+                                 repeat_weekly=True, start_time=start, end_time=start + timedelta(hours=hours))
+        return subject
+
+    def generate(self, **data):
+        response = self.client.post(reverse('generate_timetables'), json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def choices(self, timetable):
+        return {section['code']: section['section'] for section in timetable['sections']}
+
+    def test_finds_conflict_free_sections(self):
+        """Test that clashing sections are never combined and compact timetables rank first"""
+        math = self.subject('MA101', ('1', 0, 9, 2), ('2', 1, 9, 2))
+        physics = self.subject('PH101', ('1', 0, 10, 2), ('2', 2, 9, 2), ('3', 1, 11, 2))
+        # Events without a section belong to every section
+        start = self.monday + timedelta(days=3, hours=13)
+        Event.objects.create(subject=physics, event_type='lab', location='Lab', repeat_weekly=True,
+                             start_time=start, end_time=start + timedelta(hours=3))
+        result = self.generate(subjects=[math.id, physics.id], limit=10)
+        self.assertTrue(result['complete'])
+        pairs = [self.choices(timetable) for timetable in result['timetables']]
+        self.assertNotIn({'MA101': '1', 'PH101': '1'}, pairs)
+        self.assertEqual(len(pairs), 5)
+        # Tuesday 9-11 and 11-13 back to back, plus the Thursday lab
+        self.assertEqual(pairs[0], {'MA101': '2', 'PH101': '3'})
+        self.assertEqual(result['timetables'][0]['days'], 2)
+        self.assertEqual(result['timetables'][0]['gap_minutes'], 0)
+
+    def test_constraints(self):
+        """Test the earliest start, free day and maximum gap constraints"""
+        math = self.subject('MA101', ('1', 0, 8, 2), ('2', 4, 10, 2), ('3', 0, 15, 1))
+        physics = self.subject('PH101', ('1', 0, 10, 1))
+        result = self.generate(subjects=[math.id, physics.id], earliest_start='09:00', free_days=[4])
+        self.assertEqual([self.choices(timetable) for timetable in result['timetables']], [{'MA101': '3', 'PH101': '1'}])
+        result = self.generate(subjects=[math.id, physics.id], earliest_start='09:00', free_days=[4], max_gap_minutes=60)
+        self.assertEqual(result['timetables'], [])
+        result = self.generate(subjects=[math.id], earliest_start='09:00', latest_end='15:00', free_days=[4])
+        self.assertEqual(result['unsatisfiable'], [math.id])
+
+    def test_fits_around_schedule(self):
+        """Test that the student's current schedule is kept unless asked otherwise"""
+        scheduled = self.subject('CS101', ('', 0, 9, 2))
+        self.student.scheduled_subjects.add(scheduled)
+        math = self.subject('MA101', ('1', 0, 10, 2), ('2', 1, 10, 2))
+        result = self.generate(subjects=[math.id])
+        self.assertEqual([self.choices(timetable) for timetable in result['timetables']], [{'MA101': '2'}])
+        result = self.generate(subjects=[math.id], keep_schedule=False)
+        self.assertEqual(len(result['timetables']), 2)
+
+    def test_past_semesters_do_not_block(self):
+        """Test that scheduled subjects of an earlier semester at the same weekday and time are ignored"""
+        old = Subject.objects.create(code='CS100', name='CS100', credits=3, semester='1/2568')
+        start = self.monday - timedelta(weeks=52) + timedelta(hours=10)
+        Event.objects.create(subject=old, event_type='class', location='Room 1', repeat_weekly=True,
+                             start_time=start, end_time=start + timedelta(hours=2),
+                             repeat_until=(start + timedelta(weeks=16)).date())
+        exam = start + timedelta(weeks=17)
+        Event.objects.create(subject=old, event_type='exam', location='Hall', start_time=exam,
+                             end_time=exam + timedelta(hours=2))
+        self.student.scheduled_subjects.add(old)
+        math = self.subject('MA101', ('1', 0, 10, 2))
+        result = self.generate(subjects=[math.id])
+        self.assertEqual(result['unsatisfiable'], [])
+        self.assertEqual([self.choices(timetable) for timetable in result['timetables']], [{'MA101': '1'}])
+
+    def test_invalid_requests(self):
+        """Test that malformed generator requests are refused"""
+        url = reverse('generate_timetables')
+        for body in ('[]', '{"subjects": []}', '{"subjects": [1], "free_days": [7]}',
+                     '{"subjects": [1], "earliest_start": "nine"}', '{"subjects": [1], "limit": 0}'):
+            self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(url, '{"subjects": [999]}', content_type='application/json').status_code, 404)
+
+    def large_instance(self, subjects=40, sections=4):
+        rng = random.Random(7)
+        events = []
+        for subject_id in range(subjects):
+            for section in range(sections):
+                start = self.monday + timedelta(days=rng.randrange(5), hours=rng.randrange(8, 18))
+                events.append(Event(subject_id=subject_id, section=str(section), repeat_weekly=True,
+                                    start_time=start, end_time=start + timedelta(hours=rng.choice((1, 2)))))
+        return list(range(subjects)), events
+
+    def test_large_search_within_budget(self):
+        """Test that dozens of subjects with several sections are solved within the time budget"""
+        subject_ids, events = self.large_instance(subjects=24)
+        started = time.perf_counter()
+        result = solver.generate(subject_ids, events, limit=5, budget=0.8)
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertTrue(result.timetables)
+        scores = [timetable.score for timetable in result.timetables]
+        self.assertEqual(scores, sorted(scores))
+        for timetable in result.timetables:
+            weekly = 0
+            for section in timetable.sections:
+                self.assertFalse(weekly & section.weekly)
+                weekly |= section.weekly
+
+    def test_cancel_stops_search(self):
+        """Test that a set cancel flag ends the search early with what was found"""
+        subject_ids, events = self.large_instance()
+        cancel = threading.Event()
+        cancel.set()
+        result = solver.generate(subject_ids, events, budget=10, cancel=cancel)
+        self.assertFalse(result.complete)
+        self.assertLessEqual(result.explored, solver.CHECK_EVERY)
+
+
+class FailingBackend:
+    name = 'email'
+
+    def wants(self, reminder):
+        return True
+
+    def send(self, reminders):
+        raise ConnectionError('Mail server is down')
+
+
+class PlanmateReminderTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now().replace(microsecond=0)
+        owner = User.objects.create_user(username='owner', password='ownerpass123', email='owner@example.com')
+        self.subject = Subject.objects.create(code='CS101', name='Programming', credits=3, semester='1/2567', created_by=owner)
+        other = Subject.objects.create(code='CS102', name='Databases', credits=3, semester='1/2567', created_by=owner)
+        # A series that started weeks ago and meets again in half an hour
+        start = self.now + timedelta(minutes=30) - timedelta(weeks=3)
+        self.lecture = Event.objects.create(
+            subject=self.subject, event_type='class', location='Room 101', repeat_weekly=True,
+            start_time=start, end_time=start + timedelta(hours=2),
+        )
+        self.exam = Event.objects.create(
+            subject=self.subject, event_type='exam', location='Hall',
+            start_time=self.now + timedelta(minutes=45), end_time=self.now + timedelta(hours=2),
+        )
+        # Too late for this tick, and a subject nobody has scheduled
+        Event.objects.create(
+            subject=self.subject, event_type='lab', location='Lab',
+            start_time=self.now + timedelta(hours=3), end_time=self.now + timedelta(hours=4),
+        )
+        Event.objects.create(
+            subject=other, event_type='class', location='Room 102',
+            start_time=self.now + timedelta(minutes=10), end_time=self.now + timedelta(hours=1),
+        )
+        self.students = [self.add_student(index) for index in range(3)]
+
+    def add_student(self, index, email=True):
+        # Without a password, as hashing one per student would slow the tests down
+        user = User.objects.create(username=f'student{index}', email=f'student{index}@example.com' if email else '')
+        student = Student.objects.create(user=user, student_id=f'ST{index:05}')
+        student.scheduled_subjects.add(self.subject)
+        return student
+
+    def test_sends_each_reminder_once(self):
+        """Test that every student gets one reminder per occurrence, however many ticks run"""
+        self.add_student(3, email=False)
+        report = reminders.run_tick(self.now)
+        self.assertEqual(report, reminders.TickReport(occurrences=3, sent=6, skipped=0, failed=0))
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(
+            sorted((message.to[0], message.subject.split()[2]) for message in mail.outbox),
+            sorted((f'student{index}@example.com', kind) for index in range(3) for kind in ('Class', 'Exam')),
+        )
+        lecture_starts = Reminder.objects.filter(event=self.lecture).values_list('start_time', flat=True)
+        self.assertEqual(set(lecture_starts), {self.now + timedelta(minutes=30)})
+        self.assertFalse(Reminder.objects.filter(sent_at__isnull=True).exists())
+        
+        report = reminders.run_tick(self.now + timedelta(minutes=5))
+        self.assertEqual(report, reminders.TickReport(occurrences=3, sent=0, skipped=6, failed=0))
+        self.assertEqual(len(mail.outbox), 6)
+
+    def test_queries_do_not_grow_with_students(self):
+        """Test that a tick runs as many queries for forty students as for three"""
+        counts = []
+        for index in range(2):
+            if index:
+                Reminder.objects.all().delete()
+                for number in range(3, 40):
+                    self.add_student(number)
+            with CaptureQueriesContext(connection) as captured:
+                report = reminders.run_tick(self.now)
+            counts.append(len(captured))
+        self.assertEqual(report.sent, 80)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_batches(self):
+        """Test that reminders are claimed and sent in batches"""
+        with mock.patch.object(reminders, 'BATCH_SIZE', 4):
+            report = reminders.run_tick(self.now)
+        self.assertEqual(report.sent, 6)
+        self.assertEqual(Reminder.objects.values('token').distinct().count(), 2)
+
+    def test_failed_delivery_is_retried(self):
+        """Test that reminders a backend failed to send are released for the next tick"""
+        with self.assertLogs('Planmate.reminders', 'ERROR'):
+            report = reminders.run_tick(self.now, backends=[FailingBackend()])
+        self.assertEqual(report.failed, 6)
+        self.assertFalse(Reminder.objects.exists())
+        
+        report = reminders.run_tick(self.now + timedelta(minutes=1))
+        self.assertEqual(report.sent, 6)
+        self.assertEqual(len(mail.outbox), 6)
+
+    def test_claims_of_crashed_tick_are_taken_over(self):
+        """Test that reminders claimed by a tick that died before sending them are sent once the claim times out"""
+        with mock.patch.object(reminders.EmailBackend, 'send', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                reminders.run_tick(self.now)
+        self.assertEqual(Reminder.objects.filter(sent_at__isnull=True).count(), 6)
+        
+        report = reminders.run_tick(self.now + timedelta(minutes=5))
+        self.assertEqual(report.sent, 0)
+        self.assertEqual(len(mail.outbox), 0)
+        
+        report = reminders.run_tick(self.now + timedelta(minutes=11))
+        self.assertEqual((report.sent, report.skipped), (6, 0))
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertFalse(Reminder.objects.filter(sent_at__isnull=True).exists())
+        
+        reminders.run_tick(self.now + timedelta(minutes=25))
+        self.assertEqual(len(mail.outbox), 6)
+
+    def test_old_reminders_are_purged(self):
+        """Test that reminders of long past occurrences are deleted"""
+        reminders.run_tick(self.now)
+        reminders.run_tick(self.now + timedelta(days=2))
+        self.assertFalse(Reminder.objects.exists())
+
+    @override_settings(
+        PLANMATE_REMINDER_BACKENDS=['Planmate.reminders.EmailBackend', 'Planmate.reminders.WebhookBackend'],
+        PLANMATE_REMINDER_WEBHOOK_URL='https://hooks.example.com/planmate',
+    )
+    def test_webhook_backend(self):
+        """Test that the webhook gets each batch as JSON, independently of email"""
+        with mock.patch('urllib.request.urlopen') as urlopen:
+            report = reminders.run_tick(self.now)
+            reminders.run_tick(self.now)
+        self.assertEqual(report.sent, 12)
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(urlopen.call_count, 1)
+        request = urlopen.call_args.args[0]
+        self.assertEqual(request.full_url, 'https://hooks.example.com/planmate')
+        payload = json.loads(request.data)
+        self.assertEqual(len(payload['reminders']), 6)
+        self.assertEqual({reminder['type'] for reminder in payload['reminders']}, {'class', 'exam'})
+        self.assertEqual(Reminder.objects.filter(backend='webhook').count(), 6)
+
+    def test_command(self):
+        """Test that send_reminders --once runs a single tick"""
+        stdout = io.StringIO()
+        call_command('send_reminders', '--once', stdout=stdout)
+        self.assertIn('sent 6', stdout.getvalue())
+        self.assertEqual(len(mail.outbox), 6)
+
+
+class RecordingBroker:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, kind, data):
+        self.published.append((channel, kind, data))
+
+
+class PlanmateRealtimeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        realtime.get_broker.cache_clear()
+        self.addCleanup(realtime.get_broker.cache_clear)
+        self.user = User.objects.create_user(username='student', password='studentpass123')
+        self.student = Student.objects.create(user=self.user, student_id='ST12345')
+        owner = User.objects.create_user(username='owner', password='ownerpass123')
+        self.own = Subject.objects.create(code='CS101', name='Programming', credits=3, semester='1/2567',
+                                          created_by=self.user)
+        self.scheduled = Subject.objects.create(code='MA101', name='Calculus', credits=3, semester='1/2567',
+                                                created_by=owner)
+        self.other = Subject.objects.create(code='PH101', name='Physics', credits=3, semester='1/2567',
+                                            created_by=owner)
+        self.student.scheduled_subjects.add(self.scheduled)
+        self.start = timezone.now() + timedelta(days=1)
+        for subject in (self.own, self.scheduled, self.other):
+            Event.objects.create(subject=subject, event_type='class', location='Room 1',
+                                 start_time=self.start, end_time=self.start + timedelta(hours=1))
+
+    def build_request(self, path):
+        request = AsyncRequestFactory().get(path)
+        request.user = self.user
+        
+        async def auser():
+            return self.user
+        request.auser = auser
+        return request
+
+    async def test_broker_delivers_across_threads(self):
+        """Test that messages published from another thread reach only the subscribed channels"""
+        broker = realtime.InMemoryBroker()
+        subscription = await broker.subscribe(['subject:1', 'user:1'])
+        await sync_to_async(broker.publish)('subject:1', realtime.EVENT_CHANGED, {'event': 5, 'subject': 1})
+        await sync_to_async(broker.publish)('subject:2', realtime.EVENT_CHANGED, {'event': 6, 'subject': 2})
+        self.assertEqual(await subscription.get(1), (realtime.EVENT_CHANGED, {'event': 5, 'subject': 1}))
+        self.assertIsNone(await subscription.get(0.05))
+        
+        await subscription.remove(['subject:1'])
+        broker.publish('subject:1', realtime.EVENT_DELETED, {'event': 5, 'subject': 1})
+        self.assertIsNone(await subscription.get(0.05))
+        await subscription.close()
+        self.assertEqual(broker.subscriptions, {})
+
+    async def test_slow_client_is_reset(self):
+        """Test that a stream that fell too far behind is told to reload everything"""
+        broker = realtime.InMemoryBroker()
+        with mock.patch.object(realtime, 'QUEUE_SIZE', 2):
+            subscription = await broker.subscribe(['subject:1'])
+        for event_id in range(3):
+            broker.publish('subject:1', realtime.EVENT_CHANGED, {'event': event_id, 'subject': 1})
+        await asyncio.sleep(0)
+        self.assertEqual(await subscription.get(1), (realtime.RESET, {}))
+        self.assertIsNone(await subscription.get(0.05))
+
+    @override_settings(PLANMATE_REALTIME_BROKER='Planmate.tests.RecordingBroker')
+    def test_changes_are_published_on_commit(self):
+        """Test that changes reach the subject's or user's channel once committed"""
+        realtime.get_broker.cache_clear()
+        published = realtime.get_broker().published
+        with self.captureOnCommitCallbacks(execute=True):
+            event = Event.objects.create(subject=self.scheduled, event_type='exam', location='Hall',
+                                         start_time=self.start, end_time=self.start + timedelta(hours=2))
+            self.assertEqual(published, [])
+        self.assertEqual(published, [
+            (f'subject:{self.scheduled.pk}', realtime.EVENT_CHANGED, {'event': event.pk, 'subject': self.scheduled.pk}),
+        ])
+        
+        published.clear()
+        event_id = event.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.scheduled_subjects.add(self.other)
+            self.student.scheduled_subjects.remove(self.scheduled)
+            event.delete()
+        self.assertEqual(published, [
+            (f'user:{self.user.pk}', realtime.SUBJECT_ADDED, {'subject': self.other.pk}),
+            (f'user:{self.user.pk}', realtime.SUBJECT_REMOVED, {'subject': self.scheduled.pk}),
+            (f'subject:{self.scheduled.pk}', realtime.EVENT_DELETED, {'event': event_id, 'subject': self.scheduled.pk}),
+        ])
+
+    async def test_stream_follows_the_calendar(self):
+        """Test that the stream forwards changes of the user's subjects as they come and go"""
+        broker = realtime.get_broker()
+        response = await async_views.event_stream(self.build_request('/api/events/stream/'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = aiter(response.streaming_content)
+        self.assertEqual(await anext(content), b'retry: 5000\n\n')
+        
+        broker.publish(realtime.subject_channel(self.other.pk), realtime.SUBJECT_CHANGED, {'subject': self.other.pk})
+        broker.publish(realtime.subject_channel(self.scheduled.pk), realtime.EVENT_DELETED,
+                       {'event': 7, 'subject': self.scheduled.pk})
+        self.assertEqual(
+            await anext(content),
+            f'event: event.deleted\ndata: {{"event": 7, "subject": {self.scheduled.pk}}}\n\n'.encode(),
+        )
+        
+        # Subjects join and leave the stream with the calendar
+        for kind in (realtime.SUBJECT_ADDED, realtime.SUBJECT_CHANGED, realtime.SUBJECT_REMOVED):
+            channel = realtime.user_channel(self.user.pk) if kind != realtime.SUBJECT_CHANGED else \
+                realtime.subject_channel(self.other.pk)
+            broker.publish(channel, kind, {'subject': self.other.pk})
+            self.assertIn(f'event: {kind}\n'.encode(), await anext(content))
+        with mock.patch.object(realtime, 'HEARTBEAT_SECONDS', 0.05):
+            broker.publish(realtime.subject_channel(self.other.pk), realtime.SUBJECT_CHANGED, {'subject': self.other.pk})
+            self.assertEqual(await anext(content), b': keep-alive\n\n')
+        
+        # A created subject stays on the calendar after it is dropped from the schedule
+        broker.publish(realtime.user_channel(self.user.pk), realtime.SUBJECT_REMOVED, {'subject': self.own.pk})
+        self.assertIn(b'event: subject.changed\n', await anext(content))
+        
+        # Disconnecting cancels the stream, which unsubscribes
+        pending = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(broker.subscriptions, {})
+
+    def test_events_of_one_subject(self):
+        """Test that the events API can be limited to one subject of the calendar"""
+        self.client.force_login(self.user)
+        params = {'start': timezone.now().isoformat(), 'end': (timezone.now() + timedelta(days=7)).isoformat()}
+        response = self.client.get(reverse('get_events'), {**params, 'subject': self.scheduled.pk})
+        self.assertEqual({event['extendedProps']['subject_id'] for event in streamed_json(response)}, {self.scheduled.pk})
+        response = self.client.get(reverse('get_events'), {**params, 'subject': self.other.pk})
+        self.assertEqual(streamed_json(response), [])
+        response = self.client.get(reverse('get_events'), {**params, 'subject': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PLANMATE_SYNC_SETTLE_SECONDS=0)
+class PlanmateChangeSyncTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='ownerpass123')
+        self.user = User.objects.create_user(username='student', password='studentpass123')
+        self.student = Student.objects.create(user=self.user, student_id='ST12345')
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        self.subjects = [
+            Subject.objects.create(code=f'CS10{index}', name=f'Subject {index}', credits=3, semester='1/2567',
+                                   created_by=self.owner)
+            for index in range(3)
+        ]
+        self.events = [
+            Event.objects.create(subject=subject, event_type='class', location=f'Room {index}',
+                                 start_time=self.start + timedelta(hours=index),
+                                 end_time=self.start + timedelta(hours=index + 1))
+            for subject in self.subjects for index in range(3)
+        ]
+        self.student.scheduled_subjects.add(*self.subjects[:2])
+        self.client.force_login(self.user)
+
+    def sync(self, since=None, limit=None):
+        """Fetch pages until the client is up to date, returning them and the final cursor"""
+        pages = []
+        while True:
+            params = {key: value for key, value in (('since', since), ('limit', limit)) if value is not None}
+            response = self.client.get(reverse('event_changes'), params)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            pages.append(page)
+            since = page['cursor']
+            if not page['has_more']:
+                return pages, since
+
+    def test_snapshot_then_nothing(self):
+        """Test that a first sync pages through every calendar event and ends at the log head"""
+        pages, cursor = self.sync(limit=4)
+        self.assertTrue(pages[0]['reset'])
+        synced = [event['id'] for page in pages for event in page['events']]
+        self.assertEqual(synced, [event.pk for event in self.events[:6]])
+        self.assertEqual(pages[0]['events'][0]['code'], 'CS100')
+        self.assertEqual(pages[-1]['events'], [])
+        
+        pages, next_cursor = self.sync(cursor)
+        self.assertEqual(next_cursor, cursor)
+        self.assertEqual(pages, [{
+            'reset': False, 'events': [], 'deleted': [], 'removed_subjects': [], 'cursor': cursor, 'has_more': False,
+        }])
+
+    def test_only_changes_are_sent(self):
+        """Test that a sync returns the changed events and tombstones of deleted ones"""
+        _, cursor = self.sync()
+        edited, deleted, gone = self.events[0], self.events[1], self.events[3]
+        edited.location = 'Hall'
+        edited.save()
+        edited.save()
+        self.events[6].save()  # Not on the calendar
+        self.client.force_login(self.owner)
+        self.client.post(reverse('delete_event', args=[deleted.pk]))
+        self.client.post(reverse('subject_detail', args=[self.subjects[1].pk]),
+                         {'delete_event': '1', 'event_id': gone.pk})
+        self.client.force_login(self.user)
+        
+        pages, cursor = self.sync(cursor)
+        self.assertEqual(len(pages), 1)
+        self.assertEqual([event['location'] for event in pages[0]['events']], ['Hall'])
+        self.assertEqual(pages[0]['deleted'], sorted([deleted.pk, gone.pk]))
+        self.assertTrue(Change.objects.filter(kind=Change.EVENT_DELETED, event_id=gone.pk).exists())
+
+    def test_schedule_changes(self):
+        """Test that scheduled subjects bring their events and dropped or deleted ones are removed"""
+        _, cursor = self.sync()
+        self.student.scheduled_subjects.add(self.subjects[2])
+        self.student.scheduled_subjects.remove(self.subjects[0])
+        pages, cursor = self.sync(cursor)
+        self.assertEqual({event['id'] for event in pages[0]['events']}, {event.pk for event in self.events[6:]})
+        self.assertEqual(pages[0]['removed_subjects'], [self.subjects[0].pk])
+        
+        self.client.force_login(self.owner)
+        self.client.post(reverse('subject_detail', args=[self.subjects[1].pk]), {'delete_subject': '1'})
+        self.client.force_login(self.user)
+        pages, cursor = self.sync(cursor)
+        self.assertEqual(pages[0]['removed_subjects'], [self.subjects[1].pk])
+        self.assertEqual(pages[0]['events'], [])
+
+    def test_moved_event(self):
+        """Test that an event moved to a subject off the calendar is deleted for the client"""
+        _, cursor = self.sync()
+        moved = self.events[0]
+        moved.subject = self.subjects[2]
+        moved.save()
+        pages, _ = self.sync(cursor)
+        self.assertEqual(pages[0]['deleted'], [moved.pk])
+        self.assertEqual(pages[0]['events'], [])
+
+    def test_log_paging(self):
+        """Test that the log is paged by cursor"""
+        _, cursor = self.sync()
+        for event in self.events[:3]:
+            event.save()
+        pages, _ = self.sync(cursor, limit=2)
+        self.assertEqual([len(page['events']) for page in pages], [2, 1])
+        self.assertTrue(pages[0]['has_more'])
+
+    def test_unsettled_changes_are_held_back(self):
+        """Test that changes are not sent until they had time to commit"""
+        _, cursor = self.sync()
+        self.events[0].save()
+        with override_settings(PLANMATE_SYNC_SETTLE_SECONDS=60):
+            pages, held = self.sync(cursor)
+        self.assertEqual((pages[0]['events'], held), ([], cursor))
+        pages, _ = self.sync(cursor)
+        self.assertEqual(len(pages[0]['events']), 1)
+
+    def test_changes_roll_back_with_their_data(self):
+        """Test that changes are logged in the transaction of the data, and undone with it"""
+        _, cursor = self.sync()
+        event_id = self.events[0].pk
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.events[0].delete()
+            self.assertTrue(Change.objects.filter(kind=Change.EVENT_DELETED, event_id=event_id).exists())
+            raise RuntimeError
+        pages, _ = self.sync(cursor)
+        self.assertEqual(pages[0]['deleted'], [])
+        self.assertTrue(Event.objects.filter(pk=event_id).exists())
+
+    def test_bad_and_pruned_cursors(self):
+        """Test that invalid cursors are refused and pruned ones start over"""
+        response = self.client.get(reverse('event_changes'), {'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        
+        _, cursor = self.sync()
+        self.events[0].save()
+        self.events[1].save()
+        Change.objects.update(created_at=timezone.now() - timedelta(days=365))
+        stdout = io.StringIO()
+        call_command('prune_changes', stdout=stdout)
+        # The newest is kept to tell pruned cursors from an empty log
+        self.assertEqual(Change.objects.count(), 1)
+        pages, _ = self.sync(cursor)
+        self.assertTrue(pages[0]['reset'])
+        self.assertEqual(len([event for page in pages for event in page['events']]), 6)
+
+# A batch runs the queries of all its operations, over the slow request log's threshold
+@override_settings(PLANMATE_SLOW_REQUEST_QUERIES=500)
+class PlanmateJsonApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='ownerpass123')
+        self.other = User.objects.create_user(username='other', password='otherpass123')
+        self.subject = Subject.objects.create(code='CS101', name='Intro', credits=3, semester='1/2567',
+                                              created_by=self.owner)
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        self.event = Event.objects.create(subject=self.subject, event_type='class', location='Room 1',
+                                          start_time=self.start, end_time=self.start + timedelta(hours=1))
+        self.client.force_login(self.owner)
+
+    def send(self, method, url, data):
+        return getattr(self.client, method)(url, json.dumps(data), content_type='application/json')
+
+    def event_data(self, hours, **extra):
+        return {
+            'event_type': 'lab',
+            'start_time': (self.start + timedelta(hours=hours)).isoformat(),
+            'end_time': (self.start + timedelta(hours=hours + 1)).isoformat(),
+            'location': 'Lab 2',
+            **extra,
+        }
+
+    def test_create_update_and_delete_subject(self):
+        """Test that subjects are created for the user, patched field by field and deleted"""
+        response = self.send('post', reverse('subjects_api'),
+                             {'code': 'CS102', 'name': 'Data', 'credits': 3, 'semester': '1/2567'})
+        self.assertEqual(response.status_code, 201)
+        subject = Subject.objects.get(code='CS102')
+        self.assertEqual(subject.created_by, self.owner)
+        self.assertEqual(response.json()['id'], subject.pk)
+        
+        response = self.send('patch', reverse('subject_api', args=[subject.pk]), {'name': 'Data Structures'})
+        self.assertEqual(response.status_code, 200)
+        subject.refresh_from_db()
+        self.assertEqual((subject.name, subject.credits, subject.code), ('Data Structures', 3, 'CS102'))
+        
+        response = self.client.delete(reverse('subject_api', args=[subject.pk]))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Subject.objects.filter(pk=subject.pk).exists())
+
+    def test_form_validation_is_reused(self):
+        """Test that the form rules apply, including unique codes and event conflicts"""
+        response = self.send('post', reverse('subjects_api'), {'code': 'CS101', 'name': 'Copy', 'credits': 3})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('code', response.json()['errors'])
+        
+        response = self.send('post', reverse('subject_events_api', args=[self.subject.pk]), self.event_data(0))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('overlaps', response.json()['errors']['__all__'][0])
+        
+        response = self.send('patch', reverse('event_api', args=[self.event.pk]),
+                             {'end_time': (self.start - timedelta(hours=1)).isoformat()})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors']['__all__'], ['End time must be after start time.'])
+        
+        response = self.send('patch', reverse('event_api', args=[self.event.pk]), {'colour': 'red'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Unknown fields: colour.')
+
+    def test_create_and_update_event(self):
+        """Test that events are created under a subject and keep the fields a patch leaves out"""
+        response = self.send('post', reverse('subject_events_api', args=[self.subject.pk]),
+                             self.event_data(2, repeat_weekly=True))
+        self.assertEqual(response.status_code, 201)
+        event = Event.objects.get(pk=response.json()['id'])
+        self.assertEqual((event.subject, event.event_type, event.repeat_weekly), (self.subject, 'lab', True))
+        
+        response = self.send('patch', reverse('event_api', args=[event.pk]), {'location': 'Lab 3'})
+        self.assertEqual(response.status_code, 200)
+        event.refresh_from_db()
+        self.assertEqual((event.location, event.event_type, event.repeat_weekly), ('Lab 3', 'lab', True))
+        self.assertEqual(event.start_time, self.start + timedelta(hours=2))
+        self.assertEqual(self.client.get(reverse('event_api', args=[event.pk])).json()['location'], 'Lab 3')
+        
+        response = self.client.delete(reverse('event_api', args=[event.pk]))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Event.objects.filter(pk=event.pk).exists())
+
+    def test_only_owner_may_change(self):
+        """Test that other users can neither change a subject nor move events into it"""
+        other_subject = Subject.objects.create(code='CS201', name='Other', credits=3, created_by=self.other)
+        self.assertEqual(self.send('patch', reverse('subject_api', args=[other_subject.pk]), {'name': 'X'}).status_code, 403)
+        self.assertEqual(self.client.get(reverse('subject_api', args=[other_subject.pk])).status_code, 403)
+        response = self.send('post', reverse('subject_events_api', args=[other_subject.pk]), self.event_data(2))
+        self.assertEqual(response.status_code, 403)
+        response = self.send('patch', reverse('event_api', args=[self.event.pk]), {'subject': other_subject.pk})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Event.objects.get(pk=self.event.pk).subject, self.subject)
+        
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.delete(reverse('event_api', args=[self.event.pk])).status_code, 403)
+        self.assertEqual(self.client.delete(reverse('subject_api', args=[self.subject.pk])).status_code, 403)
+        self.assertEqual(self.client.delete(reverse('subject_api', args=[0])).status_code, 404)
+
+    def test_batch_applies_in_one_transaction(self):
+        """Test that a batch may refer to subjects it creates and returns a result per operation"""
+        response = self.send('post', reverse('batch_api'), {'operations': [
+            {'op': 'create', 'type': 'subject', 'data': {'code': 'CS300', 'name': 'New', 'credits': 3, 'semester': '1/2567'}},
+            {'op': 'create', 'type': 'event', 'data': {'subject': '$0', **self.event_data(0)}},
+            {'op': 'update', 'type': 'event', 'id': self.event.pk, 'data': {'notes': 'Bring laptops'}},
+            {'op': 'delete', 'type': 'subject', 'id': self.subject.pk},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        subject = Subject.objects.get(code='CS300')
+        self.assertEqual(results[0]['id'], subject.pk)
+        self.assertEqual(results[1]['subject'], subject.pk)
+        self.assertEqual(results[2]['notes'], 'Bring laptops')
+        self.assertIsNone(results[3])
+        self.assertFalse(Subject.objects.filter(pk=self.subject.pk).exists())
+
+    def test_failed_batch_changes_nothing(self):
+        """Test that one invalid operation rolls back the whole batch and is reported by index"""
+        response = self.send('post', reverse('batch_api'), {'operations': [
+            {'op': 'create', 'type': 'subject', 'data': {'code': 'CS300', 'name': 'New', 'credits': 3, 'semester': '1/2567'}},
+            {'op': 'update', 'type': 'event', 'id': self.event.pk, 'data': {'location': 'Room 9'}},
+            {'op': 'create', 'type': 'event', 'data': {'subject': '$1', **self.event_data(4)}},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['index'], 2)
+        self.assertFalse(Subject.objects.filter(code='CS300').exists())
+        self.assertEqual(Event.objects.get(pk=self.event.pk).location, 'Room 1')
+        
+        response = self.send('post', reverse('batch_api'), {'operations': [{'op': 'rename', 'type': 'event'}]})
+        self.assertEqual(response.status_code, 400)
+        response = self.send('post', reverse('batch_api'), {'operations': [{}] * (views.API_BATCH_LIMIT + 1)})
+        self.assertEqual(response.status_code, 400)
+
+class PlanmateFragmentCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='ownerpass123')
+        self.user = User.objects.create_user(username='student', password='studentpass123')
+        self.student = Student.objects.create(user=self.user, student_id='ST12345')
+        self.subject = Subject.objects.create(code='CS101', name='Intro', credits=3, semester='1/2567',
+                                              created_by=self.owner)
+        self.start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        self.event = Event.objects.create(subject=self.subject, event_type='class', location='Room 1',
+                                          start_time=self.start, end_time=self.start + timedelta(hours=1))
+        self.student.scheduled_subjects.add(self.subject)
+
+    def test_templates_are_compiled_once(self):
+        """Test that the cached loader keeps compiled templates behind the profiling backend"""
+        from django.template import engines
+        from django.template.loaders.cached import Loader
+        
+        engine = engines.all()[0]
+        self.assertIsInstance(engine.engine.template_loaders[0], Loader)
+        first, second = engine.get_template('dashboard.html'), engine.get_template('dashboard.html')
+        self.assertIsNot(first, second)
+        self.assertIs(first.template.template, second.template.template)
+
+    def test_dashboard_lists_follow_subject_versions(self):
+        """Test that the cached subject lists are rendered again only when a subject changes"""
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('dashboard')), 'CS101 - Intro')
+        # An update that skips the signals keeps the version, so the cached list is served
+        Subject.objects.filter(pk=self.subject.pk).update(name='Renamed')
+        self.assertContains(self.client.get(reverse('dashboard')), 'CS101 - Intro')
+        
+        self.subject.name = 'Introduction'
+        self.subject.save()
+        self.assertContains(self.client.get(reverse('dashboard')), 'CS101 - Introduction')
+        self.student.scheduled_subjects.remove(self.subject)
+        self.assertNotContains(self.client.get(reverse('dashboard')), 'CS101')
+
+    def test_event_table_follows_events_and_owner(self):
+        """Test that event edits show at once and owners and students get their own table"""
+        detail_url = reverse('subject_detail', args=[self.subject.pk])
+        self.client.force_login(self.owner)
+        self.assertContains(self.client.get(detail_url), reverse('edit_event', args=[self.subject.pk, self.event.pk]))
+        self.event.location = 'Room 2'
+        self.event.save()
+        self.assertContains(self.client.get(detail_url), 'Room 2')
+        
+        self.client.force_login(self.user)
+        response = self.client.get(detail_url)
+        self.assertContains(response, 'Room 2')
+        self.assertNotContains(response, reverse('edit_event', args=[self.subject.pk, self.event.pk]))
+
+    def test_cached_rows_delete_through_one_form(self):
+        """Test that the rows hold no CSRF token and their buttons still delete events"""
+        self.client = self.client_class(enforce_csrf_checks=True)
+        self.client.force_login(self.owner)
+        detail_url = reverse('subject_detail', args=[self.subject.pk])
+        self.client.get(detail_url)
+        response = self.client.get(detail_url)
+        self.assertContains(response, 'csrfmiddlewaretoken', count=3)
+        self.assertContains(response, f'form="deleteEventForm" name="event_id" value="{self.event.pk}"')
+        
+        token = self.client.cookies[settings.CSRF_COOKIE_NAME].value
+        response = self.client.post(detail_url, {'csrfmiddlewaretoken': token, 'delete_event': 'true',
+                                                 'event_id': self.event.pk})
+        self.assertRedirects(response, detail_url)
+        self.assertFalse(Event.objects.filter(pk=self.event.pk).exists())
+        self.assertNotContains(self.client.get(detail_url), 'Room 1')
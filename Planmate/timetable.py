@@ -0,0 +1,221 @@
+"""Materialized per-user timetables.
+
+A user's timetable holds one ``TimetableEntry`` per occurrence of the events
+of their calendar subjects (created or scheduled) inside a window of one
+semester either side of the current week. The calendar feed and dashboard
+read it with a single range scan on ``(user, start_time)`` instead of
+resolving the subject set and expanding weekly series on every request.
+
+Entries are maintained incrementally: a changed event rewrites only its own
+entries, an enrollment only the entries of that subject for that user, and a
+changed subject only its entries. A timetable is rebuilt in full only when it
+is first needed or when the requested window has moved past it. Every change
+bumps ``Timetable.version``, which the calendar ETags are built from.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Event, Student, Subject, Timetable, TimetableEntry
+from .recurrence import WEEK, occurrences, semester_length, window_filter
+
+BATCH_SIZE = 5000
+
+
+def get_calendar_subjects(user):
+    """Return the subjects created by ``user`` or in their schedule"""
+    scheduled = Student.scheduled_subjects.through.objects.filter(student__user=user)
+    return Subject.objects.filter(
+        Q(created_by=user) | Q(id__in=scheduled.values('subject_id'))
+    )
+
+
+def horizon(now=None):
+    """Return the window a timetable built at ``now`` holds"""
+    today = timezone.localdate(now or timezone.now())
+    week_start = datetime.combine(
+        today - timedelta(days=today.weekday()), time.min, tzinfo=timezone.get_default_timezone()
+    )
+    return week_start - semester_length(), week_start + semester_length() + WEEK
+
+
+def subject_members(subject_ids, user_ids=None):
+    """Return ``{subject_id: {user_id, ...}}`` of the users with each subject on their calendar"""
+    owners = Subject.objects.filter(id__in=subject_ids, created_by__isnull=False)
+    scheduled = Student.scheduled_subjects.through.objects.filter(subject_id__in=subject_ids)
+    if user_ids is not None:
+        owners = owners.filter(created_by__in=user_ids)
+        scheduled = scheduled.filter(student__user__in=user_ids)
+    members = {}
+    for subject_id, user_id in [
+        *owners.values_list('id', 'created_by_id'),
+        *scheduled.values_list('subject_id', 'student__user_id'),
+    ]:
+        members.setdefault(subject_id, set()).add(user_id)
+    return members
+
+
+def lock_timetables(user_ids):
+    """Return ``{user_id: Timetable}`` of the users that have one, locked until the transaction ends"""
+    timetables = Timetable.objects.select_for_update().filter(user__in=user_ids).order_by('user_id')
+    return {timetable.user_id: timetable for timetable in timetables}
+
+
+def write_entries(events, members, timetables):
+    """Insert the entries of ``events`` for their subjects' members, then mark the timetables changed"""
+    batch = []
+    for event in events:
+        for user_id in members.get(event.subject_id, ()):
+            timetable = timetables.get(user_id)
+            if timetable is None:
+                continue
+            for _, start_time, end_time in occurrences(event, timetable.window_start, timetable.window_end):
+                timetable.longest = max(timetable.longest, end_time - start_time)
+                batch.append(TimetableEntry(
+                    user_id=user_id, subject_id=event.subject_id, event_id=event.id,
+                    start_time=start_time, end_time=end_time,
+                ))
+            if len(batch) >= BATCH_SIZE:
+                TimetableEntry.objects.bulk_create(batch)
+                batch = []
+    TimetableEntry.objects.bulk_create(batch)
+    mark_changed(timetables.values())
+
+
+def mark_changed(timetables):
+    now = timezone.now()
+    for timetable in timetables:
+        timetable.version += 1
+        timetable.changed_at = now
+    Timetable.objects.bulk_update(
+        timetables, ['window_start', 'window_end', 'longest', 'version', 'changed_at'],
+    )
+
+
+def touch(user_ids):
+    """Mark the timetables of the users changed without touching their entries"""
+    Timetable.objects.filter(user__in=user_ids).update(version=F('version') + 1, changed_at=timezone.now())
+
+
+def window_events(subject_ids, timetables):
+    """Return the events of the subjects with an occurrence in any of the timetables"""
+    if not timetables:
+        return Event.objects.none()
+    window_start = min(timetable.window_start for timetable in timetables)
+    window_end = max(timetable.window_end for timetable in timetables)
+    return Event.objects.filter(subject__in=subject_ids).filter(window_filter(window_start, window_end))
+
+
+def build(user, now=None):
+    """Rebuild the whole timetable of ``user`` for the window around ``now`` and return it"""
+    window_start, window_end = horizon(now)
+    with transaction.atomic():
+        timetable, _ = Timetable.objects.select_for_update().get_or_create(
+            user=user, defaults={'window_start': window_start, 'window_end': window_end},
+        )
+        TimetableEntry.objects.filter(user=user).delete()
+        timetable.window_start, timetable.window_end = window_start, window_end
+        timetable.longest = timedelta(0)
+        subject_ids = list(get_calendar_subjects(user).values_list('id', flat=True))
+        events = window_events(subject_ids, [timetable]).iterator(chunk_size=2000)
+        write_entries(events, {subject_id: {user.pk} for subject_id in subject_ids}, {user.pk: timetable})
+    return timetable
+
+
+def create_empty(user, now=None):
+    """Give a new user an empty timetable, so it is maintained from the start"""
+    window_start, window_end = horizon(now)
+    Timetable.objects.get_or_create(user=user, defaults={'window_start': window_start, 'window_end': window_end})
+
+
+def timetable_for(user, window_start, window_end, now=None):
+    """Return the timetable of ``user`` holding the window, or None when it cannot.
+
+    A timetable that is missing or behind the current window is rebuilt.
+    """
+    if window_start is None or window_end is None:
+        return None
+    # Only windows near the present are materialized
+    current_start, current_end = horizon(now)
+    if not (current_start <= window_start and window_end <= current_end):
+        return None
+    timetable = Timetable.objects.filter(user=user).first()
+    if timetable is not None and timetable.covers(window_start, window_end):
+        return timetable
+    return build(user, now)
+
+
+def entries(timetable, window_start, window_end):
+    """Return the entries overlapping the window, ordered by start"""
+    return (
+        TimetableEntry.objects.filter(
+            user_id=timetable.user_id,
+            # The lower bound keeps the scan on the index range of the window
+            start_time__gte=window_start - timetable.longest,
+            start_time__lt=window_end,
+            end_time__gt=window_start,
+        )
+        .order_by('start_time', 'event_id')
+    )
+
+
+def refresh_subjects(subject_ids, user_ids=None):
+    """Rewrite the entries of the subjects, for every user or only ``user_ids``"""
+    subject_ids = list(subject_ids)
+    with transaction.atomic():
+        stale = TimetableEntry.objects.filter(subject__in=subject_ids)
+        if user_ids is not None:
+            stale = stale.filter(user__in=user_ids)
+        # Users who lost a subject, e.g. to a change of owner, are refreshed too
+        previous = set(stale.values_list('user_id', flat=True).distinct())
+        members = subject_members(subject_ids, user_ids)
+        affected = previous.union(*members.values(), user_ids or ())
+        timetables = lock_timetables(affected)
+        stale.delete()
+        write_entries(window_events(subject_ids, timetables.values()), members, timetables)
+
+
+def refresh_events(event_ids):
+    """Rewrite the entries of created or edited events"""
+    event_ids = list(event_ids)
+    with transaction.atomic():
+        stale = TimetableEntry.objects.filter(event__in=event_ids)
+        previous = set(stale.values_list('user_id', flat=True).distinct())
+        events = list(Event.objects.filter(id__in=event_ids))
+        members = subject_members({event.subject_id for event in events})
+        timetables = lock_timetables(previous.union(*members.values()))
+        stale.delete()
+        write_entries(events, members, timetables)
+
+
+def add_events(events):
+    """Add the entries of new events, e.g. after ``bulk_create`` which sends no signals"""
+    events = list(events)
+    if not events:
+        return
+    with transaction.atomic():
+        members = subject_members({event.subject_id for event in events})
+        timetables = lock_timetables(set().union(*members.values()))
+        write_entries(events, members, timetables)
+
+
+def subject_removed(subject_id):
+    """Mark changed the timetables holding a subject that is being deleted, returning their users"""
+    members = subject_members([subject_id]).get(subject_id, set())
+    touch(members)
+    return members
+
+
+def upcoming_entries(timetable, now, limit):
+    """Return the next ``limit`` entries that have not ended at ``now``, with their events"""
+    return list(entries(timetable, now, timetable.window_end).select_related('event__subject')[:limit])
+
+
+def entry_rows(timetable, window_start, window_end):
+    """Return the entries overlapping the window as plain rows for the events feed"""
+    return entries(timetable, window_start, window_end).values_list(
+        'event_id', 'subject_id', 'subject__code', 'subject__name', 'event__event_type',
+        'event__location', 'event__notes', 'start_time', 'end_time',
+    )
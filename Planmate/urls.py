@@ -1,20 +1,45 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from . import views
 
+# The calendar views have async versions for ASGI deployments
+if settings.PLANMATE_ASYNC_VIEWS:
+    from . import async_views as calendar_views
+else:
+    calendar_views = views
+
 urlpatterns = [
     path('', views.index, name='index'),
     path('register/', views.register, name='register'),
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
     path('logout/', views.logout_view, name='logout'),
-    path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/', calendar_views.dashboard, name='dashboard'),
     path('subjects/', views.subject_list, name='subject_list'),
+    path('subjects/import/', views.timetable_import, name='timetable_import'),
     path('subjects/<int:subject_id>/', views.subject_detail, name='subject_detail'),
     path('subjects/<int:subject_id>/edit/', views.edit_subject, name='edit_subject'),
     path('subjects/<int:subject_id>/events/<int:event_id>/edit/', views.edit_event, name='edit_event'),
     path('subjects/<int:subject_id>/enroll/', views.enroll_subject, name='enroll_subject'),
     path('subjects/<int:subject_id>/unenroll/', views.unenroll_subject, name='unenroll_subject'),
-    path('calendar/', views.calendar_view, name='calendar_view'),
-    path('api/events/', views.get_events, name='get_events'),
+    path('calendar/', calendar_views.calendar_view, name='calendar_view'),
+    path('api/events/', calendar_views.get_events, name='get_events'),
+    path('api/events/changes/', views.event_changes, name='event_changes'),
+    path('api/events.ics', views.export_ics, name='export_ics'),
+    path('calendar/feed/<int:user_id>/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
+    path('api/subjects/', views.subjects_api, name='subjects_api'),
+    path('api/subjects/search/', views.subject_search, name='subject_search'),
+    path('api/subjects/<int:subject_id>/', views.subject_api, name='subject_api'),
+    path('api/subjects/<int:subject_id>/events/', views.subject_events_api, name='subject_events_api'),
+    path('api/events/<int:event_id>/', views.event_api, name='event_api'),
+    path('api/batch/', views.batch_api, name='batch_api'),
+    path('api/schedule/', views.schedule_api, name='schedule_api'),
+    path('api/timetables/generate/', views.generate_timetables, name='generate_timetables'),
+    path('api/metrics/cache/', views.cache_metrics, name='cache_metrics'),
+    path('metrics', views.prometheus_metrics, name='prometheus_metrics'),
     path('events/<int:event_id>/delete/', views.delete_event, name='delete_event'),
-]
\ No newline at end of file
+]
+
+# The change stream holds its connection open, which only an async worker can afford
+if settings.PLANMATE_ASYNC_VIEWS:
+    urlpatterns.append(path('api/events/stream/', calendar_views.event_stream, name='event_stream'))
\ No newline at end of file
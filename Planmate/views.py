@@ -3,15 +3,31 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
 from django.core.serializers import serialize
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.contrib.admin.views.decorators import staff_member_required
-from django.urls import reverse_lazy
+from django.views.decorators.http import require_http_methods, require_POST
+from django.urls import reverse, reverse_lazy
 from .models import Subject, Event, Student, Teacher
-from .forms import SubjectForm, EventForm
+from .forms import SubjectForm, EventForm, TimetableImportForm
+from . import api, changelog, enrollment, feed_cache, ical, metrics, search, solver, timetable
+from .streaming import StreamingJsonResponse
+from .conflicts import describe, schedule_conflicts, span
+from .importer import detect_format, import_timetable
+from .recurrence import Occurrence, expand, upcoming, window_filter
+from .timetable import get_calendar_subjects
 from django.contrib.auth.models import User
+import datetime
+import hashlib
 import json
+import time
+from urllib.parse import urlencode
 
 def index(request):
     return render(request, 'index.html')
@@ -34,23 +50,53 @@ def logout_view(request):
     logout(request)
     return redirect('login')
 
+# Number of upcoming events on the dashboard
+UPCOMING_LIMIT = 5
+
+def fragment_timeout():
+    return getattr(settings, 'PLANMATE_FRAGMENT_CACHE_TIMEOUT', 3600)
+
+def subject_versions(subjects):
+    """Return the (id, events_version) of the subjects, which keys their cached template fragments"""
+    return [(subject.pk, subject.events_version) for subject in subjects]
+
 @login_required
 def dashboard(request):
     # Get subjects created by this user
-    subjects = Subject.objects.filter(created_by=request.user)
-    
-    # Get upcoming events for the user's subjects
-    events = Event.objects.filter(subject__in=subjects).filter(end_time__gte=timezone.now()).order_by('start_time')[:5]
+    subjects = list(Subject.objects.filter(created_by=request.user))
+    
+    # Get upcoming events of the user's calendar, from the timetable when it reaches that far
+    now = timezone.now()
+    user_timetable = timetable.timetable_for(request.user, now, now, now=now)
+    events = []
+    if user_timetable is not None:
+        events = [
+            Occurrence(entry.event, entry.start_time, entry.end_time)
+            for entry in timetable.upcoming_entries(user_timetable, now, UPCOMING_LIMIT)
+        ]
+    if len(events) < UPCOMING_LIMIT:
+        # The next events may lie beyond the timetable, expand the weekly series instead
+        candidates = (
+            Event.objects.filter(subject__in=get_calendar_subjects(request.user))
+            .filter(window_filter(now)).select_related('subject')
+        )
+        single_events = candidates.filter(repeat_weekly=False).order_by('start_time')[:UPCOMING_LIMIT]
+        recurring_events = candidates.filter(repeat_weekly=True)
+        events = upcoming([*single_events, *recurring_events], now, limit=UPCOMING_LIMIT)
     
     # Get scheduled subjects for students
     scheduled_subjects = []
     if hasattr(request.user, 'student'):
-        scheduled_subjects = request.user.student.scheduled_subjects.all()
+        scheduled_subjects = list(request.user.student.scheduled_subjects.select_related('created_by'))
     
+    # The subject lists are only rendered when their cached fragments are out of date
     context = {
         'upcoming_events': events,
         'subjects': subjects,
         'scheduled_subjects': scheduled_subjects,
+        'subject_versions': subject_versions(subjects),
+        'scheduled_versions': subject_versions(scheduled_subjects),
+        'fragment_timeout': fragment_timeout(),
     }
     return render(request, 'dashboard.html', context)
 
@@ -87,31 +133,102 @@ def subject_list(request):
     # Show subjects created by this user
     subjects = Subject.objects.filter(created_by=request.user)
     
-    # Get all subjects for enrollment (except those already scheduled)
-    all_subjects = Subject.objects.exclude(created_by=request.user)
-    scheduled_subject_ids = []
+    # Get one page of the other users' subjects for enrollment
+    catalog = get_catalog_page(request)
+    scheduled_subject_ids = set()
     if hasattr(request.user, 'student'):
-        scheduled_subject_ids = request.user.student.scheduled_subjects.values_list('id', flat=True)
+        scheduled_subject_ids = set(request.user.student.scheduled_subjects.values_list('id', flat=True))
     
     # Prepare form for creating new subjects
     form = SubjectForm()
     
     context = {
         'subjects': subjects,
-        'all_subjects': all_subjects,
+        'all_subjects': catalog['subjects'],
+        'catalog': catalog,
         'scheduled_subject_ids': scheduled_subject_ids,
         'form': form,
     }
     return render(request, 'subjects/list.html', context)
 
+CATALOG_PAGE_SIZE = 50
+CATALOG_FILTERS = ('code', 'q', 'semester', 'credits')
+
+def get_catalog_page(request):
+    """Return one keyset-paginated page of the subject catalog.
+
+    Pages are ordered by the unique subject code and addressed with the
+    ``after``/``before`` codes of the neighbouring page, so every page is an
+    index range scan whatever its position in the catalog.
+    """
+    filters = {name: request.GET.get(name, '').strip() for name in CATALOG_FILTERS}
+    subjects = Subject.objects.exclude(created_by=request.user).select_related('created_by')
+    
+    if filters['code']:
+        subjects = subjects.filter(search.code_prefix_q(filters['code']))
+    if filters['q']:
+        subjects = subjects.filter(search.text_q(filters['q']))
+    if filters['semester']:
+        subjects = subjects.filter(semester=filters['semester'])
+    if filters['credits'].isdigit():
+        subjects = subjects.filter(credits=int(filters['credits']))
+    
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if before:
+        page = list(subjects.filter(code__lt=before).order_by('-code')[:CATALOG_PAGE_SIZE + 1])
+        has_more = len(page) > CATALOG_PAGE_SIZE
+        page = page[:CATALOG_PAGE_SIZE][::-1]
+        has_previous, has_next = has_more, True
+    else:
+        if after:
+            subjects = subjects.filter(code__gt=after)
+        page = list(subjects.order_by('code')[:CATALOG_PAGE_SIZE + 1])
+        has_next = len(page) > CATALOG_PAGE_SIZE
+        page = page[:CATALOG_PAGE_SIZE]
+        has_previous = bool(after)
+    
+    query = {name: value for name, value in filters.items() if value}
+    return {
+        'subjects': page,
+        'filters': filters,
+        'is_filtered': bool(query or after or before),
+        'next_query': urlencode({**query, 'after': page[-1].code}) if has_next and page else None,
+        'previous_query': urlencode({**query, 'before': page[0].code}) if has_previous and page else None,
+    }
+
+@login_required
+def timetable_import(request):
+    """Upload a CSV or JSON file of subjects and events"""
+    report = None
+    if request.method == 'POST':
+        form = TimetableImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                report = import_timetable(upload, request.user, detect_format(upload.name))
+            except ValueError as error:
+                messages.error(request, f'Import stopped: {error}')
+            else:
+                messages.success(
+                    request,
+                    f'Imported {report.subjects_created} subjects and {report.events_created} events.',
+                )
+                if report.error_count:
+                    messages.warning(request, f'{report.error_count} rows were skipped.')
+            form = TimetableImportForm()
+    else:
+        form = TimetableImportForm()
+    return render(request, 'subjects/import.html', {'form': form, 'report': report})
+
 @login_required
 def subject_detail(request, subject_id):
-    subject = get_object_or_404(Subject, id=subject_id)
+    subject = get_object_or_404(Subject.objects.select_related('created_by'), id=subject_id)
     
     # Check if the user owns this subject or has scheduled it
     is_owner = subject.created_by == request.user
     is_scheduled = False
-    if hasattr(request.user, 'student'):
+    if not is_owner and hasattr(request.user, 'student'):
         is_scheduled = request.user.student.scheduled_subjects.filter(id=subject_id).exists()
     
     if not is_owner and not is_scheduled:
@@ -150,12 +267,14 @@ def subject_detail(request, subject_id):
         # Prepare form for creating new events (only for owners)
         form = EventForm(initial={'subject': subject}) if is_owner else None
     
+    # The events are only read when the cached table is out of date
     context = {
         'subject': subject,
         'events': events,
         'form': form,
         'is_owner': is_owner,
         'is_scheduled': is_scheduled,
+        'fragment_timeout': fragment_timeout(),
     }
     return render(request, 'subjects/detail.html', context)
 
@@ -169,12 +288,21 @@ def enroll_subject(request, subject_id):
         messages.error(request, 'Only students can enroll in subjects.')
         return redirect('subject_list')
     
-    # Make sure user doesn't already have this subject scheduled
-    if request.user.student.scheduled_subjects.filter(id=subject_id).exists():
+    # Refuse subjects that overlap the current schedule
+    conflicts = schedule_conflicts(request.user.student, [subject])
+    if conflicts:
+        messages.error(request, f'Cannot schedule "{subject.name}": it overlaps {describe(conflicts)}.')
+        return redirect('subject_list')
+    
+    # Takes a seat atomically, so a full subject is never over-enrolled
+    result = enrollment.enroll(request.user.student, subject)
+    if result == enrollment.ENROLLED:
+        messages.success(request, f'Successfully scheduled "{subject.name}".')
+    elif result == enrollment.ALREADY_ENROLLED:
         messages.info(request, f'You have already scheduled "{subject.name}".')
     else:
-        request.user.student.scheduled_subjects.add(subject)
-        messages.success(request, f'Successfully scheduled "{subject.name}".')
+        position = enrollment.waitlist_position(request.user.student, subject)
+        messages.info(request, f'"{subject.name}" is full. You are number {position} on the waitlist.')
     
     return redirect('subject_list')
 
@@ -188,12 +316,14 @@ def unenroll_subject(request, subject_id):
         messages.error(request, 'Only students can unenroll from subjects.')
         return redirect('subject_list')
     
-    # Make sure user has this subject scheduled
-    if not request.user.student.scheduled_subjects.filter(id=subject_id).exists():
-        messages.info(request, f'You do not have "{subject.name}" scheduled.')
-    else:
-        request.user.student.scheduled_subjects.remove(subject)
+    # A freed seat goes to the first student on the waitlist
+    result = enrollment.unenroll(request.user.student, subject)
+    if result == enrollment.UNENROLLED:
         messages.success(request, f'Successfully removed "{subject.name}" from your schedule.')
+    elif result == enrollment.LEFT_WAITLIST:
+        messages.success(request, f'You left the waitlist of "{subject.name}".')
+    else:
+        messages.info(request, f'You do not have "{subject.name}" scheduled.')
     
     return redirect('subject_list')
 
@@ -269,56 +399,497 @@ def delete_event(request, event_id):
     messages.success(request, f'Event "{event_type}" deleted successfully!')
     return redirect('subject_detail', subject_id=subject_id)
 
+def calendar_etag(user, subjects, *extra):
+    """Build an ETag from the user and the (id, events_version) of their subjects"""
+    versions = sorted((subject_id, version) for subject_id, version, *_ in subjects)
+    digest = hashlib.sha1(repr((user.pk, extra, versions)).encode()).hexdigest()
+    return f'"{digest}"'
+
+def conditional_calendar_response(request, subjects, build_response, *extra, user=None):
+    """Return 304 Not Modified when none of ``subjects`` changed, else ``build_response()``
+
+    ``subjects`` holds (id, events_version, events_changed_at) rows of the
+    calendar of ``user``, which defaults to the logged in user.
+    """
+    etag = calendar_etag(user or request.user, subjects, *extra)
+    timestamp = calendar_last_modified(subjects)
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build_response()
+    return set_calendar_validators(response, etag, timestamp)
+
+def calendar_last_modified(subjects):
+    """Return the latest change of ``subjects`` as a timestamp, or None"""
+    # Dropping a subject does not move this date, which is why the ETag is checked first
+    last_modified = max((changed_at for _, _, changed_at in subjects), default=None)
+    return int(last_modified.timestamp()) if last_modified else None
+
+def set_calendar_validators(response, etag, timestamp):
+    response.headers['ETag'] = etag
+    if timestamp is not None:
+        response.headers['Last-Modified'] = http_date(timestamp)
+    # Let browsers keep the body but revalidate it on every fetch
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 @login_required
 def calendar_view(request):
     # Show only events for subjects created by this user or scheduled by this student
-    user_subjects = Subject.objects.filter(created_by=request.user)
-    
-    # Include scheduled subjects for students
-    scheduled_subjects = []
-    if hasattr(request.user, 'student'):
-        scheduled_subjects = request.user.student.scheduled_subjects.all()
-    
-    all_subjects = user_subjects | scheduled_subjects
-    all_subjects = all_subjects.distinct()
+    all_subjects = list(
+        get_calendar_subjects(request.user)
+        .only('id', 'code', 'name', 'created_by', 'events_version', 'events_changed_at')
+        .order_by('code')
+    )
+    
+    token = ical.feed_token(request.user)
+    
+    def build_response():
+        feed_url = request.build_absolute_uri(
+            reverse('calendar_feed', kwargs={'user_id': request.user.id, 'token': token})
+        )
+        return render(request, 'calendar/calendar.html', {
+            'subjects': all_subjects, 'feed_url': feed_url, 'event_stream_url': event_stream_url(),
+            # Events can only be added to the user's own subjects
+            'own_subjects': [subject for subject in all_subjects if subject.created_by_id == request.user.id],
+        })
     
-    return render(request, 'calendar/calendar.html', {'subjects': all_subjects})
+    # Pending messages are only shown on a fresh render
+    if len(messages.get_messages(request)):
+        return build_response()
+    subjects = [(subject.id, subject.events_version, subject.events_changed_at) for subject in all_subjects]
+    return conditional_calendar_response(
+        request, subjects, build_response, 'calendar', request.user.username, token,
+    )
+
+def event_stream_url():
+    """Return the URL of the calendar's change stream, which needs the async views"""
+    return reverse('event_stream') if settings.PLANMATE_ASYNC_VIEWS else None
+
+def parse_event_window(request):
+    """Return the aware (start, end) datetimes FullCalendar asked for.
+
+    Either bound may be missing, in which case it is returned as ``None``.
+    Raises ``ValueError`` when a bound is present but cannot be parsed.
+    """
+    bounds = []
+    for param in ('start', 'end'):
+        value = request.GET.get(param)
+        if not value:
+            bounds.append(None)
+            continue
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f'Invalid "{param}" parameter: {value}')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        bounds.append(parsed)
+    return tuple(bounds)
+
+# Number of subjects whose events are serialized together by the events feed
+FEED_SUBJECT_BATCH = 50
+
+def parse_subject_filter(request):
+    """Return the id of the only subject the events feed should include, or None.
+
+    Raises ``ValueError`` when it is not a number.
+    """
+    value = request.GET.get('subject')
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'Invalid "subject" parameter: {value}')
 
 @login_required
 def get_events(request):
     """API endpoint to get events for calendar"""
-    # Show only events for subjects created by this user or scheduled by this student
-    user_subjects = Subject.objects.filter(created_by=request.user)
+    try:
+        window_start, window_end = parse_event_window(request)
+        subject_id = parse_subject_filter(request)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
     
-    # Include scheduled subjects for students
-    scheduled_subjects = []
-    if hasattr(request.user, 'student'):
-        scheduled_subjects = request.user.student.scheduled_subjects.all()
-    
-    all_subjects = user_subjects | scheduled_subjects
-    all_subjects = all_subjects.distinct()
-    
-    events = Event.objects.filter(subject__in=all_subjects)
-    
-    # Convert events to JSON serializable format
-    events_data = []
-    for event in events:
-        events_data.append({
-            'id': event.id,
-            'title': f"{event.subject.code} - {event.get_event_type_display()}",
-            'start': event.start_time.isoformat(),
-            'end': event.end_time.isoformat(),
-            'backgroundColor': get_event_color(event.event_type),
-            'borderColor': get_event_color(event.event_type),
-            'extendedProps': {
-                'location': event.location,
-                'notes': event.notes,
-                'subject': event.subject.name,
-                'subject_id': event.subject.id,  # Add subject_id for deletion
+    # Show only events for subjects created by this user or scheduled by this student
+    calendar_subjects = get_calendar_subjects(request.user)
+    if subject_id is not None:
+        # The calendar refreshes one subject at a time after a pushed change
+        calendar_subjects = calendar_subjects.filter(pk=subject_id)
+    else:
+        # Windows near the present are read from the user's materialized timetable
+        user_timetable = timetable.timetable_for(request.user, window_start, window_end)
+        if user_timetable is not None:
+            return conditional_calendar_response(
+                request, timetable_versions(user_timetable),
+                lambda: StreamingJsonResponse(stream_timetable_events(user_timetable, window_start, window_end)),
+                'events', feed_cache.window_key(window_start, window_end),
+            )
+    subjects = sorted(calendar_subjects.values_list('id', 'events_version', 'events_changed_at'))
+    
+    def build_response():
+        return StreamingJsonResponse(stream_events(subjects, window_start, window_end))
+    
+    return conditional_calendar_response(
+        request, subjects, build_response,
+        'events', feed_cache.window_key(window_start, window_end),
+    )
+
+def ical_response(request, user, filename=None):
+    """Stream the user's timetable as an iCalendar file, or answer 304 if unchanged"""
+    subjects = sorted(get_calendar_subjects(user).values_list('id', 'events_version', 'events_changed_at'))
+    
+    def build_response():
+        events = (
+            Event.objects.filter(subject__in=[subject_id for subject_id, _, _ in subjects])
+            .select_related('subject')
+            .order_by('subject_id', 'start_time', 'id')
+            .iterator(chunk_size=1000)
+        )
+        response = StreamingHttpResponse(
+            ical.calendar_stream(events, f'Planmate - {user.username}', request.get_host()),
+            content_type='text/calendar; charset=utf-8',
+        )
+        if filename:
+            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    return conditional_calendar_response(request, subjects, build_response, 'ics', user=user)
+
+@login_required
+def export_ics(request):
+    """Download the user's timetable as an .ics file"""
+    return ical_response(request, request.user, filename='planmate.ics')
+
+def calendar_feed(request, user_id, token):
+    """Calendar subscription feed, authenticated by the token in its URL instead of a session"""
+    user = ical.feed_user(user_id, token)
+    if user is None:
+        raise Http404('Unknown calendar feed')
+    return ical_response(request, user)
+
+def stream_events(subjects, window_start, window_end):
+    """Yield the serialized events of ``subjects`` in order, a batch of subjects at a time.
+
+    Only one batch of fragments is held in memory, whatever the number of
+    subjects on the calendar.
+    """
+    for offset in range(0, len(subjects), FEED_SUBJECT_BATCH):
+        batch = subjects[offset:offset + FEED_SUBJECT_BATCH]
+        # Per-subject fragments are cached and shared by everyone who has the subject
+        fragments = feed_cache.get_subject_fragments(
+            {subject_id: version for subject_id, version, _ in batch},
+            window_start, window_end,
+            lambda missing: build_event_fragments(missing, window_start, window_end),
+        )
+        for subject_id, _, _ in batch:
+            yield from fragments[subject_id]
+
+def event_fragment_rows(subject_ids, window_start, window_end):
+    """Return the events of the subjects with an occurrence in the window, as plain rows"""
+    return (
+        Event.objects.filter(subject__in=subject_ids)
+        .filter(window_filter(window_start, window_end))
+        .values_list(
+            'id', 'subject_id', 'subject__code', 'subject__name', 'event_type', 'start_time', 'end_time',
+            'location', 'notes', 'repeat_weekly', 'repeat_until', named=True,
+        )
+    )
+
+def build_event_fragments(subject_ids, window_start, window_end):
+    """Serialize the occurrences inside the window, grouped by subject id"""
+    events = event_fragment_rows(subject_ids, window_start, window_end).iterator(chunk_size=2000)
+    return serialize_event_fragments(events, window_start, window_end)
+
+def serialize_event_fragments(events, window_start, window_end):
+    # Convert occurrences to JSON serializable format
+    fragments = {}
+    for event, start_time, end_time in expand(events, window_start, window_end):
+        fragments.setdefault(event.subject_id, []).append(event_json(
+            event.id, event.subject_id, event.subject__code, event.subject__name,
+            event.event_type, event.location, event.notes, start_time, end_time,
+        ))
+    return fragments
+
+EVENT_TYPE_NAMES = dict(Event.EVENT_TYPES)
+
+def event_json(event_id, subject_id, code, subject_name, event_type, location, notes, start_time, end_time):
+    """Return one occurrence as FullCalendar expects it"""
+    return {
+        'id': event_id,
+        'title': f"{code} - {EVENT_TYPE_NAMES.get(event_type, event_type)}",
+        'start': start_time.isoformat(),
+        'end': end_time.isoformat(),
+        'backgroundColor': get_event_color(event_type),
+        'borderColor': get_event_color(event_type),
+        'extendedProps': {
+            'location': location,
+            'notes': notes,
+            'subject': subject_name,
+            'subject_id': subject_id,  # Add subject_id for deletion
+        }
+    }
+
+def stream_timetable_events(user_timetable, window_start, window_end):
+    """Yield the serialized entries of a materialized timetable inside the window"""
+    rows = timetable.entry_rows(user_timetable, window_start, window_end).iterator(chunk_size=2000)
+    for row in rows:
+        yield event_json(*row)
+
+def timetable_versions(user_timetable):
+    """Stand in for the calendar subjects in ETags, as the timetable changes with any of them"""
+    return [('timetable', user_timetable.version, user_timetable.changed_at)]
+
+CHANGES_PAGE_LIMIT = 1000
+
+@login_required
+def event_changes(request):
+    """Changes to the events of the user's calendar since a cursor, for incremental sync"""
+    try:
+        limit = int(request.GET.get('limit', 500))
+    except ValueError:
+        limit = 500
+    limit = min(max(limit, 1), CHANGES_PAGE_LIMIT)
+    try:
+        page = changelog.changes_page(request.user, request.GET.get('since') or None, limit)
+    except changelog.InvalidCursor as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(page)
+
+@login_required
+def subject_search(request):
+    """Ranked type-ahead search over the subject catalog"""
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = 10
+    subjects = search.search_subjects(request.GET.get('q', '')[:100], limit=limit)
+    results = [
+        {
+            'id': subject.id,
+            'code': subject.code,
+            'name': subject.name,
+            'credits': subject.credits,
+            'semester': subject.semester,
+        }
+        for subject in subjects
+    ]
+    return JsonResponse({'results': results})
+
+# Subjects one schedule request may change
+SCHEDULE_BATCH_LIMIT = 50
+
+@login_required
+@require_POST
+def schedule_api(request):
+    """Enroll in and drop many subjects at once.
+
+    Takes ``{"enroll": [subject ids], "unenroll": [subject ids]}`` and returns
+    the result of each subject, applied in one transaction.
+    """
+    if not hasattr(request.user, 'student'):
+        return JsonResponse({'error': 'Only students can enroll in subjects.'}, status=403)
+    try:
+        data = json.loads(request.body)
+        enroll_ids = data.get('enroll', [])
+        unenroll_ids = data.get('unenroll', [])
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Expected a JSON object with "enroll" and "unenroll" lists.'}, status=400)
+    ids = [*enroll_ids, *unenroll_ids] if isinstance(enroll_ids, list) and isinstance(unenroll_ids, list) else None
+    if ids is None or not all(type(subject_id) is int for subject_id in ids):
+        return JsonResponse({'error': '"enroll" and "unenroll" must be lists of subject ids.'}, status=400)
+    if len(ids) > SCHEDULE_BATCH_LIMIT:
+        return JsonResponse({'error': f'At most {SCHEDULE_BATCH_LIMIT} subjects per request.'}, status=400)
+    
+    try:
+        results = enrollment.apply_schedule(request.user.student, enroll_ids, unenroll_ids)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    except enrollment.ScheduleChanged:
+        return JsonResponse({'error': 'Your schedule was changed by another request, please retry.'}, status=409)
+    return JsonResponse({'results': results})
+
+# Operations one batch request may apply
+API_BATCH_LIMIT = 200
+
+def api_response(run, status=200):
+    """Run an ``api`` call and return its record as JSON, or its error"""
+    try:
+        result = run()
+    except api.ApiError as exc:
+        return JsonResponse(exc.as_json(), status=exc.status)
+    if result is None:
+        return HttpResponse(status=204)
+    return JsonResponse(result, status=status, safe=False)
+
+def json_body(request):
+    try:
+        return json.loads(request.body)
+    except ValueError:
+        raise api.ApiError(400, 'The request body must be JSON.')
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def subjects_api(request):
+    """List the user's own subjects, or create one"""
+    if request.method == 'GET':
+        subjects = Subject.objects.filter(created_by=request.user).order_by('code')
+        return JsonResponse({'results': [api.subject_record(subject) for subject in subjects]})
+    return api_response(lambda: api.create_subject(request.user, json_body(request)), status=201)
+
+@login_required
+@require_http_methods(['GET', 'PATCH', 'DELETE'])
+def subject_api(request, subject_id):
+    """Read, update with the changed fields, or delete one subject"""
+    if request.method == 'GET':
+        return api_response(lambda: api.subject_record(api.get_subject(subject_id, request.user, editing=False)))
+    if request.method == 'PATCH':
+        return api_response(lambda: api.update_subject(request.user, subject_id, json_body(request)))
+    return api_response(lambda: api.delete_subject(request.user, subject_id))
+
+@login_required
+@require_POST
+def subject_events_api(request, subject_id):
+    """Create an event of the subject"""
+    def create():
+        data = json_body(request)
+        if not isinstance(data, dict):
+            raise api.ApiError(400, 'Expected a JSON object of fields.')
+        return api.create_event(request.user, {**data, 'subject': api.get_subject(subject_id, request.user).pk})
+
+    return api_response(create, status=201)
+
+@login_required
+@require_http_methods(['GET', 'PATCH', 'DELETE'])
+def event_api(request, event_id):
+    """Read, update with the changed fields, or delete one event"""
+    if request.method == 'GET':
+        return api_response(lambda: changelog.event_record(api.get_event(event_id, request.user, editing=False)))
+    if request.method == 'PATCH':
+        return api_response(lambda: api.update_event(request.user, event_id, json_body(request)))
+    return api_response(lambda: api.delete_event(request.user, event_id))
+
+@login_required
+@require_POST
+def batch_api(request):
+    """Apply many subject and event operations in one transaction.
+
+    Takes ``{"operations": [...]}`` as described in ``Planmate.api`` and
+    returns ``{"results": [...]}``, or the error of the first failing
+    operation with its ``index`` when nothing was changed.
+    """
+    def apply():
+        data = json_body(request)
+        operations = data.get('operations') if isinstance(data, dict) else None
+        if not isinstance(operations, list):
+            raise api.ApiError(400, 'Expected a JSON object with an "operations" list.')
+        if len(operations) > API_BATCH_LIMIT:
+            raise api.ApiError(400, f'At most {API_BATCH_LIMIT} operations per request.')
+        return {'results': api.apply_batch(request.user, operations)}
+
+    return api_response(apply)
+
+# Subjects and timetables one generator request may ask for
+GENERATE_SUBJECT_LIMIT = 60
+GENERATE_RESULT_LIMIT = 20
+
+def parse_generate_request(body):
+    """Return (subject ids, constraints, limit, keep schedule) of a generator request, or raise ValueError"""
+    data = json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object.')
+    subject_ids = data.get('subjects')
+    if not isinstance(subject_ids, list) or not all(type(subject_id) is int for subject_id in subject_ids):
+        raise ValueError('"subjects" must be a list of subject ids.')
+    if not 0 < len(subject_ids) <= GENERATE_SUBJECT_LIMIT:
+        raise ValueError(f'Give between 1 and {GENERATE_SUBJECT_LIMIT} subjects.')
+    limit = data.get('limit', 5)
+    if type(limit) is not int or not 0 < limit <= GENERATE_RESULT_LIMIT:
+        raise ValueError(f'"limit" must be between 1 and {GENERATE_RESULT_LIMIT}.')
+    
+    times = {}
+    for name in ('earliest_start', 'latest_end'):
+        value = data.get(name)
+        try:
+            times[name] = None if value is None else datetime.time.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'"{name}" must be a time such as "09:00".')
+    free_days = data.get('free_days', [])
+    if not isinstance(free_days, list) or not all(day in range(7) and type(day) is int for day in free_days):
+        raise ValueError('"free_days" must list weekdays from 0 (Monday) to 6 (Sunday).')
+    max_gap = data.get('max_gap_minutes')
+    if max_gap is not None and (type(max_gap) is not int or max_gap < 0):
+        raise ValueError('"max_gap_minutes" must be a number of minutes.')
+    constraints = solver.Constraints(times['earliest_start'], times['latest_end'], frozenset(free_days), max_gap)
+    return list(dict.fromkeys(subject_ids)), constraints, limit, data.get('keep_schedule', True) is not False
+
+@login_required
+@require_POST
+def generate_timetables(request):
+    """Suggest conflict-free choices of sections for a set of subjects.
+
+    Takes ``{"subjects": [ids], "earliest_start": "09:00", "latest_end": "17:00",
+    "free_days": [4], "max_gap_minutes": 120, "limit": 5}``. Timetables fit
+    around the student's current schedule unless ``keep_schedule`` is false.
+    """
+    try:
+        subject_ids, constraints, limit, keep_schedule = parse_generate_request(request.body)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    subjects = Subject.objects.in_bulk(subject_ids)
+    missing = [subject_id for subject_id in subject_ids if subject_id not in subjects]
+    if missing:
+        return JsonResponse({'error': f'Unknown subjects: {missing}'}, status=404)
+    
+    fields = ('subject_id', 'section', 'start_time', 'end_time', 'repeat_weekly', 'repeat_until')
+    events = list(Event.objects.filter(subject__in=subject_ids).only(*fields))
+    fixed_events = []
+    window_start, window_end = span(events)
+    if keep_schedule and hasattr(request.user, 'student') and window_start is not None:
+        # The solver treats weekly series as running all semester, so only the scheduled
+        # events running at the same dates may block a section, not those of past semesters
+        fixed_events = (
+            Event.objects.filter(subject__in=request.user.student.scheduled_subjects.values('id'))
+            .exclude(subject__in=subject_ids).filter(window_filter(window_start, window_end)).only(*fields)
+        )
+    started = time.perf_counter()
+    result = solver.generate(subject_ids, events, fixed_events, constraints, limit)
+    
+    return JsonResponse({
+        'timetables': [
+            {
+                'score': timetable.score,
+                'days': timetable.days,
+                'gap_minutes': timetable.gap_minutes,
+                'sections': [
+                    {
+                        'subject': section.subject_id,
+                        'code': subjects[section.subject_id].code,
+                        'section': section.name,
+                        'alternatives': section.alternatives,
+                    }
+                    for section in timetable.sections
+                ],
             }
-        })
-    
-    return JsonResponse(events_data, safe=False)
+            for timetable in result.timetables
+        ],
+        'complete': result.complete,
+        'explored': result.explored,
+        'unsatisfiable': result.unsatisfiable,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+
+@staff_member_required
+def cache_metrics(request):
+    """Hit ratio and rebuild latency of the calendar feed cache"""
+    return JsonResponse(metrics.feed_cache_stats())
+
+def prometheus_metrics(request):
+    """Request profiles and cache metrics in the Prometheus text format"""
+    token = getattr(settings, 'PLANMATE_METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    if not (request.user.is_staff or (token and constant_time_compare(authorization, f'Bearer {token}'))):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render_prometheus(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
 
 def get_event_color(event_type):
     """Return color based on event type"""
@@ -0,0 +1,12 @@
+"""Performance benchmarks for Planmate.
+
+Each module can be run on its own, e.g. ``python -m benchmarks.recurrence``.
+"""
+import os
+
+
+def setup_django():
+    """Configure Django so benchmarks can import the Planmate models"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Classscheduler.settings')
+    import django
+    django.setup()
@@ -0,0 +1,72 @@
+"""Benchmark for the conflict engine.
+
+Checks a 10-subject timetable against a catalog of weekly subjects, both with
+the sweep line (every conflicting occurrence) and with the busy index (which
+catalog subjects still fit).
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from benchmarks import setup_django
+
+
+def build_subject_events(rng, subject_id, events_per_subject, semester_start, until):
+    from Planmate.models import Event
+
+    events = []
+    for _ in range(events_per_subject):
+        start = semester_start + timedelta(days=rng.randrange(5), hours=rng.randrange(8, 18))
+        events.append(Event(
+            pk=None,
+            subject_id=subject_id,
+            event_type='class',
+            location=f'Room {rng.randrange(200)}',
+            start_time=start,
+            end_time=start + timedelta(hours=rng.choice((1, 2, 3))),
+            repeat_weekly=True,
+            repeat_until=until,
+        ))
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--catalog', type=int, default=5000)
+    parser.add_argument('--timetable', type=int, default=10)
+    parser.add_argument('--events-per-subject', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    setup_django()
+    from Planmate.conflicts import conflicting_subject_ids, find_conflicts, span
+
+    rng = random.Random(args.seed)
+    semester_start = datetime(2025, 6, 9, tzinfo=timezone.utc)
+    until = date(2025, 10, 10)
+    timetable = [
+        event
+        for subject_id in range(args.timetable)
+        for event in build_subject_events(rng, subject_id, args.events_per_subject, semester_start, until)
+    ]
+    catalog = [
+        event
+        for subject_id in range(args.timetable, args.timetable + args.catalog)
+        for event in build_subject_events(rng, subject_id, args.events_per_subject, semester_start, until)
+    ]
+
+    started = time.perf_counter()
+    clashing = conflicting_subject_ids(timetable, catalog)
+    elapsed = time.perf_counter() - started
+    print(f'busy index: {len(clashing)}/{args.catalog} catalog subjects clash, {elapsed * 1000:.1f} ms')
+
+    window_start, window_end = span(timetable)
+    started = time.perf_counter()
+    conflicts = find_conflicts(timetable, catalog, window_start, window_end)
+    elapsed = time.perf_counter() - started
+    print(f'sweep line: {len(conflicts)} conflicting occurrences, {elapsed * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Connection setup cost per request, with and without connection reuse.
+
+Point the settings at the real database first, e.g.::
+
+    DB_PORT=6543 python -m benchmarks.db_connections --requests 200
+
+Simulates requests the way Django's handlers do: ``request_started``, one
+small query, then ``request_finished``, which closes connections that are
+obsolete. Each mode is run in turn:
+
+* ``per-request``: ``CONN_MAX_AGE = 0``, a new connection for every request
+* ``persistent``: ``CONN_MAX_AGE`` with health checks, as in the settings
+* ``pool``: a psycopg 3 pool, only on PostgreSQL with ``psycopg_pool`` installed
+
+and the latency per request and number of connections opened are printed.
+The difference from ``per-request`` is the connection setup cost saved.
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import setup_django
+
+
+def run_mode(connection, requests):
+    from django.core.signals import request_finished, request_started
+    from django.db.backends.signals import connection_created
+
+    opened = []
+
+    def count(sender, connection, **kwargs):
+        opened.append(connection.alias)
+
+    connection_created.connect(count)
+    samples = []
+    try:
+        for _ in range(requests):
+            started = time.perf_counter()
+            request_started.send(sender=None)
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            request_finished.send(sender=None)
+            samples.append(time.perf_counter() - started)
+    finally:
+        connection_created.disconnect(count)
+        connection.close()
+    return samples, len(opened)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--conn-max-age', type=int, default=60)
+    parser.add_argument('--pool-size', type=int, default=4)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+
+    settings_dict = connection.settings_dict
+    original = {key: settings_dict.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+    original_options = dict(settings_dict.get('OPTIONS', {}))
+    modes = [
+        ('per-request', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}, None),
+        ('persistent', {'CONN_MAX_AGE': args.conn_max_age, 'CONN_HEALTH_CHECKS': True}, None),
+    ]
+    if connection.vendor == 'postgresql':
+        pool = {'min_size': 1, 'max_size': args.pool_size}
+        modes.append(('pool', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}, pool))
+
+    print(f'{connection.vendor} database {settings_dict["NAME"]}, {args.requests} requests per mode')
+    baseline = None
+    for name, overrides, pool in modes:
+        connection.close()
+        settings_dict.update(overrides)
+        options = {key: value for key, value in original_options.items() if key != 'pool'}
+        if pool is not None:
+            options['pool'] = pool
+        settings_dict['OPTIONS'] = options
+        try:
+            samples, opened = run_mode(connection, args.requests)
+        except Exception as error:  # e.g. psycopg_pool is not installed
+            print(f'{name:12} skipped: {error}')
+            continue
+        finally:
+            if pool is not None and connection.vendor == 'postgresql':
+                connection.close_pool()
+        mean = statistics.fmean(samples)
+        baseline = mean if baseline is None else baseline
+        percentiles = statistics.quantiles(samples, n=100)
+        print(
+            f'{name:12} mean {mean * 1000:8.2f} ms  p50 {percentiles[49] * 1000:8.2f} ms  '
+            f'p95 {percentiles[94] * 1000:8.2f} ms  {opened:5} connections  '
+            f'saved {(baseline - mean) * 1000:8.2f} ms/request'
+        )
+
+    settings_dict.update(original)
+    settings_dict['OPTIONS'] = original_options
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Peak memory of the calendar events feed, buffered versus streamed.
+
+Needs a user with many subjects, e.g. the owner created by
+``python -m benchmarks.import_timetable``::
+
+    python -m benchmarks.events_feed --username imp_registrar
+
+The feed cache is replaced with a dummy cache so that every fragment is
+rebuilt and cached fragments do not count as request memory. The buffered
+run builds the whole list and a ``JsonResponse`` like the feed used to; the
+streamed run reads ``get_events`` chunk by chunk.
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks import setup_django
+
+
+def measure(label, run):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = run()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:9} {size / 2**20:6.1f} MiB body in {elapsed:.2f} s, peak {peak / 2**20:.1f} MiB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--username', default='imp_registrar')
+    parser.add_argument('--start', default='2025-06-01T00:00:00+00:00')
+    parser.add_argument('--end', default='2025-12-01T00:00:00+00:00')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.http import JsonResponse
+    from django.test import RequestFactory, override_settings
+    from django.utils.dateparse import parse_datetime
+
+    from Planmate import views
+
+    user = User.objects.get(username=args.username)
+    window = (parse_datetime(args.start), parse_datetime(args.end))
+    subjects = sorted(views.get_calendar_subjects(user).values_list('id', 'events_version', 'events_changed_at'))
+
+    def buffered():
+        events = list(views.stream_events(subjects, *window))
+        return len(JsonResponse(events, safe=False).content)
+
+    def streamed():
+        request = RequestFactory().get('/api/events/', {'start': args.start, 'end': args.end})
+        request.user = user
+        return sum(len(chunk) for chunk in views.get_events(request).streaming_content)
+
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+        print(f'{len(subjects)} subjects')
+        measure('buffered', buffered)
+        measure('streamed', streamed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Print the query plans of the calendar and dashboard event queries.
+
+Seed a large dataset first, e.g.::
+
+    python manage.py seed_benchmark --events 1000000
+    python -m benchmarks.explain_plans
+
+On PostgreSQL the plans come from ``EXPLAIN ANALYZE`` and should show index
+scans on ``event_subject_start_idx``/``event_subject_end_idx`` rather than a
+sequential scan of the event table.
+"""
+import argparse
+from datetime import timedelta
+
+from benchmarks import setup_django
+
+
+def explain(connection, sql, params):
+    """Return the plan of one captured query as text"""
+    if connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) '
+    elif connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        prefix = 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+def capture_event_queries(view, request):
+    """Run ``view`` and return the (sql, params) of its event table queries"""
+    from django.db import connection
+
+    captured = []
+
+    def record(execute, sql, params, many, context):
+        if 'Planmate_event' in sql:
+            captured.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        response = view(request)
+        if response.streaming:
+            # Streamed responses query while their body is read
+            b''.join(response.streaming_content)
+    return captured
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--username', default='bench_user0')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.contrib.messages.storage.fallback import FallbackStorage
+    from django.db import connection
+    from django.test import RequestFactory
+    from django.utils import timezone
+
+    from Planmate import views
+
+    user = User.objects.get(username=args.username)
+    factory = RequestFactory()
+    now = timezone.now()
+    window = {'start': now.isoformat(), 'end': (now + timedelta(days=35)).isoformat()}
+
+    for name, view, request in (
+        ('get_events', views.get_events, factory.get('/api/events/', window)),
+        ('dashboard', views.dashboard, factory.get('/dashboard/')),
+    ):
+        request.user = user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        for sql, params in capture_event_queries(view, request):
+            print(f'== {name}\n{sql}\n-- plan\n{explain(connection, sql, params)}\n')
+
+
+if __name__ == '__main__':
+    main()
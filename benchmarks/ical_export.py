@@ -0,0 +1,49 @@
+"""Throughput and memory of the streaming iCalendar export.
+
+Streams every event of the database (or the first ``--limit``) through the
+same generator as ``/api/events.ics``, e.g.::
+
+    python manage.py seed_benchmark --events 200000
+    python -m benchmarks.ical_export
+
+Python memory is traced while streaming and should not grow with the number
+of events, since rows are fetched with ``.iterator()`` and written in chunks.
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--limit', type=int)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import reset_queries
+
+    from Planmate.ical import calendar_stream
+    from Planmate.models import Event
+
+    events = Event.objects.select_related('subject').order_by('subject_id', 'start_time', 'id')
+    if args.limit:
+        events = events[:args.limit]
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = count = 0
+    for chunk in calendar_stream(events.iterator(chunk_size=1000), 'benchmark', 'localhost'):
+        size += len(chunk.encode())
+        count += chunk.count('BEGIN:VEVENT')
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    reset_queries()
+
+    print(f'{count} events, {size / 2**20:.1f} MiB of iCalendar in {elapsed:.2f} s, peak {peak / 2**20:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Throughput and memory of the timetable import.
+
+Writes a CSV file of weekly events spread over a few hundred subjects and
+imports it for a benchmark user, e.g.::
+
+    python -m benchmarks.import_timetable --events 100000
+
+Prints the import time. With ``--trace-memory`` it also prints the peak
+memory allocated by Python while importing, which should stay flat as
+``--events`` grows; tracing slows the import down several times.
+"""
+import argparse
+import csv
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks import setup_django
+
+
+def write_csv(file, rng, events, subjects, prefix):
+    writer = csv.writer(file)
+    writer.writerow([
+        'code', 'name', 'credits', 'semester', 'event_type', 'start_time', 'end_time',
+        'location', 'repeat_weekly', 'repeat_until',
+    ])
+    origin = datetime(2025, 6, 9, 8)
+    for index in range(events):
+        start = origin + timedelta(days=rng.randrange(120), hours=rng.randrange(10))
+        writer.writerow([
+            f'{prefix}{index % subjects:05d}', f'Imported subject {index % subjects}', 3, '1/2568',
+            rng.choice(['class', 'lab', 'exam']), start.isoformat(' '),
+            (start + timedelta(hours=rng.randint(1, 3))).isoformat(' '),
+            f'Room {rng.randint(100, 999)}', 'false', '',
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--subjects', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('--prefix', default='IMP')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--trace-memory', action='store_true')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+
+    from Planmate.importer import import_timetable
+
+    user, _ = User.objects.get_or_create(username=f'{args.prefix.lower()}_registrar')
+    with tempfile.TemporaryFile('w+', newline='', encoding='utf-8') as file:
+        write_csv(file, random.Random(args.seed), args.events, args.subjects, args.prefix)
+        file.seek(0)
+
+        if args.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        report = import_timetable(file.buffer, user, 'csv', batch_size=args.batch_size)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(f'{report.events_created} events, {report.subjects_created} subjects, {report.error_count} errors')
+    print(f'{elapsed:.2f} s ({report.events_created / elapsed:.0f} events/s)')
+    if args.trace_memory:
+        print(f'peak {peak / 2**20:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Load test comparing the WSGI and ASGI deployments of the calendar views.
+
+Start both servers against the same database, e.g.::
+
+    gunicorn Classscheduler.wsgi --workers 4 --bind 127.0.0.1:8000
+    uvicorn Classscheduler.asgi:application --workers 4 --port 8001
+
+then run::
+
+    python -m benchmarks.load_test --username alice --password secret \\
+        --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001
+
+Each target is logged in once and then hit by ``--concurrency`` clients over
+keep-alive connections for ``--duration`` seconds, cycling through the
+calendar, dashboard and events API URLs. Prints requests per second and
+latency percentiles per target, or JSON with ``--json``. Only the standard
+library is used, so the harness runs anywhere the project does.
+"""
+import argparse
+import asyncio
+import http.cookiejar
+import json
+import statistics
+import time
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+
+def login(base_url, username, password):
+    """Log in through the login form and return the Cookie header value"""
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    opener.open(f'{base_url}/login/').read()
+    csrf_token = next(cookie.value for cookie in jar if cookie.name == 'csrftoken')
+    data = urllib.parse.urlencode({
+        'username': username, 'password': password, 'csrfmiddlewaretoken': csrf_token,
+    }).encode()
+    request = urllib.request.Request(f'{base_url}/login/', data=data, headers={'Referer': f'{base_url}/login/'})
+    opener.open(request).read()
+    if not any(cookie.name == 'sessionid' for cookie in jar):
+        raise SystemExit(f'Could not log in to {base_url} as {username}')
+    return '; '.join(f'{cookie.name}={cookie.value}' for cookie in jar)
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response and return (status, body size, keep alive)"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by the server')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    size = 0
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            length = int((await reader.readline()).split(b';')[0], 16)
+            if length:
+                size += len(await reader.readexactly(length))
+            await reader.readline()
+            if not length:
+                break
+    elif 'content-length' in headers:
+        size = len(await reader.readexactly(int(headers['content-length'])))
+    elif status not in (204, 304):
+        size = len(await reader.read())
+        return status, size, False
+    return status, size, headers.get('connection', '').lower() != 'close'
+
+
+async def client(base_url, cookie, paths, deadline, latencies, errors):
+    parsed = urllib.parse.urlsplit(base_url)
+    connection = None
+    index = 0
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(parsed.hostname, parsed.port or 80)
+            reader, writer = connection
+            writer.write((
+                f'GET {path} HTTP/1.1\r\nHost: {parsed.netloc}\r\nCookie: {cookie}\r\n'
+                f'Accept: */*\r\nConnection: keep-alive\r\n\r\n'
+            ).encode())
+            await writer.drain()
+            status, _, keep_alive = await read_response(reader)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            errors[path] = errors.get(path, 0) + 1
+            connection = None
+            continue
+        if not keep_alive:
+            connection[1].close()
+            connection = None
+        if status != 200:
+            errors[path] = errors.get(path, 0) + 1
+            continue
+        latencies.setdefault(path, []).append(time.perf_counter() - started)
+    if connection is not None:
+        connection[1].close()
+
+
+def summarize(samples):
+    if len(samples) < 2:
+        return {'requests': len(samples)}
+    percentiles = statistics.quantiles(samples, n=100)
+    return {
+        'requests': len(samples),
+        'p50_ms': round(percentiles[49] * 1000, 2),
+        'p95_ms': round(percentiles[94] * 1000, 2),
+        'p99_ms': round(percentiles[98] * 1000, 2),
+    }
+
+
+async def run_target(label, base_url, cookie, paths, concurrency, duration):
+    latencies, errors = {}, {}
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(
+        client(base_url, cookie, paths, deadline, latencies, errors) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    samples = [latency for path_latencies in latencies.values() for latency in path_latencies]
+    return {
+        'target': label,
+        'url': base_url,
+        'concurrency': concurrency,
+        'rps': round(len(samples) / elapsed, 1),
+        'errors': sum(errors.values()),
+        **summarize(samples),
+        'paths': {path: summarize(path_latencies) for path, path_latencies in latencies.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True, help='label=base URL, may be repeated')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds per target')
+    parser.add_argument('--path', action='append', help='URL path to request, defaults to the calendar views')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    now = datetime.now(timezone.utc)
+    window = urllib.parse.urlencode({'start': now.isoformat(), 'end': (now + timedelta(days=35)).isoformat()})
+    paths = args.path or [f'/api/events/?{window}', '/calendar/', '/dashboard/']
+
+    results = []
+    for target in args.target:
+        label, _, base_url = target.partition('=')
+        base_url = base_url.rstrip('/')
+        cookie = login(base_url, args.username, args.password)
+        results.append(asyncio.run(run_target(label, base_url, cookie, paths, args.concurrency, args.duration)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f'{"target":8} {"rps":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+    for result in results:
+        print(
+            f'{result["target"]:8} {result["rps"]:8.1f} {result.get("p50_ms", 0):8.2f} '
+            f'{result.get("p95_ms", 0):8.2f} {result.get("p99_ms", 0):8.2f} {result["errors"]:7}'
+        )
+
+
+if __name__ == '__main__':
+    main()
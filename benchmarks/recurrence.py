@@ -0,0 +1,59 @@
+"""Benchmark for the recurrence engine.
+
+Expands thousands of weekly series into a one week and a one month window.
+The time per request should follow the number of visible occurrences and stay
+flat when the series themselves get longer.
+"""
+import argparse
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from benchmarks import setup_django
+
+
+def build_series(count, weeks):
+    """Return ``count`` unsaved weekly events each lasting ``weeks`` weeks"""
+    from Planmate.models import Event
+
+    first = datetime(2020, 1, 6, 9, 0, tzinfo=timezone.utc)
+    until = date(2020, 1, 6) + timedelta(weeks=weeks)
+    return [
+        Event(
+            event_type='class',
+            start_time=first + timedelta(hours=index % 50),
+            end_time=first + timedelta(hours=index % 50 + 2),
+            repeat_weekly=True,
+            repeat_until=until,
+        )
+        for index in range(count)
+    ]
+
+
+def run(series, weeks, window_days):
+    from Planmate.recurrence import expand
+
+    events = build_series(series, weeks)
+    window_start = datetime(2020, 1, 6, tzinfo=timezone.utc) + timedelta(weeks=weeks // 2)
+    window_end = window_start + timedelta(days=window_days)
+
+    started = time.perf_counter()
+    visible = sum(1 for _ in expand(events, window_start, window_end))
+    elapsed = time.perf_counter() - started
+    return visible, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--series', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup_django()
+    print(f"{'weeks/series':>12} {'window':>8} {'occurrences':>12} {'seconds':>9}")
+    for weeks in (18, 520, 5200):
+        for window_days in (7, 35):
+            visible, elapsed = run(args.series, weeks, window_days)
+            print(f'{weeks:>12} {window_days:>7}d {visible:>12} {elapsed:>9.4f}')
+
+
+if __name__ == '__main__':
+    main()
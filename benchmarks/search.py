@@ -0,0 +1,49 @@
+"""Latency of the type-ahead subject search.
+
+Seed a large catalog first, e.g.::
+
+    python manage.py seed_benchmark --subjects 100000 --events 0
+    python -m benchmarks.search
+
+Runs each query several times, as a user typing would, and prints the p50 and
+p95 latency of ``search_subjects``. The target is a p95 under 20 ms.
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import setup_django
+
+QUERIES = [
+    'b', 'BENCH0', 'BENCH01234', 'prog', 'programming', 'intro prog', 'data struct',
+    'linear alg', 'machine learning', 'thai', 'adv netw', 'statistics 123', 'xyz',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from Planmate.models import Subject
+    from Planmate.search import search_subjects
+
+    print(f'{Subject.objects.count()} subjects')
+    timings = []
+    for query in QUERIES:
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            results = search_subjects(query, limit=args.limit)
+            samples.append(time.perf_counter() - started)
+        timings.extend(samples)
+        print(f'{query!r:20} {len(results):3} results, median {statistics.median(samples) * 1000:.2f} ms')
+
+    percentiles = statistics.quantiles(timings, n=100)
+    print(f'p50 {percentiles[49] * 1000:.2f} ms, p95 {percentiles[94] * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
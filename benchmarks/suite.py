@@ -0,0 +1,241 @@
+"""Benchmark suite of the key views at several data scales, with JSON output.
+
+Runs against a throwaway test database, so it never touches real data::
+
+    python -m benchmarks.suite --scales small,medium --output results.json
+    git checkout other-branch
+    python -m benchmarks.suite --scales small,medium --compare results.json
+
+For every scale the database is seeded with ``manage.py seed_benchmark`` using
+a fixed seed, then each endpoint is requested through the test client as the
+first generated student: once to warm up, once to count queries, ``--repeat``
+times for the latency and once under ``tracemalloc`` for the peak memory. ``get_events`` is
+measured with an empty feed cache and with a warm one, and ``dashboard`` and
+``subject_detail`` with and without their cached template fragments.
+
+The JSON records the commit, database and settings of the run. ``--compare``
+prints the change of every median latency and query count against an earlier
+result, and exits with status 1 when one is slower than ``--max-slowdown``
+or runs more queries.
+"""
+import argparse
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import setup_django
+
+SCALES = {
+    'small': {'users': 20, 'subjects': 200, 'events': 5000},
+    'medium': {'users': 200, 'subjects': 2000, 'events': 50000},
+    'large': {'users': 1000, 'subjects': 10000, 'events': 250000},
+}
+SEED = 42
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def request(client, endpoint):
+    """Send the endpoint's request and read the whole body, which may be streamed"""
+    method, path, data = endpoint['request']
+    response = getattr(client, method)(path, data)
+    body = b''.join(response.streaming_content) if response.streaming else response.content
+    return response.status_code, len(body)
+
+
+def measure(client, endpoint, repeat):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    prepare = endpoint.get('prepare', lambda: None)
+    # Untimed, so one-off work like building the user's timetable is not counted
+    prepare()
+    request(client, endpoint)
+    prepare()
+    with CaptureQueriesContext(connection) as captured:
+        status, size = request(client, endpoint)
+    # Counted now, as the next request clears the query log
+    queries = len(captured)
+
+    timings = []
+    for _ in range(repeat):
+        prepare()
+        started = time.perf_counter()
+        request(client, endpoint)
+        timings.append(time.perf_counter() - started)
+
+    prepare()
+    tracemalloc.start()
+    request(client, endpoint)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'status': status,
+        'response_bytes': size,
+        'queries': queries,
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+        'p50_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(statistics.quantiles(timings, n=20)[18] * 1000, 3),
+        'peak_memory_kib': round(peak / 1024, 1),
+    }
+
+
+def build_endpoints(prefix):
+    """Return the endpoints to measure, as the first student of the seeded data"""
+    from django.core.cache import cache
+    from django.db.models import Count
+    from django.urls import reverse
+
+    from Planmate.models import Student, Subject
+
+    student = Student.objects.select_related('user').get(user__username=f'{prefix}_user0')
+    user = student.user
+    owned = Subject.objects.filter(created_by=user).annotate(event_count=Count('event')).order_by('-event_count')
+    detail_subject = owned.first() or student.scheduled_subjects.first()
+    other = Subject.objects.exclude(created_by=user).exclude(scheduled_by_students=student).order_by('id').first()
+    now = datetime.now(timezone.utc)
+    window = {'start': now.isoformat(), 'end': (now + timedelta(days=35)).isoformat()}
+
+    endpoints = {
+        'dashboard': {'request': ('get', reverse('dashboard'), {})},
+        'dashboard_uncached': {'request': ('get', reverse('dashboard'), {}), 'prepare': cache.clear},
+        'subject_list': {'request': ('get', reverse('subject_list'), {})},
+        'subject_detail': {'request': ('get', reverse('subject_detail', args=[detail_subject.id]), {})},
+        'subject_detail_uncached': {
+            'request': ('get', reverse('subject_detail', args=[detail_subject.id]), {}), 'prepare': cache.clear,
+        },
+        'get_events': {'request': ('get', reverse('get_events'), window), 'prepare': cache.clear},
+        'get_events_cached': {'request': ('get', reverse('get_events'), window)},
+        'enroll_subject': {
+            'request': ('post', reverse('enroll_subject', args=[other.id]), {}),
+            'prepare': lambda: student.scheduled_subjects.remove(other),
+        },
+    }
+    return user, endpoints
+
+
+def run_scale(name, repeat, prefix):
+    from django.core.cache import cache
+    from django.core.management import call_command
+    from django.test import Client
+
+    data = SCALES[name]
+    started = time.perf_counter()
+    call_command(
+        'seed_benchmark', users=data['users'], subjects=data['subjects'], events=data['events'],
+        seed=SEED, prefix=prefix, stdout=io.StringIO(),
+    )
+    seconds = time.perf_counter() - started
+    print(f'{name}: seeded {data} in {seconds:.1f} s', file=sys.stderr)
+
+    user, endpoints = build_endpoints(prefix)
+    client = Client()
+    client.force_login(user)
+    results = {}
+    for endpoint_name, endpoint in endpoints.items():
+        cache.clear()
+        results[endpoint_name] = result = measure(client, endpoint, repeat)
+        print(
+            f'  {endpoint_name:23} p50 {result["p50_ms"]:9.2f} ms  p95 {result["p95_ms"]:9.2f} ms  '
+            f'{result["queries"]:4} queries  peak {result["peak_memory_kib"]:9.1f} KiB',
+            file=sys.stderr,
+        )
+
+    call_command('flush', interactive=False, verbosity=0)
+    cache.clear()
+    return {'data': {**data, 'seed': SEED, 'seed_seconds': round(seconds, 1)}, 'endpoints': results}
+
+
+def compare(results, baseline, max_slowdown):
+    """Print the change against an earlier run and return whether any endpoint regressed"""
+    regressed = False
+    print(f'Compared with {baseline.get("commit") or "baseline"}:', file=sys.stderr)
+    for scale, scale_results in results['scales'].items():
+        previous_scale = baseline['scales'].get(scale)
+        if previous_scale is None:
+            continue
+        for name, result in scale_results['endpoints'].items():
+            previous = previous_scale['endpoints'].get(name)
+            if previous is None:
+                continue
+            ratio = result['p50_ms'] / previous['p50_ms'] if previous['p50_ms'] else 1.0
+            extra_queries = result['queries'] - previous['queries']
+            flag = ''
+            if ratio > max_slowdown or extra_queries > 0:
+                flag = '  REGRESSION'
+                regressed = True
+            print(
+                f'  {scale:7} {name:23} p50 {previous["p50_ms"]:9.2f} -> {result["p50_ms"]:9.2f} ms '
+                f'({ratio:5.2f}x)  queries {previous["queries"]} -> {result["queries"]}{flag}',
+                file=sys.stderr,
+            )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='small,medium', help=f'Comma-separated, from {", ".join(SCALES)}')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    parser.add_argument('--max-slowdown', type=float, default=1.25,
+                        help='Median latency ratio above which --compare reports a regression')
+    args = parser.parse_args()
+    scales = [scale.strip() for scale in args.scales.split(',') if scale.strip()]
+    unknown = set(scales) - set(SCALES)
+    if unknown:
+        parser.error(f'Unknown scales: {", ".join(sorted(unknown))}')
+    if args.repeat < 2:
+        parser.error('--repeat must be at least 2')
+
+    setup_django()
+    import django
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    database_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        results = {
+            'commit': git_commit(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'repeat': args.repeat,
+            'scales': {scale: run_scale(scale, args.repeat, 'suite') for scale in scales},
+        }
+    finally:
+        connection.creation.destroy_test_db(database_name, verbosity=0)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.max_slowdown):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()